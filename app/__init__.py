@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from config import Config
+from app import perfis_banco, instrumentacao
 import os 
 
 db = SQLAlchemy()
@@ -28,8 +29,30 @@ def create_app(config_class=Config):
     if not os.path.exists(database_dir):
         os.makedirs(database_dir)
 
+    # Perfil do engine do banco (PRAGMAs do SQLite ou pool do servidor), ver app/perfis_banco.py
+    perfis_banco.preparar(app)
+
     # Vincula as extensões à instância da aplicação Flask
     db.init_app(app)
+    perfis_banco.instalar(app, db)
+    # Cache de dados de referência (categorias/fornecedores) do worker
+    from app.services import referencia, usuarios
+    referencia.init_app(app)
+    # Cache de usuários logados e pool de verificação de senhas do worker
+    usuarios.init_app(app)
+    # Estoque por local (cache do id do local padrão)
+    from app.services import locais
+    locais.init_app(app)
+    # Busca textual de produtos (índice FTS5 no SQLite, criado junto com as tabelas)
+    from app.services import busca
+    busca.init_app(app)
+    # Pool de tarefas em segundo plano do worker e os tipos de tarefa de estoque
+    from app import tarefas
+    tarefas.init_app(app)
+    from app.services import tarefas_estoque # Registra os tipos de tarefa
+    # Canal de eventos de estoque (saldos ao vivo na listagem de produtos)
+    from app.services import eventos_estoque
+    eventos_estoque.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
@@ -50,14 +73,32 @@ def create_app(config_class=Config):
     from app.routes.estoque import estoque as estoque_bp
     app.register_blueprint(estoque_bp, url_prefix='/estoque') # Note o url_prefix aqui
 
+    # Registra os comandos de linha de comando (flask catalogo ..., flask estoque ..., flask relatorios ...)
+    from app.commands import catalogo_cli, estoque_cli, relatorios_cli
+    app.cli.add_command(catalogo_cli)
+    app.cli.add_command(estoque_cli)
+    app.cli.add_command(relatorios_cli)
+
     # ... (configuração user_loader e outras coisas) ...
 
     # Adicionar outros blueprints aqui conforme avançamos (estoque, vendas, etc.)
     # from app.routes.estoque import estoque as estoque_bp
     # app.register_blueprint(estoque_bp, url_prefix='/estoque')
 
-    # from app.routes.vendas import vendas as vendas_bp
-    # app.register_blueprint(vendas_bp, url_prefix='/vendas')
+    from app.routes.vendas import vendas as vendas_bp
+    app.register_blueprint(vendas_bp, url_prefix='/vendas')
+
+    from app.routes.relatorios import relatorios as relatorios_bp
+    app.register_blueprint(relatorios_bp, url_prefix='/relatorios')
+
+    from app.routes.tarefas import tarefas as tarefas_bp
+    app.register_blueprint(tarefas_bp)
+
+    # Instrumentação de SQL (opcional): cabeçalhos, painel e /metrics
+    if app.config.get('SQL_INSTRUMENTACAO'):
+        instrumentacao.init_app(app, db)
+        from app.routes.metricas import metricas as metricas_bp
+        app.register_blueprint(metricas_bp)
 
     # Configurar um user_loader para o Flask-Login
     # Precisamos importar o modelo User para isso
@@ -70,8 +111,9 @@ def create_app(config_class=Config):
         Usada para recriar o objeto de usuário a partir do ID armazenado na sessão.
         """
         # Converte user_id para int, pois ele vem como string da sessão
+        # O usuário vem do cache do worker (app.services.usuarios); por requisição só a versão é lida do banco
         if user_id is not None:
-             return User.query.get(int(user_id))
+             return usuarios.carregar_usuario(int(user_id))
         return None # Retorna None se o user_id for inválido/não encontrado
 
 
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cache em memória do processo (um por worker), com despejo LRU e validade (TTL).
+# Usado pelos dados de referência (app/services/referencia.py) e pelos usuários logados
+# (app/services/usuarios.py); a invalidação entre workers é responsabilidade do chamador.
+
+
+class CacheLRU:
+    """
+    Cache chave -> valor limitado a `maximo` entradas (descarta a usada há mais tempo)
+    e com validade de `ttl` segundos por entrada. Seguro para várias threads.
+    """
+
+    def __init__(self, maximo=32, ttl=300):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def obter(self, chave, carregar):
+        """
+        Devolve o valor da chave; se não estiver no cache (ou tiver expirado), chama `carregar()`
+        e guarda o resultado. O carregamento acontece fora da trava.
+        """
+        agora = time.monotonic()
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is not None and item[0] > agora:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[1]
+            self.faltas += 1
+
+        valor = carregar()
+        with self._trava:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+        return valor
+
+    def remover(self, chave):
+        with self._trava:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
@@ -0,0 +1,218 @@
+import contextlib
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.models import Product
+from app.services import arquivo, busca, catalogo, consolidados, locais, previsao, saldos
+
+# Comandos de linha de comando da aplicação (registrados em create_app).
+# Uso: flask <grupo> <comando> --help
+
+
+@contextlib.contextmanager
+def _abrir_texto(caminho, modo, encoding):
+    """Abre um arquivo texto sem tradução de quebras de linha (exigido pelo módulo csv); '-' usa stdin/stdout."""
+    if caminho == '-':
+        yield sys.stdout if 'w' in modo else sys.stdin
+        return
+    with open(caminho, modo, encoding=encoding, newline='') as arquivo:
+        yield arquivo
+
+
+catalogo_cli = AppGroup('catalogo', help='Importação e exportação do catálogo (produtos, categorias, fornecedores).')
+
+
+@catalogo_cli.command('exportar')
+@click.argument('entidade', type=click.Choice(catalogo.ENTIDADES))
+@click.argument('arquivo', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--formato', type=click.Choice(catalogo.FORMATOS), default='csv', show_default=True)
+@click.option('--tamanho-bloco', type=int, default=catalogo.TAMANHO_BLOCO, show_default=True)
+def exportar_catalogo(entidade, arquivo, formato, tamanho_bloco):
+    """Exporta ENTIDADE para ARQUIVO ('-' para a saída padrão)."""
+    with _abrir_texto(arquivo, 'w', 'utf-8') as saida:
+        for pedaco in catalogo.exportar(entidade, formato, tamanho_bloco):
+            saida.write(pedaco)
+
+
+@catalogo_cli.command('importar')
+@click.argument('entidade', type=click.Choice(catalogo.ENTIDADES))
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--formato', type=click.Choice(catalogo.FORMATOS), default='csv', show_default=True)
+@click.option('--tamanho-bloco', type=int, default=catalogo.TAMANHO_BLOCO, show_default=True)
+def importar_catalogo(entidade, arquivo, formato, tamanho_bloco):
+    """Importa ENTIDADE de ARQUIVO ('-' para a entrada padrão), informando o progresso a cada bloco."""
+    def progresso(estatisticas):
+        click.echo(f"{estatisticas['lidos']} linhas lidas, {estatisticas['inseridos']} inseridas, "
+                   f"{estatisticas['atualizados']} atualizadas, {estatisticas['erros']} com erro "
+                   f"({estatisticas['linhas_por_segundo']:.0f} linhas/s)", err=True)
+
+    with _abrir_texto(arquivo, 'r', 'utf-8-sig') as entrada:
+        try:
+            estatisticas = catalogo.importar(entrada, entidade, formato, tamanho_bloco, progresso)
+        except catalogo.ImportacaoError as erro:
+            raise click.ClickException(str(erro))
+
+    for detalhe in estatisticas['detalhes_erros']:
+        click.echo(f"Linha {detalhe['linha']}: {detalhe['erro']}", err=True)
+    click.echo(f"Concluído em {estatisticas['segundos']:.1f}s: {estatisticas['inseridos']} inseridas, "
+               f"{estatisticas['atualizados']} atualizadas, {estatisticas['erros']} com erro.")
+
+
+estoque_cli = AppGroup('estoque', help='Checkpoints de saldo, saldo em uma data, conferência do livro de movimentações, locais de estoque e arquivamento.')
+
+
+def _momento(valor):
+    """Converte o argumento --data (ISO 8601) em datetime, com erro amigável."""
+    try:
+        return saldos.interpretar_momento(valor)
+    except ValueError:
+        raise click.BadParameter(f'Data inválida: {valor!r} (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM).')
+
+
+@estoque_cli.command('checkpoint')
+@click.option('--data', help='Data do checkpoint (padrão: agora). Uma data sem hora vale até o fim do dia.')
+def gerar_checkpoint(data):
+    """Grava o saldo de todos os produtos na data informada (ex.: fechamento do mês)."""
+    momento = _momento(data) if data else None
+    try:
+        gravados = saldos.gerar_checkpoints(momento)
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f'{gravados} checkpoints gravados.')
+
+
+@estoque_cli.command('saldo')
+@click.argument('codigo')
+@click.option('--data', required=True, help='Data da consulta (AAAA-MM-DD ou AAAA-MM-DDTHH:MM).')
+def consultar_saldo(codigo, data):
+    """Mostra o saldo do produto CODIGO na data informada."""
+    product_id = db.session.scalar(db.select(Product.id).where(Product.code == codigo))
+    if product_id is None:
+        raise click.ClickException(f'Produto {codigo!r} não encontrado.')
+    click.echo(saldos.saldo_em(product_id, _momento(data)))
+
+
+@estoque_cli.command('reconciliar')
+def reconciliar_estoque():
+    """Confere o saldo de todos os produtos contra o livro de movimentações (sai com código 1 se houver divergência)."""
+    divergentes = 0
+    for product_id, codigo, atual, livro in saldos.reconciliar():
+        divergentes += 1
+        click.echo(f'{codigo} (id {product_id}): estoque {atual}, livro {livro}, diferença {atual - livro}')
+    sem_checkpoint = sum(1 for _ in saldos.sem_checkpoint())
+    if sem_checkpoint:
+        click.echo(f'{sem_checkpoint} produto(s) sem checkpoint com estoque anterior ao livro (não conferidos; '
+                   'rode "flask estoque checkpoint" para fixar o estoque de abertura).', err=True)
+    if divergentes:
+        raise click.ClickException(f'{divergentes} produto(s) com divergência.')
+    click.echo('Nenhuma divergência encontrada.')
+
+
+@estoque_cli.command('sugestoes-compra')
+@click.option('--data', help='Calcula como se fosse esta data (padrão: agora).')
+@click.option('--dias', type=int, default=previsao.DIAS_HISTORICO, show_default=True, help='Dias de histórico de saídas.')
+@click.option('--prazo', type=int, help='Prazo de entrega em dias (padrão: PREVISAO_PRAZO_ENTREGA_DIAS).')
+@click.option('--cobertura', type=int, help='Dias de venda cobertos por compra (padrão: PREVISAO_COBERTURA_DIAS).')
+@click.option('--z', type=float, help='Fator do nível de serviço (padrão: PREVISAO_NIVEL_SERVICO_Z).')
+def gerar_sugestoes_compra(data, dias, prazo, cobertura, z):
+    """Recalcula a demanda prevista, o ponto de pedido e as sugestões de compra de todos os produtos."""
+    config = current_app.config
+    resumo = previsao.gerar_sugestoes(
+        prazo=prazo if prazo is not None else config['PREVISAO_PRAZO_ENTREGA_DIAS'],
+        cobertura=cobertura if cobertura is not None else config['PREVISAO_COBERTURA_DIAS'],
+        z=z if z is not None else config['PREVISAO_NIVEL_SERVICO_Z'],
+        momento=_momento(data) if data else None,
+        dias=dias,
+    )
+    click.echo(f"{resumo['produtos']} produtos, {resumo['com_demanda']} com demanda, "
+               f"{resumo['sugestoes']} sugestões de compra (leitura {resumo['segundos_leitura']:.2f}s, "
+               f"cálculo {resumo['segundos_calculo']:.2f}s).")
+
+
+@estoque_cli.command('criar-local')
+@click.argument('codigo')
+@click.argument('nome')
+def criar_local(codigo, nome):
+    """Cadastra um local de estoque (loja, depósito) com o CODIGO e o NOME informados."""
+    try:
+        local = locais.criar(codigo, nome)
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f'Local {local.code!r} criado (id {local.id}).')
+
+
+@estoque_cli.command('fragmentar')
+@click.argument('codigo')
+@click.argument('fragmentos', type=int)
+@click.option('--local', help='Código do local (padrão: o local padrão do estoque).')
+def fragmentar_saldo(codigo, fragmentos, local):
+    """Divide o saldo do produto CODIGO no local em FRAGMENTOS linhas (1 junta de novo)."""
+    product_id = db.session.scalar(db.select(Product.id).where(Product.code == codigo))
+    if product_id is None:
+        raise click.ClickException(f'Produto {codigo!r} não encontrado.')
+    location_id = locais.buscar(local) if local else locais.padrao_id()
+    if location_id is None:
+        raise click.ClickException(f'Local {local!r} não encontrado.')
+    try:
+        saldo = locais.fragmentar(product_id, location_id, fragmentos)
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f'Saldo de {saldo} unidades dividido em {fragmentos} fragmento(s).')
+
+
+@estoque_cli.command('consolidar')
+def consolidar_locais():
+    """Corrige o total dos produtos fragmentados que divergiu da soma dos saldos por local."""
+    click.echo(f'{locais.consolidar()} produto(s) atualizados.')
+
+
+@estoque_cli.command('arquivar')
+@click.option('--antes', required=True, help='Arquiva os meses anteriores ao mês desta data (AAAA-MM-DD).')
+def arquivar_movimentacoes(antes):
+    """Move as movimentações antigas para o arquivo comprimido, com resumos mensais por produto."""
+    try:
+        resumo = arquivo.arquivar(_momento(antes), progresso=lambda mes, quantidade: click.echo(
+            f'{mes:%Y-%m}: {quantidade} movimentações arquivadas.', err=True))
+    except arquivo.ArquivoError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f"Corte {resumo['corte']:%Y-%m-%d}: {resumo['movimentacoes']} movimentações de "
+               f"{resumo['meses']} mês(es) em {resumo['blocos']} bloco(s).")
+
+
+@estoque_cli.command('verificar-arquivo')
+def verificar_arquivo():
+    """Confere os blocos, os resumos e os checkpoints do arquivo e o estoque atual (sai com código 1 se houver erro)."""
+    resultado = arquivo.verificar()
+    for erro in resultado['erros']:
+        click.echo(erro, err=True)
+    click.echo(f"{resultado['blocos']} bloco(s), {resultado['movimentacoes']} movimentações arquivadas; "
+               f"{resultado['divergentes']} produto(s) com estoque diferente do livro, "
+               f"{resultado['sem_checkpoint']} sem checkpoint (não conferidos).")
+    if resultado['erros'] or resultado['divergentes']:
+        raise click.ClickException('O arquivo não confere.')
+
+
+@estoque_cli.command('reindexar-busca')
+def reindexar_busca():
+    """Recria o índice de busca de produtos (bancos criados antes do índice, ou depois de SQL que desligou os gatilhos)."""
+    try:
+        indexados = busca.reconstruir()
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f'{indexados} produto(s) indexados.')
+
+
+relatorios_cli = AppGroup('relatorios', help='Manutenção dos consolidados de vendas usados nos relatórios.')
+
+
+@relatorios_cli.command('reconstruir')
+@click.option('--desde', help='Reconstrói a partir do mês desta data (AAAA-MM-DD). Padrão: todo o histórico.')
+def reconstruir_consolidados(desde):
+    """Recalcula os consolidados de vendas a partir das vendas gravadas (carga inicial ou correção)."""
+    inicio = _momento(desde) if desde else None
+    processados = consolidados.reconstruir(inicio, progresso=lambda mes: click.echo(f'{mes:%Y-%m} gravado.', err=True))
+    click.echo(f'{processados} itens de venda processados.')
@@ -0,0 +1,68 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+# GET condicional (ETag/Last-Modified) para as páginas e APIs de leitura do catálogo.
+#
+# Em vez de gerar a resposta para depois calcular o hash do corpo, cada rota informa uma
+# função de versão barata: contadores de CacheVersion (app.services.referencia) e
+# max(Product.last_updated), lido pelo índice ix_product_last_updated_id. Se o If-None-Match
+# do cliente bate com o ETag da versão atual, a resposta é 304 sem consultar as linhas nem
+# renderizar o template.
+#
+# As respostas levam Cache-Control: private, no-cache (o navegador guarda, mas revalida
+# sempre) e Vary: Cookie. O ETag inclui o usuário, porque as páginas mostram quem está logado.
+# O Last-Modified é só informativo: exclusões e renomeações não mudam a data, então a
+# decisão do 304 usa apenas o ETag.
+
+
+def get_condicional(versao, pagina=False):
+    """
+    Decorador de rotas GET. versao() devolve (partes, ultima_alteracao): partes é uma tupla
+    que muda sempre que os dados da resposta mudam; ultima_alteracao (datetime UTC ou None)
+    vira o Last-Modified.
+
+    Alterações mais novas que VALIDADORES_FOLGA segundos não geram ETag: um commit mais
+    lento, com last_updated anterior, ainda pode terminar sem mudar o máximo.
+
+    pagina=True para páginas HTML: mensagens flash pendentes obrigam a renderizar a página,
+    e o ETag também muda com o token CSRF da sessão e a cada metade de WTF_CSRF_TIME_LIMIT,
+    para o navegador não reaproveitar um token vencido.
+    """
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            partes, ultima = versao()
+            folga = timedelta(seconds=current_app.config['VALIDADORES_FOLGA'])
+            if (pagina and session.get('_flashes')) or (ultima is not None and ultima > datetime.utcnow() - folga):
+                return _sem_cache(make_response(view(*args, **kwargs)))
+
+            partes = (current_user.get_id(),) + tuple(partes)
+            if pagina:
+                limite = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+                partes += (session.get('csrf_token'), int(time.time() // (limite / 2)) if limite else 0)
+            etag = hashlib.sha1(repr(partes).encode()).hexdigest()[:20]
+
+            if not is_resource_modified(request.environ, etag=etag):
+                resposta = current_app.response_class(status=304)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag, weak=True)
+            if ultima is not None:
+                resposta.last_modified = ultima
+            return _sem_cache(resposta)
+        return envolvida
+    return decorador
+
+
+def _sem_cache(resposta):
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    resposta.vary.add('Cookie')
+    return resposta
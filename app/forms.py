@@ -1,11 +1,12 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, DecimalField, IntegerField, TextAreaField, HiddenField # Importar HiddenField
-from wtforms.validators import DataRequired, Length, NumberRange, Optional, ValidationError
-
-from wtforms.ext.sqlalchemy.fields import QuerySelectField
+from wtforms import Field, StringField, PasswordField, BooleanField, SubmitField, SelectField, DecimalField, IntegerField, TextAreaField, HiddenField # Importar HiddenField
+from wtforms.validators import DataRequired, InputRequired, Length, NumberRange, Optional, ValidationError
+from wtforms.widgets import HiddenInput
 
 # Importamos os modelos Product e StockMovement (se necessário para validação futura)
 from app.models import Category, Supplier, Product, StockMovement, db
+# Categorias e fornecedores vêm do cache de dados de referência (sem consulta por formulário)
+from app.services import locais, referencia
 
 # --- Formulários existentes (LoginForm, ProductForm, CategoryForm, SupplierForm) ---
 # ... mantenha os códigos existentes desses formulários ...
@@ -17,15 +18,49 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Entrar')
 
 def get_categories():
-     return db.session.query(Category).order_by(Category.name).all()
+     return referencia.categorias()
 
 def get_suppliers():
-     return db.session.query(Supplier).order_by(Supplier.name).all()
+     return referencia.fornecedores()
+
+
+def _id_opcional(valor):
+    """Converte o valor de um <select> de ids; a opção em branco vira None."""
+    if valor in (None, '', 'None'):
+        return None
+    return int(valor)
+
+
+class ProductLookupField(Field):
+    """
+    Campo de seleção de produto "preguiçoso".
+    Em vez de carregar o catálogo inteiro para montar um <select> (como o QuerySelectField),
+    o formulário envia apenas o id do produto escolhido na busca (ver rota estoque.buscar_produtos)
+    e o produto é carregado com uma única consulta pela chave primária.
+    """
+    widget = HiddenInput()
 
-# Nova função de query para buscar produtos
-def get_products():
-    """Retorna todos os produtos ordenados por nome."""
-    return db.session.query(Product).order_by(Product.name).all()
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self._id_enviado = None
+
+    def _value(self):
+        # Valor do input oculto: o id do produto atual (se houver)
+        return str(self.data.id) if self.data is not None else ''
+
+    def process_formdata(self, valuelist):
+        self.data = None
+        if valuelist and valuelist[0]:
+            try:
+                self._id_enviado = int(valuelist[0])
+            except ValueError:
+                self._id_enviado = -1 # Id inválido: nenhum produto será encontrado
+            else:
+                self.data = db.session.get(Product, self._id_enviado)
+
+    def pre_validate(self, form):
+        if self._id_enviado is not None and self.data is None:
+            raise ValidationError('Produto não encontrado.')
 
 
 class ProductForm(FlaskForm):
@@ -35,17 +70,23 @@ class ProductForm(FlaskForm):
     price = DecimalField('Preço', validators=[DataRequired(), NumberRange(min=0, message='O preço deve ser um número positivo.')], places=2)
     quantity_in_stock = IntegerField('Quantidade em Estoque', validators=[DataRequired(), NumberRange(min=0, message='A quantidade deve ser um número positivo ou zero.')])
     minimum_stock = IntegerField('Estoque Mínimo', validators=[Optional(), NumberRange(min=0, message='O estoque mínimo deve ser um número positivo ou zero.')])
-    category = QuerySelectField('Categoria', query_factory=get_categories, get_label='name', allow_blank=True, blank_text='-- Selecione uma Categoria --')
-    supplier = QuerySelectField('Fornecedor', query_factory=get_suppliers, get_label='name', allow_blank=True, blank_text='-- Selecione um Fornecedor --')
+    # Os campos guardam os ids (category_id/supplier_id), então funcionam com obj= e populate_obj
+    category_id = SelectField('Categoria', coerce=_id_opcional, validators=[Optional()])
+    supplier_id = SelectField('Fornecedor', coerce=_id_opcional, validators=[Optional()])
     submit = SubmitField('Salvar Produto')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opções montadas a partir do cache (listas já ordenadas por nome)
+        self.category_id.choices = [('', '-- Selecione uma Categoria --')] + [(c.id, c.name) for c in get_categories()]
+        self.supplier_id.choices = [('', '-- Selecione um Fornecedor --')] + [(f.id, f.name) for f in get_suppliers()]
+
 class CategoryForm(FlaskForm):
      # ... código do CategoryForm ...
      name = StringField('Nome da Categoria', validators=[DataRequired(), Length(max=64)])
      submit = SubmitField('Salvar Categoria')
      def validate_name(self, name):
-        category = Category.query.filter_by(name=name.data).first()
-        if category is not None:
+        if referencia.categoria_existe(name.data):
              raise ValidationError('Já existe uma categoria com este nome. Por favor, escolha um nome diferente.')
 
 class SupplierForm(FlaskForm):
@@ -54,8 +95,7 @@ class SupplierForm(FlaskForm):
      contact_info = TextAreaField('Informações de Contato', validators=[Optional(), Length(max=128)])
      submit = SubmitField('Salvar Fornecedor')
      def validate_name(self, name):
-        supplier = Supplier.query.filter_by(name=name.data).first()
-        if supplier is not None:
+        if referencia.fornecedor_existe(name.data):
              raise ValidationError('Já existe um fornecedor com este nome. Por favor, escolha um nome diferente.')
 
 
@@ -66,7 +106,8 @@ class StockMovementForm(FlaskForm):
     Formulário para registrar uma movimentação de estoque (entrada ou saída).
     """
     # Campo para selecionar o produto a ser movimentado
-    product = QuerySelectField('Produto', query_factory=get_products, get_label='name', validators=[DataRequired()], blank_text='-- Selecione um Produto --')
+    # O produto é escolhido por busca (código/nome) no template; aqui só chega o id
+    product = ProductLookupField('Produto', validators=[InputRequired(message='Selecione um produto.')])
 
     # Campo para a quantidade movimentada
     quantity = IntegerField('Quantidade', validators=[DataRequired(), NumberRange(min=1, message='A quantidade deve ser um número positivo.')])
@@ -79,8 +120,15 @@ class StockMovementForm(FlaskForm):
     # O valor será definido na rota que renderiza o formulário ou na rota que processa
     movement_type = HiddenField(validators=[DataRequired()]) # Campo oculto, mas obrigatório
 
+    # Local da movimentação; em branco usa o local padrão do estoque
+    location_id = SelectField('Local', coerce=_id_opcional, validators=[Optional()])
+
     submit = SubmitField('Registrar Movimentação')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.location_id.choices = [('', '-- Local padrão --')] + [(l.id, l.name) for l in referencia.locais()]
+
     # Validador customizado para o motivo (tornar obrigatório se for saída)
     def validate_reason(self, reason):
         # A validação só faz sentido se o tipo de movimento for 'saida'
@@ -88,11 +136,15 @@ class StockMovementForm(FlaskForm):
              raise ValidationError('O motivo é obrigatório para saídas de estoque.')
 
     # Validador customizado para a quantidade na saída (não pode ser maior que o estoque atual)
+    # É só um aviso antecipado para o usuário: a garantia contra saídas concorrentes
+    # é o UPDATE condicional de app.services.movimentacao.aplicar_movimentacao
     def validate_quantity(self, quantity):
         # A validação só faz sentido se o tipo de movimento for 'saida' e a quantidade for fornecida
         if self.movement_type.data == 'saida' and quantity.data is not None:
             # Precisamos acessar o produto selecionado para verificar o estoque atual
             # O objeto Product selecionado está em self.product.data
             produto_selecionado = self.product.data
-            if produto_selecionado and quantity.data > produto_selecionado.quantity_in_stock:
-                 raise ValidationError(f'Quantidade insuficiente em estoque. Disponível: {produto_selecionado.quantity_in_stock}.')
\ No newline at end of file
+            # Total pela soma dos locais: o Product dos produtos fragmentados só é refeito pelo consolidar
+            disponivel = locais.saldo_total(produto_selecionado.id) if produto_selecionado else None
+            if disponivel is not None and quantity.data > disponivel:
+                 raise ValidationError(f'Quantidade insuficiente em estoque. Disponível: {disponivel}.')
\ No newline at end of file
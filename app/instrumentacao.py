@@ -0,0 +1,138 @@
+import heapq
+import threading
+import time
+
+from flask import g, has_request_context, request
+from markupsafe import escape
+from sqlalchemy import event
+
+# Instrumentação de SQL por requisição (opcional: SQL_INSTRUMENTACAO = True).
+#
+# Eventos do engine (before/after_cursor_execute) medem cada comando executado durante uma
+# requisição; os hooks do Flask fecham a conta no fim dela:
+#   - cabeçalhos X-SQL-Queries e Server-Timing em todas as respostas;
+#   - painel de depuração no fim das páginas HTML (SQL_INSTRUMENTACAO_PAINEL);
+#   - estatísticas acumuladas por endpoint, lidas por /metrics (ver app/routes/metricas.py).
+# O mesmo comando (mesmo texto SQL, parâmetros diferentes) repetido SQL_LIMITE_REPETICOES vezes
+# ou mais numa requisição é sinalizado como provável N+1 e registrado no log.
+
+
+class EstatisticasSQL:
+    """Estatísticas acumuladas por endpoint. Compartilhada entre as threads do worker."""
+
+    def __init__(self, maximo_lentas):
+        self.maximo_lentas = maximo_lentas
+        self._trava = threading.Lock()
+        self._endpoints = {}
+
+    def registrar(self, endpoint, consultas, repetidas):
+        """Soma uma requisição: `consultas` é a lista de (sql, segundos) e `repetidas` a de comandos N+1."""
+        with self._trava:
+            dados = self._endpoints.setdefault(endpoint, {
+                'requisicoes': 0, 'consultas': 0, 'segundos': 0.0, 'maximo_consultas': 0,
+                'requisicoes_n_mais_1': 0, 'n_mais_1': {}, 'lentas': [],
+            })
+            dados['requisicoes'] += 1
+            dados['consultas'] += len(consultas)
+            dados['segundos'] += sum(segundos for _, segundos in consultas)
+            dados['maximo_consultas'] = max(dados['maximo_consultas'], len(consultas))
+            if repetidas:
+                dados['requisicoes_n_mais_1'] += 1
+                for sql, vezes in repetidas:
+                    dados['n_mais_1'][sql] = max(dados['n_mais_1'].get(sql, 0), vezes)
+            # Heap de mínimo com as consultas mais lentas já vistas no endpoint
+            for sql, segundos in consultas:
+                if len(dados['lentas']) < self.maximo_lentas:
+                    heapq.heappush(dados['lentas'], (segundos, sql))
+                elif segundos > dados['lentas'][0][0]:
+                    heapq.heapreplace(dados['lentas'], (segundos, sql))
+
+    def instantaneo(self):
+        """Cópia das estatísticas (lentas em ordem decrescente de tempo), segura para serializar."""
+        with self._trava:
+            return {
+                endpoint: dict(dados, n_mais_1=dict(dados['n_mais_1']),
+                               lentas=sorted(dados['lentas'], reverse=True))
+                for endpoint, dados in self._endpoints.items()
+            }
+
+    def limpar(self):
+        with self._trava:
+            self._endpoints.clear()
+
+
+def comandos_repetidos(consultas, limite):
+    """Comandos SQL executados `limite` vezes ou mais: lista de (sql, vezes), do mais repetido ao menos."""
+    contagem = {}
+    for sql, _ in consultas:
+        contagem[sql] = contagem.get(sql, 0) + 1
+    return sorted(((sql, vezes) for sql, vezes in contagem.items() if vezes >= limite),
+                  key=lambda item: item[1], reverse=True)
+
+
+def _painel(consultas, repetidas, maximo_lentas):
+    """HTML do painel de depuração com as consultas da requisição."""
+    total = sum(segundos for _, segundos in consultas) * 1000
+    linhas = [
+        '<div id="painel-sql" style="position:fixed;bottom:0;right:0;max-width:60%;max-height:40%;overflow:auto;'
+        'z-index:9999;background:#fff;border:1px solid #999;padding:8px;font:12px monospace;">',
+        f'<strong>SQL: {len(consultas)} consulta(s), {total:.1f} ms</strong>',
+    ]
+    for sql, vezes in repetidas:
+        linhas.append(f'<div style="color:#b00;">Possível N+1 ({vezes}x): {escape(sql)}</div>')
+    for sql, segundos in sorted(consultas, key=lambda item: item[1], reverse=True)[:maximo_lentas]:
+        linhas.append(f'<div>{segundos * 1000:.2f} ms: {escape(sql)}</div>')
+    linhas.append('</div>')
+    return ''.join(linhas)
+
+
+def init_app(app, db):
+    """Liga a instrumentação no engine e nos hooks da aplicação (só se SQL_INSTRUMENTACAO estiver ativa)."""
+    if not app.config.get('SQL_INSTRUMENTACAO'):
+        return
+    limite = app.config['SQL_LIMITE_REPETICOES']
+    maximo_lentas = app.config['SQL_CONSULTAS_LENTAS']
+    estatisticas = EstatisticasSQL(maximo_lentas)
+    app.extensions['instrumentacao_sql'] = estatisticas
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def iniciar_cronometro(conexao, cursor, sql, parametros, contexto, executemany):
+        if contexto is not None:
+            contexto._inicio_instrumentacao = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def registrar_consulta(conexao, cursor, sql, parametros, contexto, executemany):
+        inicio = getattr(contexto, '_inicio_instrumentacao', None)
+        if inicio is None or not has_request_context() or 'consultas_sql' not in g:
+            return # Fora de requisição (CLI, threads de fundo)
+        g.consultas_sql.append((' '.join(sql.split()), time.perf_counter() - inicio))
+
+    @app.before_request
+    def iniciar_requisicao():
+        g.consultas_sql = []
+
+    @app.after_request
+    def fechar_requisicao(resposta):
+        consultas = g.pop('consultas_sql', None)
+        if consultas is None:
+            return resposta
+        repetidas = comandos_repetidos(consultas, limite)
+        endpoint = request.endpoint or 'sem_endpoint'
+        estatisticas.registrar(endpoint, consultas, repetidas)
+        for sql, vezes in repetidas:
+            app.logger.warning('Possível N+1 em %s: comando executado %d vezes: %s', endpoint, vezes, sql)
+
+        total = sum(segundos for _, segundos in consultas) * 1000
+        resposta.headers['X-SQL-Queries'] = str(len(consultas))
+        resposta.headers.add('Server-Timing', f'sql;dur={total:.2f};desc="{len(consultas)} consultas"')
+
+        if (app.config.get('SQL_INSTRUMENTACAO_PAINEL') and resposta.mimetype == 'text/html'
+                and not resposta.direct_passthrough and not resposta.is_streamed):
+            html = resposta.get_data(as_text=True)
+            painel = _painel(consultas, repetidas, maximo_lentas)
+            posicao = html.lower().rfind('</body>')
+            resposta.set_data(html[:posicao] + painel + html[posicao:] if posicao >= 0 else html + painel)
+        return resposta
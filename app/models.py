@@ -1,5 +1,6 @@
 from app import db 
 from datetime import datetime
+from sqlalchemy import func, literal_column
 from werkzeug.security import generate_password_hash, check_password_hash 
 from flask_login import UserMixin
 from decimal import Decimal 
@@ -70,21 +71,34 @@ class Supplier(db.Model):
         """Representação do objeto Supplier."""
         return f'<Supplier {self.name}>'
 
+# last_updated dos produtos sem data, na ordenação da listagem (formato do DateTime no SQLite)
+ATUALIZACAO_NULA = '1970-01-01 00:00:00.000000'
+
+
 class Product(db.Model):
     """
     Modelo para representar um produto no estoque.
     """
+    # Índices compostos (coluna, id) usados pela paginação por cursor da listagem
+    # de produtos (ordenação estável e busca da próxima página sem OFFSET).
+    # Estoque e última atualização aceitam NULL: a listagem ordena pelas expressões de
+    # ordenacao() e usa os índices de expressão definidos depois da classe
+    __table_args__ = (
+        db.Index('ix_product_name_id', 'name', 'id'),
+        db.Index('ix_product_last_updated_id', 'last_updated', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(64), unique=True, nullable=False) 
     name = db.Column(db.String(128), nullable=False)             
     price = db.Column(db.Numeric(10, 2), nullable=False)         
-    quantity_in_stock = db.Column(db.Integer, default=0)       
+    quantity_in_stock = db.Column(db.Integer, default=0) # Total de todos os locais (ver LocationStock)
     minimum_stock = db.Column(db.Integer, default=5)           
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Também usado pelos eventos de estoque entre workers
 
     # Chaves estrangeiras para os relacionamentos (RF01)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
-    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), index=True)
 
     # Relacionamento inverso: Obter os itens de venda associados a este produto
     sales_items = db.relationship('SaleItem', backref='product', lazy='dynamic')
@@ -93,10 +107,47 @@ class Product(db.Model):
     stock_movements = db.relationship('StockMovement', backref='product', lazy='dynamic')
 
 
+    @classmethod
+    def abaixo_do_minimo(cls):
+        """
+        Condição SQL de estoque baixo (a mesma do índice parcial ix_product_estoque_baixo).
+        NULL conta como 0 nas duas colunas, como no alerta exibido na listagem e nos eventos.
+        """
+        zero = literal_column('0')
+        return func.coalesce(cls.quantity_in_stock, zero) <= func.coalesce(cls.minimum_stock, zero)
+
+    @classmethod
+    def ordenacao(cls, coluna):
+        """
+        Expressão de ordenação da coluna na listagem: quantity_in_stock com NULL como 0 e
+        last_updated com NULL como ATUALIZACAO_NULA, para a comparação do cursor nunca cair em NULL.
+        Os valores são literais (não parâmetros) para o banco reconhecer os índices de expressão.
+        """
+        if coluna is cls.quantity_in_stock:
+            return func.coalesce(cls.quantity_in_stock, literal_column('0'))
+        if coluna is cls.last_updated:
+            return func.coalesce(cls.last_updated, literal_column(f"'{ATUALIZACAO_NULA}'"))
+        return coluna
+
     def __repr__(self):
         """Representação do objeto Product."""
         return f'<Product {self.code} - {self.name}>'
 
+
+# Índice parcial com apenas os produtos em alerta (estoque <= estoque mínimo).
+# O banco o mantém sozinho em qualquer escrita (movimentações, edições, importações em massa),
+# então o alerta do dashboard lê só as entradas do índice, sem varrer a tabela product.
+# As consultas precisam usar exatamente a mesma condição (ver Product.abaixo_do_minimo).
+db.Index(
+    'ix_product_estoque_baixo', Product.name, Product.id,
+    sqlite_where=Product.abaixo_do_minimo(),
+    postgresql_where=Product.abaixo_do_minimo(),
+)
+
+# Índices (expressão, id) da paginação por estoque e por última atualização (ver Product.ordenacao)
+db.Index('ix_product_quantity_ordem', Product.ordenacao(Product.quantity_in_stock), Product.id)
+db.Index('ix_product_last_updated_ordem', Product.ordenacao(Product.last_updated), Product.id)
+
 # --- Modelos adicionais (para serem implementados depois) ---
 
 class Sale(db.Model):
@@ -104,7 +155,7 @@ class Sale(db.Model):
     Modelo para representar uma venda.
     """
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False) # Data da venda (RF07, RF15)
+    date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True) # Data da venda (RF07, RF15)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)         # Valor total da venda (RF07)
     amount_paid = db.Column(db.Numeric(10, 2))                          # Valor pago pelo cliente (RF08)
     change = db.Column(db.Numeric(10, 2))                               # Troco calculado (RF08)
@@ -137,10 +188,46 @@ class SaleItem(db.Model):
         return f'<SaleItem {self.id} - Product: {self.product_id} Qty: {self.quantity}>'
 
 
+class SalesRollup(db.Model):
+    """
+    Consolidado de vendas por período (dia ou mês) e dimensão (categoria, fornecedor ou vendedor).
+    Atualizado a cada venda finalizada, para que os relatórios não precisem agrupar Sale/SaleItem.
+    As linhas com product_id = 0 guardam o total da dimensão; as demais, o total de cada produto
+    dentro dela (usadas no ranking de produtos mais vendidos).
+    """
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'dimension', 'dimension_id', 'product_id',
+                            name='uq_sales_rollup_chave'),
+        db.Index('ix_sales_rollup_consulta', 'period', 'dimension', 'period_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(3), nullable=False)           # 'dia' ou 'mes'
+    period_start = db.Column(db.Date, nullable=False)          # Primeiro dia do período
+    dimension = db.Column(db.String(16), nullable=False)       # 'categoria', 'fornecedor' ou 'vendedor'
+    dimension_id = db.Column(db.Integer, nullable=False)       # Id da categoria/fornecedor/usuário (0 = não informado)
+    product_id = db.Column(db.Integer, nullable=False, default=0) # 0 = total da dimensão
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0) # Receita (soma dos subtotais)
+    units = db.Column(db.Integer, nullable=False, default=0)   # Unidades vendidas
+
+    def __repr__(self):
+        """Representação do objeto SalesRollup."""
+        return f'<SalesRollup {self.period} {self.period_start} {self.dimension}={self.dimension_id} Product: {self.product_id}>'
+
+
 class StockMovement(db.Model):
     """
     Modelo para registrar movimentações de estoque (entrada/saída).
     """
+    # (product_id, date): soma das movimentações de um produto num intervalo de datas
+    # (saldo em uma data a partir do checkpoint mais próximo, reconciliação, histórico de um produto)
+    # (date, id): histórico de movimentações paginado por cursor e exportação de um intervalo
+    # de datas (ver app/services/historico.py)
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_date', 'product_id', 'date'),
+        db.Index('ix_stock_movement_date_id', 'date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False) # Data da movimentação (RF04, RF05, RF15)
     movement_type = db.Column(db.String(10), nullable=False)             # 'entrada' ou 'saida' (RF04, RF05)
@@ -149,12 +236,200 @@ class StockMovement(db.Model):
 
     # Chave estrangeira para o produto movimentado
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False) # RF04, RF05
+    # Local da movimentação (None: movimentações anteriores aos locais, feitas no local padrão)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'))
+    # Metade de uma transferência entre locais: muda o saldo do local, mas não é demanda nem compra
+    is_transfer = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    @classmethod
+    def quantidade_com_sinal(cls):
+        """Expressão SQL da quantidade com sinal: positiva para entradas, negativa para saídas."""
+        return db.case((cls.movement_type == 'entrada', cls.quantity), else_=-cls.quantity)
 
     def __repr__(self):
         """Representação do objeto StockMovement."""
         return f'<StockMovement {self.id} - Type: {self.movement_type} Product: {self.product_id} Qty: {self.quantity}>'
 
 
+class Location(db.Model):
+    """
+    Local de estoque (loja, depósito...). O local padrão (ESTOQUE_LOCAL_PADRAO) é criado
+    na primeira movimentação e recebe as movimentações que não informam o local.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(32), unique=True, nullable=False)
+    name = db.Column(db.String(64), nullable=False)
+
+    def __repr__(self):
+        """Representação do objeto Location."""
+        return f'<Location {self.code}>'
+
+
+class LocationStock(db.Model):
+    """
+    Saldo de um produto num local (ver app.services.locais).
+    Produtos muito movimentados podem ter o saldo do local dividido em várias linhas (shard 0..n-1):
+    cada baixa trava só uma delas, e o saldo do local é a soma das linhas.
+    Product.quantity_in_stock continua sendo o total de todos os locais, exceto nos produtos
+    fragmentados, cujo total é a soma das linhas até o próximo consolidar.
+    """
+    __table_args__ = (
+        db.Index('ix_location_stock_location_product', 'location_id', 'product_id'),
+    )
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """Representação do objeto LocationStock."""
+        return f'<LocationStock Product: {self.product_id} Location: {self.location_id} Shard: {self.shard} Qty: {self.quantity}>'
+
+
+class StockCheckpoint(db.Model):
+    """
+    Fotografia periódica do saldo de um produto (ex.: fechamento de mês).
+    O saldo em qualquer data é obtido a partir do checkpoint mais próximo, somando
+    só as movimentações entre ele e a data pedida, em vez de refazer o histórico inteiro.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'date', name='uq_stock_checkpoint_product_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.DateTime, nullable=False, index=True)   # Saldo considerando as movimentações até esta data (inclusive)
+    quantity = db.Column(db.Integer, nullable=False)            # Saldo do produto nessa data
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+
+    def __repr__(self):
+        """Representação do objeto StockCheckpoint."""
+        return f'<StockCheckpoint Product: {self.product_id} {self.date:%Y-%m-%d %H:%M} Qty: {self.quantity}>'
+
+
+class StockArchiveRun(db.Model):
+    """
+    Arquivamento de movimentações (ver app.services.arquivo): tudo o que é anterior a `cutoff`
+    saiu de stock_movement. O checkpoint de cada produto em cutoff - 1 µs é a âncora dos saldos.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    cutoff = db.Column(db.DateTime, unique=True, nullable=False)   # Primeiro dia do mês, 00:00
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    movements = db.Column(db.Integer, nullable=False, default=0)   # Movimentações arquivadas
+    blocks = db.Column(db.Integer, nullable=False, default=0)      # Blocos gravados
+
+    def __repr__(self):
+        """Representação do objeto StockArchiveRun."""
+        return f'<StockArchiveRun {self.cutoff:%Y-%m-%d} Movements: {self.movements}>'
+
+
+class StockMovementSummary(db.Model):
+    """Totais mensais das movimentações arquivadas de um produto."""
+    __table_args__ = (
+        db.Index('ix_stock_movement_summary_month', 'month'),
+    )
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)                    # Primeiro dia do mês
+    units_in = db.Column(db.Integer, nullable=False, default=0)     # Unidades de entrada
+    units_out = db.Column(db.Integer, nullable=False, default=0)    # Unidades de saída
+    movements = db.Column(db.Integer, nullable=False, default=0)    # Quantidade de movimentações
+
+    def __repr__(self):
+        """Representação do objeto StockMovementSummary."""
+        return f'<StockMovementSummary Product: {self.product_id} {self.month:%Y-%m} In: {self.units_in} Out: {self.units_out}>'
+
+
+class StockMovementArchive(db.Model):
+    """
+    Bloco de movimentações arquivadas de um mês: as linhas originais em ordem de (date, id),
+    em JSON comprimido com zlib. Só recebe inclusões; `checksum` é o SHA-256 do JSON.
+    """
+    __table_args__ = (
+        db.Index('ix_stock_movement_archive_month', 'month'),
+        db.Index('ix_stock_movement_archive_first_date', 'first_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False)           # Primeiro dia do mês das linhas
+    first_date = db.Column(db.DateTime, nullable=False)  # Data da primeira linha
+    last_date = db.Column(db.DateTime, nullable=False)   # Data da última linha
+    rows = db.Column(db.Integer, nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        """Representação do objeto StockMovementArchive."""
+        return f'<StockMovementArchive {self.id} {self.month:%Y-%m} Rows: {self.rows}>'
+
+
+class ReorderSuggestion(db.Model):
+    """
+    Sugestão de compra calculada a partir do histórico de saídas (ver app.services.previsao).
+    Recalculada periodicamente; guarda um registro por produto com demanda ou abaixo do ponto de pedido.
+    """
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    computed_at = db.Column(db.DateTime, nullable=False)           # Quando a sugestão foi calculada
+    avg_daily_demand = db.Column(db.Float, nullable=False)         # Demanda diária prevista (média móvel)
+    demand_std = db.Column(db.Float, nullable=False)               # Desvio padrão da demanda diária
+    reorder_point = db.Column(db.Integer, nullable=False)          # Ponto de pedido (demanda no prazo de entrega + estoque de segurança)
+    suggested_quantity = db.Column(db.Integer, nullable=False, index=True) # Quantidade sugerida para compra (0 = não comprar)
+
+    product = db.relationship('Product')
+
+    def __repr__(self):
+        """Representação do objeto ReorderSuggestion."""
+        return f'<ReorderSuggestion Product: {self.product_id} ROP: {self.reorder_point} Qty: {self.suggested_quantity}>'
+
+
+class CacheVersion(db.Model):
+    """
+    Contador de versão de um conjunto de dados em cache (ex.: 'categorias', 'fornecedores').
+    Incrementado logo depois do commit que altera os dados; cada worker compara a versão
+    com a do seu cache para saber se precisa recarregar (ver app.services.referencia).
+    """
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """Representação do objeto CacheVersion."""
+        return f'<CacheVersion {self.name}={self.version}>'
+
+
+class BackgroundJob(db.Model):
+    """
+    Tarefa demorada executada em segundo plano (importação, exportação, reconciliação...).
+    A requisição web grava a tarefa e responde na hora com o id; o andamento, o resultado
+    e o erro ficam aqui para consulta (ver app/tarefas.py).
+    """
+    __table_args__ = (
+        db.Index('ix_background_job_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)                  # Tipo da tarefa (ex.: 'importar_catalogo')
+    status = db.Column(db.String(12), nullable=False, default='pendente', index=True) # pendente, executando, concluida, erro ou cancelada
+    params = db.Column(db.Text)                                      # Parâmetros da tarefa (JSON)
+    progress = db.Column(db.Integer, nullable=False, default=0)      # Unidades processadas (linhas, meses...)
+    progress_total = db.Column(db.Integer)                           # Total de unidades, quando conhecido
+    message = db.Column(db.String(255))                              # Última mensagem de andamento
+    result = db.Column(db.Text)                                      # Resumo do resultado (JSON)
+    result_path = db.Column(db.String(255))                          # Arquivo gerado pela tarefa, se houver
+    error = db.Column(db.Text)                                       # Mensagem de erro, se a tarefa falhou
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)                              # Último registro de andamento
+    finished_at = db.Column(db.DateTime)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))       # Quem pediu a tarefa
+
+    def __repr__(self):
+        """Representação do objeto BackgroundJob."""
+        return f'<BackgroundJob {self.id} {self.kind} {self.status}>'
+
+
 # --- Configuração para criação do banco de dados ---
 # Esta parte não é código de modelo, mas é útil para lembrar como criar as tabelas
 # Você precisará executar isso no terminal ou em um script separado.
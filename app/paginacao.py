@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import tuple_
+
+# Utilitários de paginação por cursor (keyset pagination).
+# Em vez de OFFSET (que obriga o banco a percorrer e descartar todas as linhas
+# anteriores), a próxima página é buscada a partir dos valores da última linha
+# da página atual: WHERE (coluna, id) > (:valor, :id) ORDER BY coluna, id.
+# Com um índice em (coluna, id), o custo de cada página fica constante,
+# não importa quantas linhas existam antes dela.
+
+
+def codificar_cursor(valor, id_):
+    """Gera um cursor opaco (string segura para URL) a partir da última linha da página."""
+    if isinstance(valor, datetime):
+        valor = {'dt': valor.isoformat()}
+    elif isinstance(valor, Decimal):
+        valor = {'dec': str(valor)}
+    bruto = json.dumps([valor, id_], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Converte um cursor gerado por codificar_cursor de volta para (valor, id).
+    Levanta ValueError se o cursor for inválido.
+    """
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        valor, id_ = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError('Cursor de paginação inválido.') from exc
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            valor = datetime.fromisoformat(valor['dt'])
+        elif 'dec' in valor:
+            valor = Decimal(valor['dec'])
+    if not isinstance(id_, int):
+        raise ValueError('Cursor de paginação inválido.')
+    return valor, id_
+
+
+def aplicar_keyset(query, coluna, coluna_id, cursor=None, descendente=False):
+    """
+    Aplica ordenação estável (coluna, id) e, se houver cursor, a condição
+    que posiciona a consulta logo após a última linha já entregue.
+    A coluna não pode ser NULL (use uma expressão com coalesce, como Product.ordenacao).
+    Funciona tanto com Query legada quanto com select() do SQLAlchemy 2.
+    """
+    if cursor is not None:
+        valor, id_ = decodificar_cursor(cursor)
+        # A condição só na coluna é redundante, mas é a que o SQLite usa para posicionar um índice
+        # de expressão (ver Product.ordenacao); com a comparação de tuplas sozinha ele percorre o índice
+        if descendente:
+            query = query.where(coluna <= valor, tuple_(coluna, coluna_id) < tuple_(valor, id_))
+        else:
+            query = query.where(coluna >= valor, tuple_(coluna, coluna_id) > tuple_(valor, id_))
+
+    if descendente:
+        return query.order_by(coluna.desc(), coluna_id.desc())
+    return query.order_by(coluna.asc(), coluna_id.asc())
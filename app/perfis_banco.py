@@ -0,0 +1,98 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Perfis de configuração do engine do banco de dados (aplicados em create_app).
+#
+#   basico      opções padrão do SQLAlchemy (comportamento original, útil para comparar);
+#   sqlite-wal  SQLite em modo WAL: leitores não bloqueiam o escritor e vice-versa, então
+#               os "database is locked" das movimentações concorrentes praticamente somem.
+#               Os PRAGMAs são aplicados em cada conexão nova (evento 'connect');
+#   servidor    PostgreSQL/MySQL: pool com tamanho, overflow, timeout, reciclagem e
+#               pre-ping explícitos (conexões derrubadas pelo servidor são descartadas antes do uso);
+#   auto        sqlite-wal para URIs sqlite://, servidor para as demais (padrão).
+#
+# Os valores vêm da configuração (SQLITE_* e DB_POOL_*). Opções passadas explicitamente em
+# SQLALCHEMY_ENGINE_OPTIONS têm precedência sobre as do perfil.
+
+PERFIS = ('auto', 'basico', 'sqlite-wal', 'servidor')
+
+
+def resolver_perfil(config):
+    """
+    Devolve o perfil efetivo para a configuração (resolve 'auto' pelo dialeto da URI).
+    Levanta ValueError se o perfil não existir ou não servir para o banco configurado.
+    """
+    perfil = config.get('DATABASE_PROFILE') or 'auto'
+    if perfil not in PERFIS:
+        raise ValueError(f'Perfil de banco desconhecido: {perfil!r} (use um de {", ".join(PERFIS)}).')
+    sqlite = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite'
+    if perfil == 'auto':
+        return 'sqlite-wal' if sqlite else 'servidor'
+    if perfil == 'sqlite-wal' and not sqlite:
+        raise ValueError('O perfil sqlite-wal só pode ser usado com SQLite.')
+    if perfil == 'servidor' and sqlite:
+        raise ValueError('O perfil servidor é para PostgreSQL/MySQL; para SQLite use sqlite-wal.')
+    return perfil
+
+
+def opcoes_engine(config, perfil):
+    """Opções de create_engine do perfil, combinadas com SQLALCHEMY_ENGINE_OPTIONS."""
+    opcoes = {}
+    if perfil == 'servidor':
+        opcoes.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    elif perfil == 'sqlite-wal':
+        # Espera do driver pelo lock (o mesmo valor do PRAGMA busy_timeout)
+        opcoes['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    opcoes.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return opcoes
+
+
+def pragmas_sqlite(config):
+    """PRAGMAs executados em cada conexão SQLite do perfil sqlite-wal."""
+    return [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}", # Negativo = tamanho em KiB
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE_MB']) * 1024 * 1024}",
+        'PRAGMA temp_store = MEMORY',
+    ]
+
+
+def preparar(app):
+    """
+    Resolve o perfil e grava as opções do engine na configuração. Deve ser chamada antes
+    de db.init_app. Guarda o perfil efetivo em app.config['DATABASE_PROFILE'] e o devolve.
+    """
+    perfil = resolver_perfil(app.config)
+    app.config['DATABASE_PROFILE'] = perfil
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config, perfil)
+    return perfil
+
+
+def instalar(app, db):
+    """Registra os eventos do perfil no engine da aplicação (depois de db.init_app)."""
+    if app.config['DATABASE_PROFILE'] != 'sqlite-wal':
+        return
+    pragmas = pragmas_sqlite(app.config)
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def configurar_conexao(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            # O modo WAL fica gravado no arquivo; só troca quando ainda não está ativo
+            # (bancos em memória respondem 'memory' e continuam assim)
+            modo = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            if modo.lower() not in ('wal', 'memory'):
+                cursor.execute('PRAGMA journal_mode = WAL')
+        finally:
+            cursor.close()
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User # Importa o modelo User
 from app.forms import LoginForm # Importa o formulário de login
+from app.services import usuarios
 
 # Cria uma instância de Blueprint para as rotas de autenticação
 # url_prefix='/auth' significa que todas as rotas neste blueprint
@@ -16,7 +17,7 @@ def login():
     """
     # Se o usuário já estiver autenticado, redireciona para a página inicial (dashboard)
     if current_user.is_authenticated:
-        return redirect(url_for('index')) # 'index' será a rota da página inicial/dashboard
+        return redirect(url_for('main.index')) # 'index' será a rota da página inicial/dashboard
 
     form = LoginForm() # Cria uma instância do formulário de login
 
@@ -26,7 +27,14 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
 
         # Verifica se o usuário existe E se a senha está correta
-        if user is None or not user.check_password(form.password.data):
+        # (a senha é conferida no pool limitado de app.services.usuarios)
+        try:
+            senha_correta = user is not None and usuarios.verificar_senha(user, form.password.data)
+        except usuarios.LoginSobrecarregadoError as erro:
+            flash(str(erro), 'warning')
+            return render_template('login.html', title='Login', form=form), 429
+
+        if not senha_correta:
             # Se as credenciais estiverem incorretas, mostra uma mensagem de erro
             flash('Nome de usuário ou senha inválidos', 'danger') # 'danger' é uma categoria Bootstrap para alerta vermelho
             return redirect(url_for('auth.login')) # Redireciona de volta para a página de login
@@ -34,12 +42,13 @@ def login():
         # Se as credenciais estiverem corretas, loga o usuário
         # remember=form.remember_me.data lida com a opção 'Lembrar-me'
         login_user(user, remember=form.remember_me.data)
+        usuarios.carimbar_sessao(user) # Versão do usuário na sessão (invalida a sessão se a senha/papel/status mudar)
 
         # Redireciona para a página anterior que o usuário tentou acessar
         # ou para a página inicial se não houver página anterior registrada
         next_page = request.args.get('next')
         if not next_page or not next_page.startswith('/'): # Validação básica para segurança
-            next_page = url_for('index') # Redireciona para 'index' se não houver 'next' ou for inválido
+            next_page = url_for('main.index') # Redireciona para 'index' se não houver 'next' ou for inválido
 
         flash('Login realizado com sucesso!', 'success') # 'success' é uma categoria Bootstrap para alerta verde
         return redirect(next_page)
@@ -1,17 +1,239 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, abort
-from flask_login import login_required
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, jsonify, Response, stream_with_context, current_app
+from flask_login import login_required, current_user
 from flask_wtf import FlaskForm # Importar FlaskForm se usado em listagens
 # Importar StockMovementForm
 from app.forms import ProductForm, CategoryForm, SupplierForm, StockMovementForm
 from app.models import Product, Category, Supplier, StockMovement # Importar StockMovement
-from app import db
+from app import db, tarefas
+from app.condicional import get_condicional
+from app.paginacao import aplicar_keyset, codificar_cursor
+from app.routes.tarefas import resposta_submetida
+from app.services import busca, catalogo, eventos_estoque, historico, locais, saldos, previsao, referencia
+from app.services.movimentacao import (aplicar_movimentacao, aplicar_lote, transferir, EstoqueInsuficienteError,
+                                      LoteInvalidoError, ProdutoNaoEncontradoError)
 from datetime import datetime
+import os
+import uuid
+from sqlalchemy import select, func
 
 # Cria uma instância de Blueprint para as rotas de estoque/produtos
 estoque = Blueprint('estoque', __name__, url_prefix='/estoque')
 
 # --- Rotas de Produtos (existente) ---
-# ... listar_produtos, adicionar_produto, editar_produto, excluir_produto ...
+# ... adicionar_produto, editar_produto, excluir_produto ...
+
+# Colunas pelas quais a listagem de produtos pode ser ordenada.
+# Cada uma tem um índice composto (Product.ordenacao(coluna), id) definido em app/models.py.
+# Cada uma tem um índice composto (coluna, id) definido em Product.__table_args__.
+COLUNAS_ORDENACAO_PRODUTOS = {
+    'code': Product.code,
+    'name': Product.name,
+    'quantity_in_stock': Product.quantity_in_stock,
+    'last_updated': Product.last_updated,
+}
+
+# Limite de linhas por página na listagem server-side
+TAMANHO_MAXIMO_PAGINA = 200
+
+
+def versao_referencia():
+    """Versão das categorias e fornecedores (filtros da página de produtos)."""
+    return (referencia.versao('categorias'), referencia.versao('fornecedores')), None
+
+
+def versao_produtos():
+    """
+    Versão dos dados da listagem de produtos: a alteração mais recente (MAX pelo índice de
+    last_updated), a movimentação mais recente (MAX pelo índice de data; as dos produtos
+    fragmentados não mudam o Product), as exclusões e os nomes de categoria e fornecedor.
+    """
+    ultima = db.session.scalar(select(func.max(Product.last_updated)))
+    movimentacao = db.session.scalar(select(func.max(StockMovement.date)))
+    partes, _ = versao_referencia()
+    alteracoes = [data for data in (ultima, movimentacao) if data is not None]
+    return (ultima, movimentacao, referencia.versao('produtos')) + partes, max(alteracoes, default=None)
+
+
+@estoque.route('/produtos')
+@login_required
+@get_condicional(versao_referencia, pagina=True)
+def listar_produtos():
+    """
+    Rota para a listagem de produtos.
+    A tabela é preenchida pelo DataTables em modo server-side (ver produtos_dados),
+    então aqui só renderizamos a estrutura da página e os filtros.
+    """
+    form = FlaskForm() # Usado apenas para gerar o token CSRF dos botões de exclusão
+    categorias = referencia.categorias()     # Do cache de dados de referência
+    fornecedores = referencia.fornecedores()
+    return render_template('estoque/produtos.html', title='Produtos', form=form,
+                           categorias=categorias, fornecedores=fornecedores,
+                           abaixo_minimo=request.args.get('abaixo_minimo') == '1')
+
+
+@estoque.route('/produtos/dados')
+@login_required
+@get_condicional(versao_produtos)
+def produtos_dados():
+    """
+    Endpoint JSON da listagem de produtos (modo server-side do DataTables).
+
+    Parâmetros (query string):
+        ordenar: code, name, quantity_in_stock ou last_updated (padrão: name)
+        direcao: asc ou desc
+        tamanho: linhas por página (máximo TAMANHO_MAXIMO_PAGINA)
+        cursor: cursor retornado pela página anterior (paginação por keyset)
+        inicio: deslocamento, usado apenas quando não há cursor (salto direto de página)
+        categoria, fornecedor: filtros por id
+        abaixo_minimo: '1' para listar só produtos com estoque <= estoque mínimo
+        q: busca textual (código, nome, categoria, fornecedor; ver app.services.busca). Com ela a
+           ordem é a de relevância, ordenar e direcao são ignorados e o cursor é o da busca
+        contar: '1' para incluir o total de registros (só é necessário na primeira página)
+        draw: repassado de volta ao DataTables (a página não o envia, para a URL se repetir e
+              o navegador revalidar a resposta em cache com If-None-Match)
+    """
+    ordenar = request.args.get('ordenar', 'name')
+    if ordenar not in COLUNAS_ORDENACAO_PRODUTOS:
+        return jsonify({'erro': f'Ordenação inválida: {ordenar}'}), 400
+    descendente = request.args.get('direcao', 'asc') == 'desc'
+    tamanho = max(1, min(request.args.get('tamanho', 25, type=int), TAMANHO_MAXIMO_PAGINA))
+    cursor = request.args.get('cursor') or None
+    inicio = max(0, request.args.get('inicio', 0, type=int))
+
+    # Filtros aplicados tanto à página quanto à contagem
+    filtros = []
+    categoria_id = request.args.get('categoria', type=int)
+    if categoria_id:
+        filtros.append(Product.category_id == categoria_id)
+    fornecedor_id = request.args.get('fornecedor', type=int)
+    if fornecedor_id:
+        filtros.append(Product.supplier_id == fornecedor_id)
+    if request.args.get('abaixo_minimo') == '1':
+        filtros.append(Product.abaixo_do_minimo()) # Usa o índice parcial ix_product_estoque_baixo
+
+    coluna = Product.ordenacao(COLUNAS_ORDENACAO_PRODUTOS[ordenar]) # Sem NULL (ver Product.ordenacao)
+    termo = request.args.get('q', '').strip()
+
+    # Buscamos os nomes de categoria e fornecedor no mesmo SELECT (LEFT JOIN),
+    # evitando uma consulta extra por linha ao acessar produto.category.name.
+    # O estoque exibido é o total de locais.expressao_total (soma dos fragmentos, se houver)
+    consulta = (
+        select(Product, Category.name.label('categoria'), Supplier.name.label('fornecedor'),
+               locais.expressao_total().label('estoque'), coluna.label('ordem'))
+        .outerjoin(Category, Product.category_id == Category.id)
+        .outerjoin(Supplier, Product.supplier_id == Supplier.id)
+        .where(*filtros)
+    )
+    if termo:
+        # O índice de busca devolve os ids da página em ordem de relevância; as linhas vêm por chave primária
+        try:
+            ids, proximo_cursor = busca.pesquisar(termo, tamanho, cursor, filtros, inicio)
+        except ValueError as exc:
+            return jsonify({'erro': str(exc)}), 400
+        posicao = {product_id: indice for indice, product_id in enumerate(ids)}
+        linhas = sorted(db.session.execute(consulta.where(Product.id.in_(ids))).all(),
+                        key=lambda linha: posicao[linha[0].id])
+    else:
+        try:
+            consulta = aplicar_keyset(consulta, coluna, Product.id, cursor, descendente)
+        except ValueError as exc:
+            return jsonify({'erro': str(exc)}), 400
+        if cursor is None and inicio:
+            # Sem cursor (ex.: usuário pulou direto para a última página) caímos no OFFSET
+            consulta = consulta.offset(inicio)
+
+        # Buscamos uma linha a mais para saber se existe próxima página
+        linhas = db.session.execute(consulta.limit(tamanho + 1)).all()
+        proximo_cursor = None
+        if len(linhas) > tamanho:
+            linhas = linhas[:tamanho]
+            proximo_cursor = codificar_cursor(linhas[-1].ordem, linhas[-1][0].id)
+
+    dados = []
+    for produto, categoria, fornecedor, estoque, _ in linhas:
+        dados.append({
+            'id': produto.id,
+            'code': produto.code,
+            'name': produto.name,
+            'category': categoria or 'N/A',
+            'supplier': fornecedor or 'N/A',
+            'price': '%.2f' % produto.price,
+            'quantity_in_stock': estoque,
+            'minimum_stock': produto.minimum_stock,
+            'last_updated': produto.last_updated.strftime('%d/%m/%Y %H:%M') if produto.last_updated else '',
+            'abaixo_minimo': (estoque or 0) <= (produto.minimum_stock or 0), # Como nos eventos
+        })
+
+    resposta = {
+        'draw': request.args.get('draw', 0, type=int),
+        'data': dados,
+        'next_cursor': proximo_cursor,
+    }
+    # A contagem percorre todas as linhas filtradas, então só é feita quando pedida
+    # (o DataTables a guarda e reaproveita enquanto os filtros não mudam)
+    if request.args.get('contar') == '1':
+        if termo:
+            total = busca.contar(termo, filtros)
+        else:
+            total = db.session.scalar(select(func.count(Product.id)).where(*filtros))
+        resposta['recordsTotal'] = resposta['recordsFiltered'] = total
+    return jsonify(resposta)
+
+
+@estoque.route('/produtos/eventos')
+@login_required
+def produtos_eventos():
+    """
+    Server-Sent Events com os saldos alterados, para a listagem atualizar as linhas sem recarregar.
+    Cada evento 'estoque' traz uma lista de [id, quantidade, abaixo_do_minimo]; 'resync' pede
+    para recarregar a tabela. Responde 503 se o worker já tiver clientes demais.
+    """
+    try:
+        assinatura = eventos_estoque.assinar()
+    except eventos_estoque.CanalCheioError as erro:
+        return jsonify({'erro': str(erro)}), 503
+    # Sem stream_with_context: a conexão aberta não mantém a requisição nem a sessão do banco
+    resposta = Response(
+        eventos_estoque.fluxo(current_app.extensions['canal_estoque'], assinatura,
+                              current_app.config['ESTOQUE_EVENTOS_BATIMENTO']),
+        mimetype='text/event-stream',
+    )
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no' # nginx: entrega cada evento na hora
+    return resposta
+
+
+# Número máximo de sugestões devolvidas pela busca de produtos
+LIMITE_BUSCA_PRODUTOS = 20
+
+
+@estoque.route('/produtos/buscar')
+@login_required
+def buscar_produtos():
+    """
+    Busca de produtos usada pelo seletor de produto das telas de movimentação: todas as palavras
+    digitadas no código, nome, categoria ou fornecedor, sem diferenciar acentos, em ordem de
+    relevância (ver app.services.busca). Retorna no máximo LIMITE_BUSCA_PRODUTOS resultados, e o
+    índice para de ler ao completá-los, então o custo não depende do tamanho do catálogo.
+
+    Parâmetros (query string):
+        q: texto digitado (a última palavra vale como prefixo)
+        limite: quantidade de sugestões (máximo LIMITE_BUSCA_PRODUTOS)
+    """
+    termo = request.args.get('q', '').strip()
+    limite = max(1, min(request.args.get('limite', 10, type=int), LIMITE_BUSCA_PRODUTOS))
+    if not termo:
+        return jsonify([])
+
+    ids, _ = busca.pesquisar(termo, limite)
+    linhas = {linha.id: linha for linha in db.session.execute(
+        select(Product.id, Product.code, Product.name, locais.expressao_total().label('quantity_in_stock'))
+        .where(Product.id.in_(ids)))}
+
+    return jsonify([
+        {'id': linha.id, 'code': linha.code, 'name': linha.name, 'quantity_in_stock': linha.quantity_in_stock}
+        for linha in (linhas[product_id] for product_id in ids if product_id in linhas)
+    ])
 
 # --- Rotas de Categoria (existente) ---
 # ... listar_categorias, adicionar_categoria, editar_categoria, excluir_categoria ...
@@ -33,33 +255,17 @@ def movimentar_entrada():
     form.movement_type.data = 'entrada'
 
     if form.validate_on_submit():
-        # Busca o produto selecionado (o QuerySelectField.data já é o objeto)
+        # Produto selecionado (o ProductLookupField.data já é o objeto)
         produto = form.product.data
         quantidade_movimentada = form.quantity.data
 
-        # Atualiza a quantidade em estoque do produto (adiciona)
-        produto.quantity_in_stock += quantidade_movimentada
-        produto.last_updated = datetime.utcnow() # Atualiza data de modificação
-
-        # Cria um novo registro de movimentação
-        movimentacao = StockMovement(
-            date=datetime.utcnow(),
-            movement_type='entrada',
-            quantity=quantidade_movimentada,
-            # O motivo é opcional para entradas, então pode ser None
-            reason=form.reason.data if form.reason.data else None,
-            product=produto # Associa a movimentação ao produto
-        )
-
-        # Adiciona as mudanças (produto atualizado e nova movimentação) à sessão
-        db.session.add(produto) # O SQLAlchemy já rastreia o produto se ele veio de uma query, mas adicionar explicitamente não faz mal
-        db.session.add(movimentacao)
-        # Salva tudo no banco
-        db.session.commit()
+        # Atualiza o estoque e registra a movimentação numa única transação atômica.
+        # O motivo é opcional para entradas, então pode ser None
+        aplicar_movimentacao(produto.id, 'entrada', quantidade_movimentada, form.reason.data, form.location_id.data)
 
         flash(f'Entrada de {quantidade_movimentada} unidades de "{produto.name}" registrada com sucesso!', 'success')
-        # Redireciona para a listagem de produtos ou para uma página de histórico de movimentação
-        return redirect(url_for('estoque.listar_produtos')) # Podemos criar uma rota para histórico depois
+        # Redireciona para o histórico de movimentações do produto
+        return redirect(url_for('estoque.historico_movimentacoes', produto=produto.code))
 
     # Se a requisição for GET ou validação falhar, renderiza o template
     # Passamos o tipo de movimento e o formulário para o template
@@ -77,41 +283,262 @@ def movimentar_saida():
     form.movement_type.data = 'saida'
 
     if form.validate_on_submit():
-        # Busca o produto selecionado
+        # Produto selecionado
         produto = form.product.data
         quantidade_movimentada = form.quantity.data
 
-        # A validação de quantidade suficiente já foi feita no validador customizado do formulário,
-        # mas podemos adicionar uma verificação extra aqui por segurança, se desejar.
-        if quantidade_movimentada > produto.quantity_in_stock:
-             flash(f'Erro: Quantidade de saída ({quantidade_movimentada}) maior que o estoque disponível ({produto.quantity_in_stock}) para "{produto.name}".', 'danger')
-             # Retorna para a página, permitindo ao usuário corrigir o formulário
-             return render_template('estoque/movimentar_estoque.html', title='Registrar Saída de Estoque', form=form, movement_type='saida')
-
-
-        # Atualiza a quantidade em estoque do produto (subtrai)
-        produto.quantity_in_stock -= quantidade_movimentada
-        produto.last_updated = datetime.utcnow() # Atualiza data de modificação
-
-        # Cria um novo registro de movimentação
-        movimentacao = StockMovement(
-            date=datetime.utcnow(),
-            movement_type='saida',
-            quantity=quantidade_movimentada,
-            # O motivo é obrigatório para saídas (validado no formulário)
-            reason=form.reason.data, # reason.data já vem validado como não vazio para saídas
-            product=produto # Associa a movimentação ao produto
-        )
-
-        # Adiciona as mudanças (produto atualizado e nova movimentação) à sessão
-        db.session.add(produto)
-        db.session.add(movimentacao)
-        # Salva tudo no banco
-        db.session.commit()
+        # O validador do formulário já avisa sobre estoque insuficiente, mas outra saída
+        # concorrente pode ter consumido o saldo depois disso. A verificação que vale é a do
+        # UPDATE condicional feito por aplicar_movimentacao.
+        try:
+            # reason.data já vem validado como não vazio para saídas
+            aplicar_movimentacao(produto.id, 'saida', quantidade_movimentada, form.reason.data, form.location_id.data)
+        except EstoqueInsuficienteError as erro:
+            flash(f'Erro: Quantidade de saída ({quantidade_movimentada}) maior que o estoque disponível ({erro.disponivel}) para "{produto.name}".', 'danger')
+            # Retorna para a página, permitindo ao usuário corrigir o formulário
+            return render_template('estoque/movimentar_estoque.html', title='Registrar Saída de Estoque', form=form, movement_type='saida')
 
         flash(f'Saída de {quantidade_movimentada} unidades de "{produto.name}" registrada com sucesso!', 'success')
-        # Redireciona para a listagem de produtos ou para uma página de histórico
-        return redirect(url_for('estoque.listar_produtos')) # Podemos criar uma rota para histórico depois
+        # Redireciona para o histórico de movimentações do produto
+        return redirect(url_for('estoque.historico_movimentacoes', produto=produto.code))
 
     # Se a requisição for GET ou validação falhar, renderiza o template
-    return render_template('estoque/movimentar_estoque.html', title='Registrar Saída de Estoque', form=form, movement_type='saida')
\ No newline at end of file
+    return render_template('estoque/movimentar_estoque.html', title='Registrar Saída de Estoque', form=form, movement_type='saida')
+
+
+@estoque.route('/movimentar/lote', methods=['POST'])
+@login_required
+def movimentar_lote():
+    """
+    API para registrar um lote de movimentações (ex.: recebimento de um palete ou uma separação).
+
+    Corpo JSON: {"linhas": [{"code": "...", "movement_type": "entrada"|"saida", "quantity": 10, "reason": "..."}, ...],
+                 "local": "deposito"}
+    "local" (código) é opcional; o padrão é o local padrão.
+    O lote é aplicado numa única transação: ou todas as linhas são gravadas, ou nenhuma.
+    Requisições com sessão devem enviar o token CSRF no cabeçalho X-CSRFToken.
+    """
+    corpo = request.get_json(silent=True)
+    linhas = corpo.get('linhas') if isinstance(corpo, dict) else None
+    if not isinstance(linhas, list):
+        return jsonify({'erro': 'Envie um JSON no formato {"linhas": [...]}.'}), 400
+
+    location_id = None
+    if corpo.get('local') is not None:
+        location_id = locais.buscar(str(corpo['local']))
+        if location_id is None:
+            return jsonify({'erro': f"Local {corpo['local']!r} não encontrado."}), 422
+
+    try:
+        resumo = aplicar_lote(linhas, location_id)
+    except LoteInvalidoError as erro:
+        # 422: o lote foi entendido, mas alguma linha não pode ser aplicada
+        return jsonify({'erro': str(erro), 'erros': erro.erros}), 422
+
+    return jsonify(resumo)
+
+
+@estoque.route('/transferir', methods=['POST'])
+@login_required
+def transferir_entre_locais():
+    """
+    API para transferir unidades de um produto entre dois locais (uma saída na origem e uma
+    entrada no destino, na mesma transação).
+
+    Corpo JSON: {"code": "...", "origem": "deposito", "destino": "loja1", "quantity": 10, "reason": "..."}
+    Requisições com sessão devem enviar o token CSRF no cabeçalho X-CSRFToken.
+    """
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, dict):
+        return jsonify({'erro': 'Envie um JSON no formato {"code": "...", "origem": "...", "destino": "...", "quantity": n}.'}), 400
+    quantidade = corpo.get('quantity')
+    if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+        return jsonify({'erro': 'A quantidade deve ser um número inteiro positivo.'}), 422
+
+    produto_id = db.session.scalar(select(Product.id).where(Product.code == str(corpo.get('code') or '').strip()))
+    if produto_id is None:
+        return jsonify({'erro': f"Produto com código {corpo.get('code')!r} não encontrado."}), 422
+    ids = {}
+    for campo in ('origem', 'destino'):
+        ids[campo] = locais.buscar(str(corpo.get(campo) or ''))
+        if ids[campo] is None:
+            return jsonify({'erro': f"Local {corpo.get(campo)!r} não encontrado."}), 422
+
+    try:
+        transferir(produto_id, ids['origem'], ids['destino'], quantidade, corpo.get('reason'))
+    except (ValueError, ProdutoNaoEncontradoError) as erro:
+        return jsonify({'erro': str(erro)}), 422
+    except EstoqueInsuficienteError as erro:
+        return jsonify({'erro': str(erro), 'product_id': erro.product_id}), 409
+
+    return jsonify(locais.saldos_por_local(produto_id))
+
+
+@estoque.route('/produtos/<int:produto_id>/locais')
+@login_required
+def saldos_produto_por_local(produto_id):
+    """API com o saldo do produto em cada local e o total (soma dos locais)."""
+    saldos_locais = locais.saldos_por_local(produto_id)
+    if saldos_locais is None:
+        abort(404)
+    return jsonify(saldos_locais)
+
+
+# --- Histórico de movimentações ---
+
+# Linhas por página no histórico de movimentações
+TAMANHO_PAGINA_HISTORICO = 50
+
+
+@estoque.route('/movimentacoes')
+@login_required
+def historico_movimentacoes():
+    """
+    Histórico de movimentações, da mais recente para a mais antiga, paginado por cursor.
+
+    Parâmetros (query string):
+        produto: código do produto
+        tipo: entrada ou saida
+        de, ate: intervalo de datas (AAAA-MM-DD ou AAAA-MM-DDTHH:MM)
+        motivo: texto contido no motivo
+        cursor: cursor da página anterior (link "Mais antigas")
+    """
+    # Filtros preenchidos, repassados aos links de paginação e de exportação
+    filtros_url = {chave: request.args[chave] for chave in ('produto', 'tipo', 'de', 'ate', 'motivo') if request.args.get(chave)}
+    try:
+        filtros = historico.interpretar_filtros(request.args)
+        linhas, proximo_cursor = historico.pagina(filtros, request.args.get('cursor') or None, TAMANHO_PAGINA_HISTORICO)
+    except ValueError as erro:
+        flash(str(erro), 'danger')
+        linhas, proximo_cursor = [], None
+    return render_template('estoque/movimentacoes.html', title='Histórico de Movimentações', linhas=linhas,
+                           proximo_cursor=proximo_cursor, filtros=filtros_url,
+                           primeira_pagina=not request.args.get('cursor'))
+
+
+@estoque.route('/movimentacoes/exportar')
+@login_required
+def exportar_movimentacoes():
+    """
+    Exporta em CSV as movimentações que atendem aos filtros do histórico (mesmos parâmetros),
+    em ordem cronológica. A resposta é enviada aos pedaços, sem carregar o intervalo inteiro na memória.
+    """
+    try:
+        filtros = historico.interpretar_filtros(request.args)
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+    nome_arquivo = f'movimentacoes_{datetime.utcnow():%Y%m%d_%H%M%S}.csv'
+    return Response(
+        stream_with_context(historico.exportar_csv(filtros)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}'},
+    )
+
+
+# --- Importação e exportação do catálogo ---
+
+TIPOS_CONTEUDO_CATALOGO = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+@estoque.route('/catalogo/exportar/<entidade>')
+@login_required
+def exportar_catalogo(entidade):
+    """
+    Exporta produtos, categorias ou fornecedores em CSV ou JSON Lines (?formato=csv|jsonl).
+    A resposta é enviada aos pedaços, à medida que as linhas são lidas do banco.
+    """
+    formato = request.args.get('formato', 'csv')
+    if entidade not in catalogo.ENTIDADES or formato not in catalogo.FORMATOS:
+        abort(404)
+    nome_arquivo = f'{entidade}_{datetime.utcnow():%Y%m%d_%H%M%S}.{formato}'
+    # stream_with_context mantém o contexto da requisição (e a sessão do banco) vivo durante o envio
+    return Response(
+        stream_with_context(catalogo.exportar(entidade, formato)),
+        mimetype=TIPOS_CONTEUDO_CATALOGO[formato],
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}'},
+    )
+
+
+@estoque.route('/catalogo/importar/<entidade>', methods=['POST'])
+@login_required
+def importar_catalogo(entidade):
+    """
+    Importa produtos, categorias ou fornecedores de um arquivo enviado no campo 'arquivo'.
+    O formato vem de ?formato=csv|jsonl (padrão: pela extensão do arquivo).
+    O arquivo é salvo e importado em segundo plano: responde 202 com o id da tarefa
+    (acompanhe em /tarefas/<id>; as estatísticas da importação ficam no resultado).
+    """
+    if entidade not in catalogo.ENTIDADES:
+        abort(404)
+    enviado = request.files.get('arquivo')
+    if enviado is None or not enviado.filename:
+        return jsonify({'erro': 'Envie o arquivo no campo "arquivo".'}), 400
+    formato = request.args.get('formato') or ('jsonl' if enviado.filename.endswith(('.jsonl', '.ndjson')) else 'csv')
+    if formato not in catalogo.FORMATOS:
+        return jsonify({'erro': f'Formato inválido: {formato}'}), 400
+
+    diretorio = current_app.config['TAREFAS_DIRETORIO']
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f'upload-{uuid.uuid4().hex}.{formato}')
+    enviado.save(caminho)
+    try:
+        job = tarefas.submeter('importar_catalogo', {'entidade': entidade, 'formato': formato, 'caminho': caminho},
+                               user_id=current_user.id, interna=True)
+    except tarefas.TarefasSobrecarregadasError as erro:
+        os.remove(caminho)
+        return jsonify({'erro': str(erro)}), 503
+    return resposta_submetida(job)
+
+
+# --- Saldos em uma data (consultas ponto no tempo) ---
+
+@estoque.route('/produtos/<int:product_id>/saldo')
+@login_required
+def saldo_produto(product_id):
+    """
+    Saldo do produto numa data (?em=AAAA-MM-DD ou AAAA-MM-DDTHH:MM; padrão: agora).
+    Calculado a partir do checkpoint mais próximo, sem refazer todo o histórico.
+    """
+    try:
+        momento = saldos.interpretar_momento(request.args['em']) if request.args.get('em') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'erro': 'Data inválida.'}), 400
+    saldo = saldos.saldo_em(product_id, momento)
+    if saldo is None:
+        abort(404)
+    return jsonify({'product_id': product_id, 'em': momento.isoformat(), 'saldo': saldo})
+
+
+@estoque.route('/valorizacao')
+@login_required
+def valorizacao_estoque():
+    """Valor total do estoque numa data (?em=...), ex.: no fechamento do mês."""
+    try:
+        momento = saldos.interpretar_momento(request.args['em']) if request.args.get('em') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'erro': 'Data inválida.'}), 400
+    try:
+        resumo = saldos.valorizacao_em(momento)
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+    return jsonify({
+        'em': momento.isoformat(),
+        'produtos': resumo['produtos'],
+        'unidades': int(resumo['unidades']),
+        'valor_total': '%.2f' % resumo['valor_total'],
+    })
+
+
+# --- Sugestões de compra (previsão de demanda) ---
+
+@estoque.route('/compras/sugestoes')
+@login_required
+def sugestoes_compra():
+    """
+    Sugestões de compra agrupadas por fornecedor.
+    Lê a tabela calculada por 'flask estoque sugestoes-compra' (ver app.services.previsao).
+    """
+    grupos = previsao.sugestoes_por_fornecedor()
+    calculado_em = grupos[0]['itens'][0].computed_at if grupos else None
+    return render_template('estoque/sugestoes_compra.html', title='Sugestões de Compra',
+                           grupos=grupos, calculado_em=calculado_em)
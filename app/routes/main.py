@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template
 from flask_login import login_required, current_user # Importamos current_user também
+from app.services.alertas import contar_estoque_baixo, listar_estoque_baixo
 
 # Cria uma instância de Blueprint para as rotas gerais/principais
 main = Blueprint('main', __name__) # Não definimos um url_prefix aqui, pois a rota '/' é a raiz
@@ -15,4 +16,9 @@ def index():
     # Podemos passar informações do usuário logado para o template, se necessário
     # user = current_user # current_user é fornecido pelo Flask-Login
 
-    return render_template('dashboard.html', title='Dashboard')
\ No newline at end of file
+    # Alerta de estoque baixo: lido do índice parcial, custa O(produtos em alerta)
+    total_estoque_baixo = contar_estoque_baixo()
+    estoque_baixo = listar_estoque_baixo() if total_estoque_baixo else []
+
+    return render_template('dashboard.html', title='Dashboard',
+                           total_estoque_baixo=total_estoque_baixo, estoque_baixo=estoque_baixo)
\ No newline at end of file
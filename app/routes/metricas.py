@@ -0,0 +1,64 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request, abort
+from flask_login import current_user
+
+# Cria uma instância de Blueprint para as métricas da instrumentação de SQL (app/instrumentacao.py).
+# Só é registrado quando SQL_INSTRUMENTACAO está ativa.
+metricas = Blueprint('metricas', __name__)
+
+
+@metricas.before_request
+def autorizar():
+    """
+    Aceita um usuário logado ou, para coletores como o Prometheus,
+    o cabeçalho 'Authorization: Bearer <METRICAS_TOKEN>'.
+    """
+    token = current_app.config.get('METRICAS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return None
+    if not current_user.is_authenticated:
+        abort(401)
+    return None
+
+
+def _estatisticas():
+    return current_app.extensions['instrumentacao_sql'].instantaneo()
+
+
+@metricas.route('/metrics')
+def metricas_texto():
+    """Estatísticas de SQL por endpoint no formato texto do Prometheus."""
+    estatisticas = _estatisticas()
+    series = (
+        ('app_http_requests_total', 'counter', 'Requisições atendidas.', 'requisicoes'),
+        ('app_sql_queries_total', 'counter', 'Comandos SQL executados.', 'consultas'),
+        ('app_sql_seconds_total', 'counter', 'Tempo gasto no banco, em segundos.', 'segundos'),
+        ('app_sql_queries_max', 'gauge', 'Maior número de comandos SQL numa requisição.', 'maximo_consultas'),
+        ('app_sql_n_plus_one_requests_total', 'counter', 'Requisições com comando repetido (provável N+1).',
+         'requisicoes_n_mais_1'),
+    )
+    linhas = []
+    for nome, tipo, ajuda, chave in series:
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for endpoint, dados in sorted(estatisticas.items()):
+            linhas.append(f'{nome}{{endpoint="{endpoint}"}} {dados[chave]}')
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@metricas.route('/metrics/sql')
+def metricas_sql():
+    """Detalhe por endpoint: médias, consultas mais lentas e comandos sinalizados como N+1."""
+    return jsonify({
+        endpoint: {
+            'requisicoes': dados['requisicoes'],
+            'consultas_por_requisicao': round(dados['consultas'] / dados['requisicoes'], 2),
+            'ms_por_requisicao': round(dados['segundos'] * 1000 / dados['requisicoes'], 3),
+            'maximo_consultas': dados['maximo_consultas'],
+            'requisicoes_n_mais_1': dados['requisicoes_n_mais_1'],
+            'n_mais_1': [{'sql': sql, 'vezes': vezes} for sql, vezes in dados['n_mais_1'].items()],
+            'lentas': [{'sql': sql, 'ms': round(segundos * 1000, 3)} for segundos, sql in dados['lentas']],
+        }
+        for endpoint, dados in sorted(_estatisticas().items())
+    })
@@ -0,0 +1,87 @@
+from datetime import date
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+from app.services import consolidados
+
+# Cria uma instância de Blueprint para as rotas de relatórios
+# Todos os relatórios leem apenas a tabela de consolidados (SalesRollup)
+relatorios = Blueprint('relatorios', __name__, url_prefix='/relatorios')
+
+# Limite de produtos no ranking de mais vendidos
+LIMITE_MAIS_VENDIDOS = 100
+
+
+def _parametros_periodo():
+    """Lê e valida periodo e dimensao da query string. Retorna (periodo, dimensao) ou levanta ValueError."""
+    periodo = request.args.get('periodo', 'mes')
+    dimensao = request.args.get('dimensao', 'categoria')
+    if periodo not in consolidados.PERIODOS:
+        raise ValueError(f'Período inválido: {periodo}')
+    if dimensao not in consolidados.DIMENSOES:
+        raise ValueError(f'Dimensão inválida: {dimensao}')
+    return periodo, dimensao
+
+
+@relatorios.route('/vendas')
+@login_required
+def vendas_por_periodo():
+    """
+    Receita e unidades vendidas por período e dimensão.
+
+    Parâmetros (query string):
+        periodo: dia ou mes (padrão: mes)
+        dimensao: categoria, fornecedor ou vendedor (padrão: categoria)
+        de, ate: intervalo de datas AAAA-MM-DD (padrão: o ano corrente)
+    """
+    try:
+        periodo, dimensao = _parametros_periodo()
+        hoje = date.today()
+        de = date.fromisoformat(request.args['de']) if request.args.get('de') else date(hoje.year, 1, 1)
+        ate = date.fromisoformat(request.args['ate']) if request.args.get('ate') else hoje
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+
+    linhas = consolidados.relatorio_vendas(periodo, dimensao, de, ate)
+    return jsonify([
+        {
+            'inicio': linha.period_start.isoformat(),
+            'id': linha.dimension_id,
+            'nome': linha.nome or 'N/A',
+            'receita': '%.2f' % linha.revenue,
+            'unidades': linha.units,
+        }
+        for linha in linhas
+    ])
+
+
+@relatorios.route('/mais-vendidos')
+@login_required
+def mais_vendidos():
+    """
+    Produtos mais vendidos (por receita) de uma categoria, fornecedor ou vendedor num período.
+
+    Parâmetros (query string):
+        periodo, dimensao: como em vendas_por_periodo
+        id: id da categoria/fornecedor/usuário (0 = sem categoria/fornecedor)
+        inicio: qualquer data dentro do período (padrão: hoje)
+        limite: quantidade de produtos (máximo LIMITE_MAIS_VENDIDOS)
+    """
+    try:
+        periodo, dimensao = _parametros_periodo()
+        inicio = date.fromisoformat(request.args['inicio']) if request.args.get('inicio') else date.today()
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+    dimensao_id = request.args.get('id', 0, type=int)
+    limite = max(1, min(request.args.get('limite', 10, type=int), LIMITE_MAIS_VENDIDOS))
+
+    linhas = consolidados.mais_vendidos(periodo, inicio, dimensao, dimensao_id, limite)
+    return jsonify([
+        {
+            'product_id': linha.product_id,
+            'code': linha.code,
+            'name': linha.name,
+            'receita': '%.2f' % linha.revenue,
+            'unidades': linha.units,
+        }
+        for linha in linhas
+    ])
@@ -0,0 +1,91 @@
+import os
+
+from flask import Blueprint, request, jsonify, abort, url_for, send_file
+from flask_login import login_required, current_user
+from sqlalchemy import select
+
+from app import db, tarefas as executor_tarefas
+from app.models import BackgroundJob
+
+# Submissão, consulta e cancelamento de tarefas em segundo plano (ver app/tarefas.py).
+# Requisições com sessão devem enviar o token CSRF no cabeçalho X-CSRFToken.
+tarefas = Blueprint('tarefas', __name__, url_prefix='/tarefas')
+
+
+def _tarefa_do_usuario(job_id):
+    """A tarefa, se for do usuário logado (ou se ele for admin); senão 404."""
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != 'admin'):
+        abort(404)
+    return job
+
+
+def resposta_submetida(job):
+    """Resposta 202 com o id da tarefa e o endereço para acompanhá-la."""
+    endereco = url_for('tarefas.consultar', job_id=job.id)
+    resposta = jsonify({'id': job.id, 'status': job.status, 'url': endereco})
+    resposta.status_code = 202
+    resposta.headers['Location'] = endereco
+    return resposta
+
+
+@tarefas.route('/', methods=['GET'])
+@login_required
+def listar():
+    """As 50 tarefas mais recentes do usuário logado."""
+    recentes = db.session.scalars(
+        select(BackgroundJob).where(BackgroundJob.user_id == current_user.id)
+        .order_by(BackgroundJob.created_at.desc(), BackgroundJob.id.desc()).limit(50)
+    ).all()
+    return jsonify([executor_tarefas.descrever(job) for job in recentes])
+
+
+@tarefas.route('/<tipo>', methods=['POST'])
+@login_required
+def submeter(tipo):
+    """
+    Submete uma tarefa do tipo informado; os parâmetros vêm no corpo JSON.
+    Responde 202 na hora, com o id da tarefa; 400 para parâmetros inválidos; 503 se o pool estiver cheio.
+    """
+    parametros = request.get_json(silent=True) or {}
+    if not isinstance(parametros, dict):
+        return jsonify({'erro': 'Envie os parâmetros como um objeto JSON.'}), 400
+    try:
+        job = executor_tarefas.submeter(tipo, parametros, user_id=current_user.id)
+    except executor_tarefas.ParametrosTarefaError as erro:
+        return jsonify({'erro': str(erro)}), 400
+    except executor_tarefas.TarefasSobrecarregadasError as erro:
+        return jsonify({'erro': str(erro)}), 503
+    return resposta_submetida(job)
+
+
+@tarefas.route('/<int:job_id>', methods=['GET'])
+@login_required
+def consultar(job_id):
+    """Estado, andamento, resultado ou erro da tarefa."""
+    return jsonify(executor_tarefas.descrever(_tarefa_do_usuario(job_id)))
+
+
+@tarefas.route('/<int:job_id>/cancelar', methods=['POST'])
+@login_required
+def cancelar(job_id):
+    """Pede o cancelamento. Responde 409 se a tarefa já terminou."""
+    _tarefa_do_usuario(job_id)
+    if not executor_tarefas.cancelar(job_id):
+        return jsonify({'erro': 'A tarefa já terminou.'}), 409
+    resposta = jsonify(executor_tarefas.descrever(db.session.get(BackgroundJob, job_id, populate_existing=True)))
+    resposta.status_code = 202
+    return resposta
+
+
+@tarefas.route('/<int:job_id>/resultado', methods=['GET'])
+@login_required
+def baixar_resultado(job_id):
+    """Baixa o arquivo gerado pela tarefa (exportação, divergências da reconciliação)."""
+    job = _tarefa_do_usuario(job_id)
+    if job.status != 'concluida':
+        return jsonify({'erro': 'A tarefa ainda não terminou.', 'status': job.status}), 409
+    if not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, as_attachment=True,
+                     download_name=os.path.basename(job.result_path).split('-', 2)[-1])
@@ -0,0 +1,53 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.services import locais
+from app.services.movimentacao import EstoqueInsuficienteError
+from app.services.vendas import finalizar_venda, VendaInvalidaError
+
+# Cria uma instância de Blueprint para as rotas de vendas (PDV)
+vendas = Blueprint('vendas', __name__, url_prefix='/vendas')
+
+
+@vendas.route('/checkout', methods=['POST'])
+@login_required
+def checkout():
+    """
+    Finaliza uma venda (RF07, RF08).
+
+    Corpo JSON: {"itens": [{"product_id": 1, "quantity": 2}, ...], "amount_paid": "50.00", "local": "loja1"}
+    "local" (código do local de onde sai o estoque) é opcional; o padrão é o local padrão.
+    Requisições com sessão devem enviar o token CSRF no cabeçalho X-CSRFToken.
+    Os valores monetários são devolvidos como texto para não perder precisão.
+    """
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, dict) or not isinstance(corpo.get('itens'), list):
+        return jsonify({'erro': 'Envie um JSON no formato {"itens": [...], "amount_paid": "..."}.'}), 400
+
+    location_id = None
+    if corpo.get('local') is not None:
+        location_id = locais.buscar(str(corpo['local']))
+        if location_id is None:
+            return jsonify({'erro': f"Local {corpo['local']!r} não encontrado."}), 422
+
+    try:
+        resumo = finalizar_venda(current_user.id, corpo['itens'], corpo.get('amount_paid'), location_id)
+    except VendaInvalidaError as erro:
+        return jsonify({'erro': str(erro)}), 422
+    except EstoqueInsuficienteError as erro:
+        return jsonify({'erro': str(erro), 'product_id': erro.product_id}), 409
+
+    return jsonify({
+        'sale_id': resumo['sale_id'],
+        'total_amount': str(resumo['total_amount']),
+        'amount_paid': str(resumo['amount_paid']),
+        'change': str(resumo['change']),
+        'itens': [
+            {
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'price_per_item': str(item['price_per_item']),
+                'subtotal': str(item['subtotal']),
+            }
+            for item in resumo['itens']
+        ],
+    }), 201
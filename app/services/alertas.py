@@ -0,0 +1,29 @@
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Product
+from app.services import locais
+
+# Alertas de estoque baixo.
+# As consultas usam Product.abaixo_do_minimo(), a mesma condição do índice parcial
+# ix_product_estoque_baixo, então o custo é proporcional ao número de produtos em alerta
+# e não ao tamanho do catálogo. Nos produtos fragmentados o índice segue o Product, refeito por
+# locais.consolidar; a quantidade exibida já é a soma dos locais.
+
+LIMITE_ALERTAS_DASHBOARD = 20
+
+
+def contar_estoque_baixo():
+    """Quantidade de produtos com estoque menor ou igual ao estoque mínimo."""
+    return db.session.scalar(select(func.count()).select_from(Product).where(Product.abaixo_do_minimo()))
+
+
+def listar_estoque_baixo(limite=LIMITE_ALERTAS_DASHBOARD):
+    """Primeiros `limite` produtos em alerta, em ordem alfabética."""
+    return db.session.execute(
+        select(Product.id, Product.code, Product.name, locais.expressao_total().label('quantity_in_stock'),
+               Product.minimum_stock)
+        .where(Product.abaixo_do_minimo())
+        .order_by(Product.name, Product.id)
+        .limit(limite)
+    ).all()
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, func, tuple_, bindparam
+
+from app import db
+from app.models import StockArchiveRun, StockCheckpoint, StockMovement, StockMovementArchive, StockMovementSummary
+
+# Arquivamento das movimentações antigas de estoque.
+#
+# arquivar(antes) tira de stock_movement todos os meses anteriores ao mês de `antes`:
+#   1. grava um checkpoint de todos os produtos no instante do corte (primeiro dia do mês - 1 µs),
+#      enquanto as movimentações ainda estão na tabela. Esse checkpoint passa a ser a âncora do
+#      saldo em uma data, da reconciliação e dos próximos checkpoints (app.services.saldos);
+#   2. para cada mês, numa transação: copia as linhas, em ordem de (date, id), para blocos de JSON
+#      comprimido (StockMovementArchive), soma os totais do mês por produto (StockMovementSummary)
+#      e apaga as linhas da tabela.
+# Rodar de novo com o mesmo corte não faz nada (os meses já não têm linhas); uma execução
+# interrompida continua do mês em que parou.
+#
+# O histórico e a exportação (app.services.historico) leem os blocos sob demanda, depois das linhas
+# da tabela. Os blocos de um produto são só os dos meses em que ele tem resumo.
+# verificar() confere os blocos (SHA-256 e contagem), os resumos contra os blocos, os checkpoints
+# de cortes consecutivos contra os resumos e o estoque atual contra o livro (saldos.reconciliar).
+
+# Linhas por bloco de arquivo
+TAMANHO_BLOCO_ARQUIVO = 5000
+
+# O checkpoint do corte fica 1 µs antes do primeiro dia do mês (é o mesmo instante que
+# saldos.interpretar_momento dá ao último dia do mês anterior)
+UM_MICROSSEGUNDO = timedelta(microseconds=1)
+
+# is_transfer entrou depois dos primeiros blocos: nos blocos antigos (7 campos) vale False
+MovimentacaoArquivada = namedtuple('MovimentacaoArquivada',
+                                   'id date product_id location_id movement_type quantity reason is_transfer',
+                                   defaults=(False,))
+
+
+class ArquivoError(Exception):
+    """Levantada quando o corte pedido não pode ser arquivado. Nada é gravado."""
+
+
+def inicio_do_mes(momento):
+    return datetime(momento.year, momento.month, 1)
+
+
+def _mes_seguinte(inicio):
+    return datetime(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+
+
+def instante_do_checkpoint(corte):
+    """Data do checkpoint gravado no arquivamento com este corte."""
+    return corte - UM_MICROSSEGUNDO
+
+
+def limite():
+    """Corte do último arquivamento (movimentações anteriores não estão mais na tabela), ou None."""
+    return db.session.scalar(select(func.max(StockArchiveRun.cutoff)))
+
+
+def _codificar(linhas):
+    bruto = json.dumps([
+        [linha.id, linha.date.isoformat(), linha.product_id, linha.location_id,
+         linha.movement_type, linha.quantity, linha.reason, linha.is_transfer]
+        for linha in linhas
+    ], separators=(',', ':')).encode('utf-8')
+    return zlib.compress(bruto, 9), hashlib.sha256(bruto).hexdigest()
+
+
+def _decodificar(dados):
+    """Linhas de um bloco e o SHA-256 do JSON descomprimido."""
+    bruto = zlib.decompress(dados)
+    linhas = [
+        MovimentacaoArquivada(id_, datetime.fromisoformat(data), product_id, location_id, tipo, quantidade, motivo,
+                              *resto)
+        for id_, data, product_id, location_id, tipo, quantidade, motivo, *resto in json.loads(bruto)
+    ]
+    return linhas, hashlib.sha256(bruto).hexdigest()
+
+
+def _registrar_corte(corte):
+    """Grava o checkpoint do corte e o registro do arquivamento (uma vez por corte)."""
+    from app.services import saldos
+    saldos.gerar_checkpoints(instante_do_checkpoint(corte))
+    db.session.add(StockArchiveRun(cutoff=corte))
+    db.session.commit()
+
+
+def _somar_resumos(mes, totais):
+    """Acrescenta os totais do mês por produto aos resumos (produtos já resumidos no mês são somados)."""
+    existentes = set()
+    ids = list(totais)
+    for inicio in range(0, len(ids), TAMANHO_BLOCO_ARQUIVO):
+        existentes.update(db.session.scalars(
+            select(StockMovementSummary.product_id)
+            .where(StockMovementSummary.month == mes,
+                   StockMovementSummary.product_id.in_(ids[inicio:inicio + TAMANHO_BLOCO_ARQUIVO]))
+        ))
+    novos = [{'product_id': product_id, 'month': mes, 'units_in': entradas, 'units_out': saidas, 'movements': n}
+             for product_id, (entradas, saidas, n) in totais.items() if product_id not in existentes]
+    if novos:
+        db.session.execute(insert(StockMovementSummary), novos)
+    if existentes:
+        tabela = StockMovementSummary.__table__
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.product_id == bindparam('b_id'), tabela.c.month == mes)
+            .values(units_in=tabela.c.units_in + bindparam('b_in'), units_out=tabela.c.units_out + bindparam('b_out'),
+                    movements=tabela.c.movements + bindparam('b_n')),
+            [{'b_id': product_id, 'b_in': totais[product_id][0], 'b_out': totais[product_id][1],
+              'b_n': totais[product_id][2]} for product_id in existentes],
+        )
+
+
+def _arquivar_mes(corte, inicio, fim):
+    """Arquiva as movimentações de [inicio, fim) numa transação. Retorna (movimentações, blocos)."""
+    colunas = (StockMovement.id, StockMovement.date, StockMovement.product_id, StockMovement.location_id,
+               StockMovement.movement_type, StockMovement.quantity, StockMovement.reason,
+               StockMovement.is_transfer)
+    mes = inicio.date()
+    totais = {} # product_id -> [entradas, saídas, movimentações]
+    arquivadas, blocos, posicao = 0, 0, None
+    while True:
+        consulta = select(*colunas).where(StockMovement.date >= inicio, StockMovement.date < fim)
+        if posicao is not None:
+            consulta = consulta.where(tuple_(StockMovement.date, StockMovement.id) > posicao)
+        linhas = db.session.execute(
+            consulta.order_by(StockMovement.date, StockMovement.id).limit(TAMANHO_BLOCO_ARQUIVO)).all()
+        if not linhas:
+            break
+        dados, checksum = _codificar(linhas)
+        db.session.execute(insert(StockMovementArchive).values(
+            month=mes, first_date=linhas[0].date, last_date=linhas[-1].date,
+            rows=len(linhas), checksum=checksum, data=dados))
+        for linha in linhas:
+            total = totais.setdefault(linha.product_id, [0, 0, 0])
+            total[0 if linha.movement_type == 'entrada' else 1] += linha.quantity
+            total[2] += 1
+        arquivadas += len(linhas)
+        blocos += 1
+        posicao = (linhas[-1].date, linhas[-1].id)
+
+    if arquivadas:
+        _somar_resumos(mes, totais)
+        apagadas = db.session.execute(
+            delete(StockMovement).where(StockMovement.date >= inicio, StockMovement.date < fim)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if apagadas != arquivadas:
+            db.session.rollback()
+            raise ArquivoError(f'{inicio:%Y-%m}: {arquivadas} movimentações copiadas, mas {apagadas} apagadas.')
+        db.session.execute(
+            update(StockArchiveRun).where(StockArchiveRun.cutoff == corte)
+            .values(movements=StockArchiveRun.movements + arquivadas, blocks=StockArchiveRun.blocks + blocos)
+        )
+    db.session.commit()
+    return arquivadas, blocos
+
+
+def arquivar(antes, progresso=None):
+    """
+    Arquiva as movimentações dos meses anteriores ao mês de `antes` (datetime).
+    `progresso`, se informado, recebe (mês, movimentações arquivadas no mês) a cada mês gravado.
+
+    O corte precisa ser mais antigo que ARQUIVO_RETENCAO_DIAS (a previsão de demanda lê as saídas
+    diárias recentes) e não pode voltar antes de um arquivamento anterior. Levanta ArquivoError.
+    Retorna {'corte', 'meses', 'movimentacoes', 'blocos'}.
+    """
+    corte = inicio_do_mes(antes)
+    retencao = datetime.utcnow() - timedelta(days=current_app.config['ARQUIVO_RETENCAO_DIAS'])
+    if corte > retencao:
+        raise ArquivoError(f'O corte ({corte:%Y-%m-%d}) deve ser anterior a {retencao:%Y-%m-%d} '
+                           f"(ARQUIVO_RETENCAO_DIAS = {current_app.config['ARQUIVO_RETENCAO_DIAS']}).")
+    anterior = limite()
+    if anterior is not None and corte < anterior:
+        raise ArquivoError(f'As movimentações já estão arquivadas até {anterior:%Y-%m-%d}.')
+    if corte != anterior:
+        _registrar_corte(corte)
+
+    resumo = {'corte': corte, 'meses': 0, 'movimentacoes': 0, 'blocos': 0}
+    primeira = db.session.scalar(select(func.min(StockMovement.date)).where(StockMovement.date < corte))
+    inicio = inicio_do_mes(primeira) if primeira is not None else corte
+    while inicio < corte:
+        fim = _mes_seguinte(inicio)
+        arquivadas, blocos = _arquivar_mes(corte, inicio, fim)
+        if arquivadas:
+            resumo['meses'] += 1
+            resumo['movimentacoes'] += arquivadas
+            resumo['blocos'] += blocos
+            if progresso:
+                progresso(inicio, arquivadas)
+        inicio = fim
+    return resumo
+
+
+def movimentacoes(de=None, ate=None, product_id=None, descendente=False):
+    """
+    Gera as movimentações arquivadas (MovimentacaoArquivada) com de <= date <= ate, em ordem de
+    (date, id) (ou a inversa). Descomprime um bloco por vez.
+    """
+    consulta = select(StockMovementArchive.id)
+    if de is not None:
+        consulta = consulta.where(StockMovementArchive.last_date >= de)
+    if ate is not None:
+        consulta = consulta.where(StockMovementArchive.first_date <= ate)
+    if product_id is not None:
+        consulta = consulta.where(StockMovementArchive.month.in_(
+            select(StockMovementSummary.month).where(StockMovementSummary.product_id == product_id)))
+    ordem = (StockMovementArchive.first_date, StockMovementArchive.id)
+    consulta = consulta.order_by(*(coluna.desc() for coluna in ordem) if descendente else ordem)
+    for bloco_id in db.session.scalars(consulta).all():
+        linhas, _ = _decodificar(db.session.scalar(
+            select(StockMovementArchive.data).where(StockMovementArchive.id == bloco_id)))
+        for linha in (reversed(linhas) if descendente else linhas):
+            if product_id is not None and linha.product_id != product_id:
+                continue
+            if (de is not None and linha.date < de) or (ate is not None and linha.date > ate):
+                continue
+            yield linha
+
+
+def variacao_ate_o_corte(product_id, momento, corte):
+    """
+    Soma com sinal das movimentações do produto com momento < date < corte: os meses seguintes
+    pelos resumos, o resto do mês de `momento` pelos blocos e o que ainda não saiu da tabela
+    (arquivamento interrompido).
+    """
+    mes = inicio_do_mes(momento)
+    meses_seguintes = db.session.scalar(
+        select(func.coalesce(func.sum(StockMovementSummary.units_in - StockMovementSummary.units_out), 0))
+        .where(StockMovementSummary.product_id == product_id, StockMovementSummary.month > mes.date())
+    )
+    resto_do_mes = sum(
+        linha.quantity if linha.movement_type == 'entrada' else -linha.quantity
+        for linha in movimentacoes(momento, _mes_seguinte(mes) - UM_MICROSSEGUNDO, product_id)
+        if linha.date > momento
+    )
+    na_tabela = db.session.scalar(
+        select(func.coalesce(func.sum(StockMovement.quantidade_com_sinal()), 0))
+        .where(StockMovement.product_id == product_id, StockMovement.date > momento, StockMovement.date < corte)
+    )
+    return meses_seguintes + resto_do_mes + na_tabela
+
+
+def verificar():
+    """
+    Confere o arquivo e retorna {'blocos', 'movimentacoes', 'erros': [...], 'divergentes': n, 'sem_checkpoint': n}:
+      - cada bloco descomprime, bate com o SHA-256 e tem as linhas declaradas, no mês e em ordem;
+      - os resumos mensais são iguais às somas dos blocos;
+      - entre dois cortes, a diferença dos checkpoints de cada produto é a soma dos resumos do período;
+      - nenhuma movimentação anterior ao último corte ficou na tabela;
+      - o estoque atual bate com o livro (checkpoint do corte + movimentações da tabela):
+        'divergentes' é o número de produtos em saldos.reconciliar() e 'sem_checkpoint' o de
+        saldos.sem_checkpoint() (estoque anterior ao livro, que não conta como divergência).
+    """
+    from app.services import saldos
+    erros = []
+    somas = {} # (product_id, mês) -> (entradas, saídas, movimentações)
+    blocos = movimentos = 0
+    for bloco in db.session.execute(select(StockMovementArchive).order_by(StockMovementArchive.id)).scalars():
+        blocos += 1
+        try:
+            linhas, checksum = _decodificar(bloco.data)
+        except (zlib.error, ValueError) as erro:
+            erros.append(f'Bloco {bloco.id}: conteúdo ilegível ({erro}).')
+            continue
+        mes = datetime.combine(bloco.month, datetime.min.time())
+        if checksum != bloco.checksum:
+            erros.append(f'Bloco {bloco.id}: SHA-256 diferente do gravado.')
+        if len(linhas) != bloco.rows:
+            erros.append(f'Bloco {bloco.id}: {len(linhas)} linhas, {bloco.rows} declaradas.')
+        if linhas and (linhas[0].date != bloco.first_date or linhas[-1].date != bloco.last_date):
+            erros.append(f'Bloco {bloco.id}: datas diferentes das declaradas.')
+        if any(not mes <= linha.date < _mes_seguinte(mes) for linha in linhas):
+            erros.append(f'Bloco {bloco.id}: linhas fora do mês {bloco.month:%Y-%m}.')
+        if any((a.date, a.id) >= (b.date, b.id) for a, b in zip(linhas, linhas[1:])):
+            erros.append(f'Bloco {bloco.id}: linhas fora de ordem.')
+        for linha in linhas:
+            entradas, saidas, n = somas.get((linha.product_id, bloco.month), (0, 0, 0))
+            if linha.movement_type == 'entrada':
+                entradas += linha.quantity
+            else:
+                saidas += linha.quantity
+            somas[(linha.product_id, bloco.month)] = (entradas, saidas, n + 1)
+        movimentos += len(linhas)
+        db.session.expunge(bloco) # Só um bloco descomprimido por vez na memória
+
+    for resumo in db.session.execute(select(StockMovementSummary)).scalars():
+        esperado = somas.pop((resumo.product_id, resumo.month), None)
+        if esperado != (resumo.units_in, resumo.units_out, resumo.movements):
+            erros.append(f'Resumo do produto {resumo.product_id} em {resumo.month:%Y-%m}: '
+                         f'{(resumo.units_in, resumo.units_out, resumo.movements)}, blocos: {esperado}.')
+    for product_id, mes in sorted(somas):
+        erros.append(f'Produto {product_id} em {mes:%Y-%m}: linhas arquivadas sem resumo.')
+
+    cortes = db.session.scalars(select(StockArchiveRun.cutoff).order_by(StockArchiveRun.cutoff)).all()
+    for anterior, corte in zip(cortes, cortes[1:]):
+        divergentes = db.session.scalar(_consulta_cadeia(anterior, corte))
+        if divergentes:
+            erros.append(f'{divergentes} produto(s) com checkpoint de {corte:%Y-%m-%d} diferente do de '
+                         f'{anterior:%Y-%m-%d} mais os resumos do período.')
+    if cortes:
+        restantes = db.session.scalar(
+            select(func.count()).select_from(StockMovement).where(StockMovement.date < cortes[-1]))
+        if restantes:
+            erros.append(f'{restantes} movimentação(ões) anteriores a {cortes[-1]:%Y-%m-%d} ainda na tabela '
+                         '(rode o arquivamento de novo para concluir).')
+
+    divergentes = sum(1 for _ in saldos.reconciliar())
+    sem_checkpoint = sum(1 for _ in saldos.sem_checkpoint())
+    return {'blocos': blocos, 'movimentacoes': movimentos, 'erros': erros, 'divergentes': divergentes,
+            'sem_checkpoint': sem_checkpoint}
+
+
+def _consulta_cadeia(anterior, corte):
+    """Quantos produtos têm checkpoint(corte) != checkpoint(anterior) + resumos de [anterior, corte)."""
+    def checkpoint(data):
+        return (select(StockCheckpoint.product_id, StockCheckpoint.quantity)
+                .where(StockCheckpoint.date == instante_do_checkpoint(data)).subquery())
+    inicial, final = checkpoint(anterior), checkpoint(corte)
+    periodo = (
+        select(StockMovementSummary.product_id,
+               func.sum(StockMovementSummary.units_in - StockMovementSummary.units_out).label('variacao'))
+        .where(StockMovementSummary.month >= anterior.date(), StockMovementSummary.month < corte.date())
+        .group_by(StockMovementSummary.product_id)
+        .subquery()
+    )
+    return (
+        select(func.count())
+        .select_from(final)
+        .join(inicial, inicial.c.product_id == final.c.product_id)
+        .outerjoin(periodo, periodo.c.product_id == final.c.product_id)
+        .where(final.c.quantity != inicial.c.quantity + func.coalesce(periodo.c.variacao, 0))
+    )
@@ -0,0 +1,280 @@
+import re
+
+from flask import current_app
+from sqlalchemy import and_, column, event, func, or_, select, table
+from sqlalchemy.types import Integer
+
+from app import db
+from app.models import Category, Product, Supplier
+from app.paginacao import codificar_cursor, decodificar_cursor
+
+# Busca textual de produtos por código, nome, categoria e fornecedor.
+#
+# No SQLite o índice é uma tabela FTS5 (produto_busca) com uma linha por produto (rowid = product.id)
+# e o texto das quatro colunas, mais uma tabela FTS5 só com os códigos (produto_busca_codigo). O tokenizador unicode61 com remove_diacritics ignora maiúsculas e
+# acentos ("feijao" encontra "Feijão"), e o índice de prefixos de 2 e 3 letras atende o último termo
+# enquanto o usuário ainda digita. O índice é mantido por gatilhos do próprio banco em product,
+# category e supplier, então cadastros pelo ORM, a importação em massa do catálogo e SQL direto ficam
+# todos em dia na mesma transação. A tabela e os gatilhos são criados junto com o create_all();
+# bancos criados antes disso (ou um índice suspeito) são refeitos por reconstruir()
+# (flask estoque reindexar-busca). Nos outros bancos, ou num SQLite sem FTS5, a busca usa LIKE
+# sobre as mesmas colunas, sem índice (acentos dependem da collation do banco).
+#
+# Ordenação: o bm25 do FTS5 lê a lista inteira de cada termo para calcular o peso, o que custa
+# dezenas de milissegundos para termos presentes em boa parte do catálogo. Em vez disso os
+# resultados vêm em níveis de relevância: termos no código, depois no nome, depois os que
+# dependem da categoria ou do fornecedor. Cada nível é uma consulta ao índice em ordem de
+# rowid (produtos mais novos primeiro) que para ao completar a página, e a próxima página parte do
+# cursor (nível, id): o custo de cada página não depende de quantos produtos casam com a busca.
+# O nível do código consulta a tabela própria, cujo vocabulário só tem códigos: uma busca por
+# palavras descobre na hora que ele está vazio, sem percorrer as listas dessas palavras.
+
+TABELA_INDICE = 'produto_busca'
+TABELA_CODIGOS = 'produto_busca_codigo'
+
+# Gatilhos que mantêm o índice (removidos e recriados por reconstruir)
+GATILHOS = ('produto_busca_ai', 'produto_busca_au', 'produto_busca_ad',
+            'produto_busca_categoria_au', 'produto_busca_categoria_ad',
+            'produto_busca_fornecedor_au', 'produto_busca_fornecedor_ad')
+
+# Termos considerados por busca (o resto do texto é ignorado)
+MAXIMO_TERMOS = 8
+
+# O último termo casa como prefixo a partir deste tamanho (o índice de prefixos começa em 2 letras)
+TAMANHO_MINIMO_PREFIXO = 2
+
+_TERMO = re.compile(r'\w+')
+
+_INDICE = table(TABELA_INDICE, column('rowid', Integer), column(TABELA_INDICE))
+_CODIGOS = table(TABELA_CODIGOS, column('rowid', Integer), column(TABELA_CODIGOS))
+
+_NOME_CATEGORIA = '(SELECT name FROM category WHERE id = new.category_id)'
+_NOME_FORNECEDOR = '(SELECT name FROM supplier WHERE id = new.supplier_id)'
+_INDEXAR_PRODUTO = (
+    f'INSERT OR REPLACE INTO {TABELA_INDICE}(rowid, code, name, categoria, fornecedor) '
+    f'VALUES (new.id, new.code, new.name, {_NOME_CATEGORIA}, {_NOME_FORNECEDOR}); '
+    f'INSERT OR REPLACE INTO {TABELA_CODIGOS}(rowid, code) VALUES (new.id, new.code);'
+)
+_OPCOES = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+_DDL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_INDICE} USING fts5(code, name, categoria, fornecedor, {_OPCOES})',
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_CODIGOS} USING fts5(code, {_OPCOES})',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_ai AFTER INSERT ON product BEGIN {_INDEXAR_PRODUTO} END',
+    # Só as colunas indexadas: as movimentações (quantity_in_stock, last_updated) não passam por aqui
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_au AFTER UPDATE OF code, name, category_id, supplier_id ON product '
+    f'BEGIN {_INDEXAR_PRODUTO} END',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_ad AFTER DELETE ON product '
+    f'BEGIN DELETE FROM {TABELA_INDICE} WHERE rowid = old.id; DELETE FROM {TABELA_CODIGOS} WHERE rowid = old.id; END',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_categoria_au AFTER UPDATE OF name ON category BEGIN '
+    f'UPDATE {TABELA_INDICE} SET categoria = new.name WHERE rowid IN (SELECT id FROM product WHERE category_id = new.id); END',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_categoria_ad AFTER DELETE ON category BEGIN '
+    f'UPDATE {TABELA_INDICE} SET categoria = NULL WHERE rowid IN (SELECT id FROM product WHERE category_id = old.id); END',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_fornecedor_au AFTER UPDATE OF name ON supplier BEGIN '
+    f'UPDATE {TABELA_INDICE} SET fornecedor = new.name WHERE rowid IN (SELECT id FROM product WHERE supplier_id = new.id); END',
+    f'CREATE TRIGGER IF NOT EXISTS produto_busca_fornecedor_ad AFTER DELETE ON supplier BEGIN '
+    f'UPDATE {TABELA_INDICE} SET fornecedor = NULL WHERE rowid IN (SELECT id FROM product WHERE supplier_id = old.id); END',
+)
+
+_PREENCHER = (
+    f'INSERT INTO {TABELA_INDICE}(rowid, code, name, categoria, fornecedor) '
+    'SELECT product.id, product.code, product.name, category.name, supplier.name FROM product '
+    'LEFT JOIN category ON category.id = product.category_id '
+    'LEFT JOIN supplier ON supplier.id = product.supplier_id',
+    f'INSERT INTO {TABELA_CODIGOS}(rowid, code) SELECT id, code FROM product',
+)
+
+
+def init_app(app):
+    """Cria o cache do worker que guarda se o banco tem o índice FTS5."""
+    app.extensions['busca'] = {}
+
+
+def _fts5_disponivel(conexao):
+    return conexao.dialect.name == 'sqlite' and bool(
+        conexao.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def _existe(conexao):
+    return conexao.exec_driver_sql(
+        'SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?', ('table', TABELA_INDICE)).first() is not None
+
+
+def _criar(conexao):
+    """Cria as tabelas FTS5 e os gatilhos que ainda não existirem; devolve True se o índice foi criado agora."""
+    criada = not _existe(conexao)
+    for comando in _DDL:
+        conexao.exec_driver_sql(comando)
+    return criada
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _apos_create_all(metadata, conexao, **_):
+    """Cria o índice junto com as tabelas; num banco que já tinha produtos, indexa os existentes."""
+    if _fts5_disponivel(conexao) and _criar(conexao):
+        for comando in _PREENCHER:
+            conexao.exec_driver_sql(comando)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _apos_drop_all(metadata, conexao, **_):
+    if conexao.dialect.name == 'sqlite':
+        for tabela in (TABELA_INDICE, TABELA_CODIGOS):
+            conexao.exec_driver_sql(f'DROP TABLE IF EXISTS {tabela}')
+
+
+def reconstruir():
+    """
+    Apaga e recria o índice e os gatilhos a partir dos produtos cadastrados, numa única transação.
+    Devolve quantos produtos foram indexados. Levanta ValueError se o banco não for um SQLite com FTS5
+    (nesse caso a busca usa LIKE e não há índice a reconstruir).
+    """
+    conexao = db.session.connection()
+    if not _fts5_disponivel(conexao):
+        raise ValueError('O índice de busca exige SQLite com FTS5; neste banco a busca usa LIKE, sem índice.')
+    for gatilho in GATILHOS:
+        conexao.exec_driver_sql(f'DROP TRIGGER IF EXISTS {gatilho}')
+    for tabela in (TABELA_INDICE, TABELA_CODIGOS):
+        conexao.exec_driver_sql(f'DROP TABLE IF EXISTS {tabela}')
+    _criar(conexao)
+    indexados = conexao.exec_driver_sql(_PREENCHER[0]).rowcount
+    for comando in _PREENCHER[1:]:
+        conexao.exec_driver_sql(comando)
+    # Junta os segmentos gravados pela carga num só (consultas percorrem menos b-trees)
+    for tabela in (TABELA_INDICE, TABELA_CODIGOS):
+        conexao.exec_driver_sql(f"INSERT INTO {tabela}({tabela}) VALUES ('optimize')")
+    db.session.commit()
+    current_app.extensions['busca']['indice'] = True
+    return indexados
+
+
+def _usa_indice():
+    """Indica se a busca usa o índice FTS5 (guardado no worker quando ele existe) ou LIKE."""
+    cache = current_app.extensions['busca']
+    if 'indice' in cache:
+        return cache['indice']
+    conexao = db.session.connection()
+    if conexao.dialect.name != 'sqlite':
+        cache['indice'] = False
+        return False
+    # SQLite sem o índice (banco antigo): não guarda, para enxergar o reindexar-busca sem reinício
+    if _existe(conexao):
+        cache['indice'] = True
+        return True
+    return False
+
+
+def termos_da_busca(texto):
+    """Palavras do texto digitado, no máximo MAXIMO_TERMOS."""
+    termos = _TERMO.findall(texto or '')[:MAXIMO_TERMOS]
+    # Uma última letra solta ainda está sendo digitada: como termo exato esvaziaria o resultado
+    if len(termos) > 1 and len(termos[-1]) < TAMANHO_MINIMO_PREFIXO:
+        termos.pop()
+    return termos
+
+
+def _expressao(termos):
+    """Expressão MATCH com todos os termos (o último como prefixo): '"arroz" "integ"*'."""
+    partes = [f'"{termo}"' for termo in termos]
+    if len(termos[-1]) >= TAMANHO_MINIMO_PREFIXO:
+        partes[-1] += '*'
+    return ' '.join(partes)
+
+
+def _niveis(termos):
+    """
+    (coluna de id, condição) de cada nível de relevância (código, nome, demais) e de todos os
+    níveis juntos, pelo índice FTS5 ou, sem ele, por LIKE.
+    """
+    if _usa_indice():
+        casar = _INDICE.c[TABELA_INDICE].match
+        todos = _expressao(termos)
+        codigo = _CODIGOS.c[TABELA_CODIGOS].match(todos)
+        # Exclusão dos produtos do nível do código: em geral vazia, é lida uma vez por consulta
+        fora_do_codigo = _INDICE.c.rowid.notin_(select(_CODIGOS.c.rowid).where(codigo))
+        nome = f'{{name}} : ({todos})'
+        niveis = [
+            (_CODIGOS.c.rowid, codigo),
+            (_INDICE.c.rowid, and_(casar(nome), fora_do_codigo)),
+            (_INDICE.c.rowid, and_(casar(f'({todos}) NOT {nome}'), fora_do_codigo)),
+        ]
+        return niveis, (_INDICE.c.rowid, casar(todos))
+
+    def contem(coluna):
+        return [coluna.icontains(termo, autoescape=True) for termo in termos]
+
+    categorias = [select(Category.id).where(condicao) for condicao in contem(Category.name)]
+    fornecedores = [select(Supplier.id).where(condicao) for condicao in contem(Supplier.name)]
+    codigo, nome = and_(*contem(Product.code)), and_(*contem(Product.name))
+    todos = and_(*(
+        or_(no_codigo, no_nome, Product.category_id.in_(categoria), Product.supplier_id.in_(fornecedor))
+        for no_codigo, no_nome, categoria, fornecedor
+        in zip(contem(Product.code), contem(Product.name), categorias, fornecedores)
+    ))
+    niveis = [codigo, and_(nome, ~codigo), and_(todos, ~nome, ~codigo)]
+    return [(Product.id, condicao) for condicao in niveis], (Product.id, todos)
+
+
+def _consulta(coluna, condicao, filtros):
+    consulta = select(coluna).where(condicao)
+    if filtros:
+        if coluna is not Product.id:
+            # "+ 0": o SQLite não pode buscar o índice por rowid a partir do produto, então percorre
+            # o MATCH e lê cada produto pela chave, em vez de rodar o MATCH para cada produto do filtro
+            consulta = consulta.join(Product, Product.id == coluna + 0)
+        consulta = consulta.where(*filtros)
+    return consulta
+
+
+def _contar(coluna, condicao, filtros):
+    return db.session.scalar(select(func.count()).select_from(_consulta(coluna, condicao, filtros).subquery()))
+
+
+def pesquisar(texto, tamanho, cursor=None, filtros=(), inicio=0):
+    """
+    Ids dos produtos que têm todas as palavras do texto (em qualquer das colunas), em ordem de
+    relevância, e o cursor da próxima página (None na última).
+
+    filtros: condições sobre Product (categoria, estoque baixo...) aplicadas junto com a busca.
+    inicio: deslocamento, usado apenas sem cursor (salto direto de página; conta os níveis pulados).
+    Levanta ValueError se o cursor for inválido.
+    """
+    termos = termos_da_busca(texto)
+    if not termos:
+        return [], None
+    niveis, _ = _niveis(termos)
+
+    nivel, ultimo_id = 0, None
+    if cursor is not None:
+        nivel, ultimo_id = decodificar_cursor(cursor)
+        if not isinstance(nivel, int) or not 0 <= nivel < len(niveis):
+            raise ValueError('Cursor de paginação inválido.')
+        inicio = 0
+    while inicio and nivel < len(niveis):
+        quantidade = _contar(*niveis[nivel], filtros)
+        if inicio < quantidade:
+            break
+        inicio -= quantidade
+        nivel += 1
+
+    encontrados = [] # (nivel, id); um a mais que a página para saber se há próxima
+    while nivel < len(niveis) and len(encontrados) <= tamanho:
+        coluna, condicao = niveis[nivel]
+        consulta = _consulta(coluna, condicao, filtros)
+        if ultimo_id is not None:
+            consulta = consulta.where(coluna < ultimo_id)
+        consulta = consulta.order_by(coluna.desc()).offset(inicio or None).limit(tamanho + 1 - len(encontrados))
+        encontrados += [(nivel, product_id) for product_id in db.session.scalars(consulta)]
+        nivel, ultimo_id, inicio = nivel + 1, None, 0
+
+    proximo_cursor = codificar_cursor(*encontrados[tamanho - 1]) if len(encontrados) > tamanho else None
+    return [product_id for _, product_id in encontrados[:tamanho]], proximo_cursor
+
+
+def contar(texto, filtros=()):
+    """Total de produtos encontrados pela busca (percorre todos, então só deve ser pedido quando necessário)."""
+    termos = termos_da_busca(texto)
+    if not termos:
+        return 0
+    _, (coluna, condicao) = _niveis(termos)
+    return _contar(coluna, condicao, filtros)
@@ -0,0 +1,358 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from sqlalchemy import select, insert, update
+
+from app import db
+from app.models import Product, Category, Supplier, StockMovement
+from app.services import locais
+
+# Importação e exportação do catálogo (produtos, categorias e fornecedores) em CSV ou JSON Lines.
+# Tudo é processado em blocos de tamanho fixo: a exportação lê o banco com yield_per e
+# devolve o arquivo aos pedaços; a importação lê o arquivo bloco a bloco e grava cada bloco
+# com inserts/updates em massa. O uso de memória não depende do tamanho do arquivo.
+
+FORMATOS = ('csv', 'jsonl')
+ENTIDADES = ('produtos', 'categorias', 'fornecedores')
+
+# Colunas de cada entidade, na ordem em que aparecem no arquivo
+CAMPOS = {
+    'produtos': ['code', 'name', 'price', 'quantity_in_stock', 'minimum_stock', 'category', 'supplier'],
+    'categorias': ['name'],
+    'fornecedores': ['name', 'contact_info'],
+}
+
+TAMANHO_BLOCO = 1000
+
+# Product.price é Numeric(10, 2): o preço precisa ficar abaixo de 10^8
+PRECO_LIMITE = Decimal('100000000')
+
+# Maior quantidade aceita (inteiro de 64 bits com sinal, o INTEGER do SQLite e o BIGINT do PostgreSQL)
+QUANTIDADE_LIMITE = 2 ** 63 - 1
+
+# Motivo da movimentação de abertura dos produtos novos com estoque
+MOTIVO_ESTOQUE_INICIAL = 'Estoque inicial (importação do catálogo)'
+
+# Quantos erros de linha guardamos para o relatório (o restante é só contado)
+MAXIMO_ERROS_LISTADOS = 100
+
+
+class ImportacaoError(Exception):
+    """Erro que impede a importação de começar (formato ou entidade inválidos, arquivo ilegível)."""
+
+
+def _consulta_exportacao(entidade):
+    """Monta o SELECT de exportação da entidade, com as colunas na ordem de CAMPOS."""
+    if entidade == 'produtos':
+        return (
+            select(Product.code, Product.name, Product.price, Product.quantity_in_stock,
+                   Product.minimum_stock, Category.name.label('category'), Supplier.name.label('supplier'))
+            .outerjoin(Category, Product.category_id == Category.id)
+            .outerjoin(Supplier, Product.supplier_id == Supplier.id)
+            .order_by(Product.id)
+        )
+    if entidade == 'categorias':
+        return select(Category.name).order_by(Category.id)
+    if entidade == 'fornecedores':
+        return select(Supplier.name, Supplier.contact_info).order_by(Supplier.id)
+    raise ImportacaoError(f'Entidade inválida: {entidade}')
+
+
+def _serializavel(valor):
+    """Converte valores do banco para texto/JSON (Decimal vira string para não perder centavos)."""
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def exportar(entidade, formato, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Gera o conteúdo da exportação aos pedaços (um pedaço por bloco de linhas).
+    Pode ser usado direto como corpo de uma resposta em streaming ou escrito num arquivo.
+    """
+    if formato not in FORMATOS:
+        raise ImportacaoError(f'Formato inválido: {formato}')
+    consulta = _consulta_exportacao(entidade)
+    campos = CAMPOS[entidade]
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer) if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(campos)
+
+    resultado = db.session.execute(consulta.execution_options(yield_per=tamanho_bloco))
+    for particao in resultado.partitions():
+        for linha in particao:
+            valores = [_serializavel(valor) for valor in linha]
+            if escritor:
+                escritor.writerow(['' if valor is None else valor for valor in valores])
+            else:
+                buffer.write(json.dumps(dict(zip(campos, valores)), ensure_ascii=False))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Arquivo vazio ainda precisa do cabeçalho no CSV
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ler_registros(arquivo, formato):
+    """Lê o arquivo (objeto texto) e gera (número da linha, dict) um registro por vez."""
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    elif formato == 'jsonl':
+        for numero, texto in enumerate(arquivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                registro = json.loads(texto)
+            except ValueError:
+                registro = None
+            yield numero, registro if isinstance(registro, dict) else None
+    else:
+        raise ImportacaoError(f'Formato inválido: {formato}')
+
+
+def _texto(valor):
+    """Normaliza um campo textual (None e strings vazias viram None)."""
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _inteiro(valor, padrao):
+    valor = _texto(valor)
+    return padrao if valor is None else int(valor)
+
+
+def _normalizar_produto(registro):
+    """Valida e converte um registro de produto. Levanta ValueError com a mensagem do problema."""
+    if registro is None:
+        raise ValueError('Linha ilegível.')
+    code = _texto(registro.get('code'))
+    name = _texto(registro.get('name'))
+    if not code or len(code) > 64:
+        raise ValueError('Código ausente ou maior que 64 caracteres.')
+    if not name or len(name) > 128:
+        raise ValueError('Nome ausente ou maior que 128 caracteres.')
+    try:
+        # NaN e Infinity são aceitos pelo Decimal, mas não cabem na coluna (e NaN < 0 levanta InvalidOperation)
+        price = Decimal(_texto(registro.get('price')) or '')
+        if not price.is_finite():
+            raise InvalidOperation
+        price = price.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('Preço inválido.')
+    if price < 0:
+        raise ValueError('O preço deve ser um número positivo.')
+    if price >= PRECO_LIMITE:
+        raise ValueError(f'O preço deve ser menor que {PRECO_LIMITE}.')
+    try:
+        quantidade = _inteiro(registro.get('quantity_in_stock'), 0)
+        minimo = _inteiro(registro.get('minimum_stock'), 5)
+    except ValueError:
+        raise ValueError('Quantidade ou estoque mínimo inválidos.')
+    if quantidade < 0 or minimo < 0:
+        raise ValueError('Quantidade e estoque mínimo devem ser positivos ou zero.')
+    if quantidade > QUANTIDADE_LIMITE or minimo > QUANTIDADE_LIMITE:
+        raise ValueError(f'Quantidade e estoque mínimo devem ser no máximo {QUANTIDADE_LIMITE}.')
+    # Categorias e fornecedores que ainda não existem são criados com estes nomes
+    category = _texto(registro.get('category'))
+    supplier = _texto(registro.get('supplier'))
+    if category and len(category) > 64:
+        raise ValueError('Categoria maior que 64 caracteres.')
+    if supplier and len(supplier) > 64:
+        raise ValueError('Fornecedor maior que 64 caracteres.')
+    return {
+        'code': code,
+        'name': name,
+        'price': price,
+        'quantity_in_stock': quantidade,
+        'minimum_stock': minimo,
+        'category': category,
+        'supplier': supplier,
+    }
+
+
+def _garantir_nomes(modelo, nomes, mapa):
+    """
+    Garante que cada nome exista na tabela (Category ou Supplier), criando os que faltam
+    com um insert em massa, e atualiza o mapa nome -> id.
+    """
+    faltando = [nome for nome in nomes if nome and nome not in mapa]
+    if not faltando:
+        return
+    db.session.execute(insert(modelo), [{'name': nome} for nome in faltando])
+    mapa.update(db.session.execute(select(modelo.name, modelo.id).where(modelo.name.in_(faltando))).all())
+
+
+def _importar_bloco_produtos(bloco, mapas, estatisticas):
+    """
+    Grava um bloco de produtos: insere os novos (com uma entrada de abertura para o estoque
+    inicial) e atualiza os existentes (pelo código).
+    """
+    por_codigo = {}
+    for numero, registro in bloco:
+        try:
+            produto = _normalizar_produto(registro)
+        except ValueError as erro:
+            _registrar_erro(estatisticas, numero, str(erro))
+            continue
+        por_codigo[produto['code']] = produto # Código repetido no mesmo bloco: vale a última linha
+    if not por_codigo:
+        return
+
+    _garantir_nomes(Category, {p['category'] for p in por_codigo.values()}, mapas['categorias'])
+    _garantir_nomes(Supplier, {p['supplier'] for p in por_codigo.values()}, mapas['fornecedores'])
+
+    existentes = dict(db.session.execute(
+        select(Product.code, Product.id).where(Product.code.in_(list(por_codigo)))
+    ).all())
+
+    agora = datetime.utcnow()
+    novos, alterados = [], []
+    for code, produto in por_codigo.items():
+        valores = {
+            'code': code,
+            'name': produto['name'],
+            'price': produto['price'],
+            'minimum_stock': produto['minimum_stock'],
+            'category_id': mapas['categorias'].get(produto['category']),
+            'supplier_id': mapas['fornecedores'].get(produto['supplier']),
+            'last_updated': agora,
+        }
+        if code in existentes:
+            # Produtos existentes não têm o saldo alterado pela importação:
+            # mudanças de estoque passam pelas movimentações (entrada/saída)
+            valores['id'] = existentes[code]
+            alterados.append(valores)
+        else:
+            valores['quantity_in_stock'] = produto['quantity_in_stock']
+            novos.append(valores)
+
+    if novos:
+        db.session.execute(insert(Product), novos)
+        # Movimentação de abertura do estoque inicial: o livro (saldos.reconciliar) começa igual ao saldo
+        iniciais = {valores['code']: valores['quantity_in_stock']
+                    for valores in novos if valores['quantity_in_stock'] > 0}
+        if iniciais:
+            location_id = locais.padrao_id()
+            ids = db.session.execute(select(Product.code, Product.id).where(Product.code.in_(list(iniciais))))
+            db.session.execute(insert(StockMovement), [
+                {'date': agora, 'movement_type': 'entrada', 'quantity': iniciais[code],
+                 'reason': MOTIVO_ESTOQUE_INICIAL, 'product_id': product_id, 'location_id': location_id}
+                for code, product_id in ids
+            ])
+    if alterados:
+        # UPDATE em massa pela chave primária (bulk update do ORM)
+        db.session.execute(update(Product), alterados)
+    estatisticas['inseridos'] += len(novos)
+    estatisticas['atualizados'] += len(alterados)
+
+
+def _importar_bloco_nomes(modelo, bloco, estatisticas):
+    """Grava um bloco de categorias ou fornecedores (chave natural: name)."""
+    por_nome = {}
+    for numero, registro in bloco:
+        nome = _texto(registro.get('name')) if registro else None
+        if not nome or len(nome) > 64:
+            _registrar_erro(estatisticas, numero, 'Nome ausente ou maior que 64 caracteres.')
+            continue
+        valores = {'name': nome}
+        if modelo is Supplier:
+            contato = _texto(registro.get('contact_info'))
+            if contato and len(contato) > 128:
+                _registrar_erro(estatisticas, numero, 'Informações de contato maiores que 128 caracteres.')
+                continue
+            valores['contact_info'] = contato
+        por_nome[nome] = valores
+    if not por_nome:
+        return
+
+    existentes = dict(db.session.execute(
+        select(modelo.name, modelo.id).where(modelo.name.in_(list(por_nome)))
+    ).all())
+    novos = [valores for nome, valores in por_nome.items() if nome not in existentes]
+    if novos:
+        db.session.execute(insert(modelo), novos)
+    if modelo is Supplier:
+        alterados = [dict(valores, id=existentes[nome]) for nome, valores in por_nome.items() if nome in existentes]
+        if alterados:
+            db.session.execute(update(modelo), alterados)
+        estatisticas['atualizados'] += len(alterados)
+    estatisticas['inseridos'] += len(novos)
+
+
+def _registrar_erro(estatisticas, numero, mensagem):
+    estatisticas['erros'] += 1
+    if len(estatisticas['detalhes_erros']) < MAXIMO_ERROS_LISTADOS:
+        estatisticas['detalhes_erros'].append({'linha': numero, 'erro': mensagem})
+
+
+def _em_blocos(registros, tamanho):
+    """Agrupa um iterador em listas de até `tamanho` itens, sem materializar o iterador inteiro."""
+    while True:
+        bloco = list(islice(registros, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+
+def importar(arquivo, entidade, formato, tamanho_bloco=TAMANHO_BLOCO, progresso=None):
+    """
+    Importa um arquivo (objeto texto aberto) para o catálogo, bloco a bloco.
+
+    Produtos são atualizados pelo código (upsert); categorias e fornecedores citados
+    e inexistentes são criados automaticamente. Cada bloco é gravado e confirmado
+    (commit) separadamente, então uma falha no meio preserva os blocos anteriores.
+    `progresso`, se informado, é chamado após cada bloco com o dicionário de estatísticas.
+
+    Retorna as estatísticas: lidos, inseridos, atualizados, erros, detalhes_erros,
+    segundos e linhas_por_segundo.
+    """
+    if entidade not in ENTIDADES:
+        raise ImportacaoError(f'Entidade inválida: {entidade}')
+    if formato not in FORMATOS:
+        raise ImportacaoError(f'Formato inválido: {formato}')
+
+    estatisticas = {'lidos': 0, 'inseridos': 0, 'atualizados': 0, 'erros': 0, 'detalhes_erros': [],
+                    'segundos': 0.0, 'linhas_por_segundo': 0.0}
+    mapas = None
+    if entidade == 'produtos':
+        # Mapas nome -> id carregados uma vez; crescem só com o número de categorias/fornecedores
+        mapas = {
+            'categorias': dict(db.session.execute(select(Category.name, Category.id)).all()),
+            'fornecedores': dict(db.session.execute(select(Supplier.name, Supplier.id)).all()),
+        }
+
+    inicio = time.perf_counter()
+    try:
+        for bloco in _em_blocos(_ler_registros(arquivo, formato), tamanho_bloco):
+            estatisticas['lidos'] += len(bloco)
+            if entidade == 'produtos':
+                _importar_bloco_produtos(bloco, mapas, estatisticas)
+            else:
+                _importar_bloco_nomes(Category if entidade == 'categorias' else Supplier, bloco, estatisticas)
+            db.session.commit()
+
+            estatisticas['segundos'] = time.perf_counter() - inicio
+            estatisticas['linhas_por_segundo'] = estatisticas['lidos'] / max(estatisticas['segundos'], 1e-9)
+            if progresso:
+                progresso(estatisticas)
+    except (UnicodeDecodeError, csv.Error) as erro:
+        db.session.rollback()
+        raise ImportacaoError(f'Arquivo ilegível: {erro}') from erro
+    except Exception:
+        db.session.rollback()
+        raise
+    return estatisticas
@@ -0,0 +1,188 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select, update, delete, insert, and_, func
+
+from app import db
+from app.models import Product, Sale, SaleItem, SalesRollup, Category, Supplier, User
+
+# Consolidados de vendas (tabela SalesRollup) e relatórios lidos a partir deles.
+#
+# Cada venda finalizada soma sua receita e suas unidades nas linhas de consolidado do dia e do mês,
+# por categoria, fornecedor e vendedor, na mesma transação da venda. Os relatórios leem só
+# as linhas do período pedido, então o custo não cresce com o histórico de vendas.
+# A categoria/fornecedor considerados são os do produto no momento da venda (ou, na
+# reconstrução, os atuais, pois o cadastro não guarda histórico).
+
+PERIODOS = ('dia', 'mes')
+DIMENSOES = ('categoria', 'fornecedor', 'vendedor')
+
+# Colunas que identificam uma linha de consolidado (a chave única de SalesRollup)
+CHAVE = ('period', 'period_start', 'dimension', 'dimension_id', 'product_id')
+
+
+def inicio_periodo(periodo, data):
+    """Primeiro dia do período ('dia' ou 'mes') que contém `data`."""
+    dia = data.date() if hasattr(data, 'date') else data
+    return dia if periodo == 'dia' else dia.replace(day=1)
+
+
+def _acumular(acumulado, data, user_id, product_id, category_id, supplier_id, receita, unidades):
+    """Soma uma linha de venda em todas as chaves de consolidado que ela afeta."""
+    dimensoes = (('categoria', category_id or 0), ('fornecedor', supplier_id or 0), ('vendedor', user_id or 0))
+    for periodo in PERIODOS:
+        inicio = inicio_periodo(periodo, data)
+        for dimensao, dimensao_id in dimensoes:
+            for produto in (0, product_id): # Total da dimensão e total do produto dentro dela
+                chave = (periodo, inicio, dimensao, dimensao_id, produto)
+                receita_atual, unidades_atuais = acumulado.get(chave, (Decimal('0.00'), 0))
+                acumulado[chave] = (receita_atual + receita, unidades_atuais + unidades)
+
+
+def _gravar(acumulado):
+    """
+    Soma os valores acumulados nas linhas de SalesRollup (upsert em massa).
+    Usa INSERT ... ON CONFLICT DO UPDATE no SQLite e no PostgreSQL.
+    """
+    if not acumulado:
+        return
+    # Sempre na ordem da chave: as linhas de total da dimensão (product_id=0) são comuns a muitas
+    # vendas, e duas vendas que as travassem em ordens diferentes (a do carrinho) podem entrar em
+    # deadlock num banco com lock de linha (PostgreSQL)
+    linhas = [
+        dict(zip(CHAVE, chave), revenue=receita, units=unidades)
+        for chave, (receita, unidades) in sorted(acumulado.items())
+    ]
+    tabela = SalesRollup.__table__
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    elif dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    else:
+        # Outros bancos: UPDATE e, se a linha ainda não existe, INSERT
+        for linha in linhas:
+            resultado = db.session.execute(
+                update(tabela)
+                .where(and_(*(tabela.c[coluna] == linha[coluna] for coluna in CHAVE)))
+                .values(revenue=tabela.c.revenue + linha['revenue'], units=tabela.c.units + linha['units'])
+            )
+            if resultado.rowcount == 0:
+                db.session.execute(insert(tabela), [linha])
+        return
+
+    comando = insert_dialeto(tabela)
+    comando = comando.on_conflict_do_update(
+        index_elements=list(CHAVE),
+        set_={'revenue': tabela.c.revenue + comando.excluded.revenue,
+              'units': tabela.c.units + comando.excluded.units},
+    )
+    db.session.execute(comando, linhas)
+
+
+def registrar_venda(data, user_id, itens):
+    """
+    Atualiza os consolidados com os itens de uma venda. Não faz commit: deve ser chamada
+    dentro da transação que grava a venda. Cada item precisa de product_id, category_id,
+    supplier_id, quantity e subtotal.
+    """
+    acumulado = {}
+    for item in itens:
+        _acumular(acumulado, data, user_id, item['product_id'], item['category_id'], item['supplier_id'],
+                  Decimal(item['subtotal']), item['quantity'])
+    _gravar(acumulado)
+
+
+def _proximo_mes(dia):
+    return date(dia.year + dia.month // 12, dia.month % 12 + 1, 1)
+
+
+def reconstruir(desde=None, tamanho_bloco=5000, progresso=None):
+    """
+    Reconstrói os consolidados a partir de Sale/SaleItem (desde o início do mês de `desde`,
+    ou de todo o histórico). O histórico é processado um mês por vez: os itens do mês são lidos
+    com yield_per, somados em memória e gravados com um commit por mês, então a memória usada
+    é a de um mês de consolidados. `progresso`, se informado, recebe o primeiro dia de cada mês gravado.
+    Retorna o número de itens de venda processados.
+    """
+    primeira_venda, ultima_venda = db.session.execute(select(func.min(Sale.date), func.max(Sale.date))).one()
+    inicio = inicio_periodo('mes', desde) if desde else None
+    mes = inicio
+    if primeira_venda is not None:
+        mes = max(inicio, inicio_periodo('mes', primeira_venda)) if inicio else inicio_periodo('mes', primeira_venda)
+        # Consolidados (do intervalo reconstruído) anteriores ao primeiro mês com vendas
+        remocao = delete(SalesRollup).where(SalesRollup.period_start < mes)
+        if inicio:
+            remocao = remocao.where(SalesRollup.period_start >= inicio)
+        db.session.execute(remocao)
+
+    processados = 0
+    while primeira_venda is not None and mes <= ultima_venda.date():
+        fim = _proximo_mes(mes)
+        consulta = (
+            select(Sale.date, Sale.user_id, SaleItem.product_id, Product.category_id, Product.supplier_id,
+                   SaleItem.subtotal, SaleItem.quantity)
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .join(Product, Product.id == SaleItem.product_id)
+            .where(Sale.date >= mes, Sale.date < fim)
+        )
+        acumulado = {}
+        # A leitura do mês termina antes de qualquer escrita na mesma conexão
+        for linha in db.session.execute(consulta.execution_options(yield_per=tamanho_bloco)):
+            _acumular(acumulado, linha.date, linha.user_id, linha.product_id, linha.category_id,
+                      linha.supplier_id, Decimal(linha.subtotal), linha.quantity)
+            processados += 1
+        # O mês é apagado e regravado na mesma transação: os relatórios nunca o veem vazio
+        db.session.execute(delete(SalesRollup).where(SalesRollup.period_start >= mes, SalesRollup.period_start < fim))
+        _gravar(acumulado)
+        db.session.commit()
+        if progresso:
+            progresso(mes)
+        mes = fim
+
+    # Consolidados posteriores à última venda (ou todos, se não há vendas) não correspondem a nada
+    remocao = delete(SalesRollup)
+    if mes:
+        remocao = remocao.where(SalesRollup.period_start >= mes)
+    db.session.execute(remocao)
+    db.session.commit()
+    return processados
+
+
+def _coluna_nome(dimensao):
+    """Tabela e coluna de nome de cada dimensão (para exibir nos relatórios)."""
+    if dimensao == 'categoria':
+        return Category, Category.name
+    if dimensao == 'fornecedor':
+        return Supplier, Supplier.name
+    return User, User.username
+
+
+def relatorio_vendas(periodo, dimensao, de, ate):
+    """
+    Receita e unidades por período e por item da dimensão, entre as datas `de` e `ate` (inclusive).
+    Lê apenas as linhas de total (product_id = 0) dos consolidados.
+    """
+    modelo, nome = _coluna_nome(dimensao)
+    return db.session.execute(
+        select(SalesRollup.period_start, SalesRollup.dimension_id, nome.label('nome'),
+               SalesRollup.revenue, SalesRollup.units)
+        .outerjoin(modelo, modelo.id == SalesRollup.dimension_id)
+        .where(SalesRollup.period == periodo, SalesRollup.dimension == dimensao, SalesRollup.product_id == 0,
+               SalesRollup.period_start >= inicio_periodo(periodo, de),
+               SalesRollup.period_start <= ate)
+        .order_by(SalesRollup.period_start, SalesRollup.revenue.desc())
+    ).all()
+
+
+def mais_vendidos(periodo, inicio, dimensao, dimensao_id, limite=10):
+    """Produtos com maior receita num período, dentro de uma categoria, fornecedor ou vendedor."""
+    return db.session.execute(
+        select(SalesRollup.product_id, Product.code, Product.name, SalesRollup.revenue, SalesRollup.units)
+        .join(Product, Product.id == SalesRollup.product_id)
+        .where(SalesRollup.period == periodo, SalesRollup.period_start == inicio_periodo(periodo, inicio),
+               SalesRollup.dimension == dimensao, SalesRollup.dimension_id == dimensao_id,
+               SalesRollup.product_id != 0)
+        .order_by(SalesRollup.revenue.desc())
+        .limit(limite)
+    ).all()
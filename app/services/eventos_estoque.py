@@ -0,0 +1,297 @@
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import Product, StockMovement
+from app.services import locais
+
+# Saldos de estoque ao vivo (Server-Sent Events) para a listagem de produtos.
+#
+# Toda transação que mexe no saldo ou no cadastro de um produto anota o id do produto em
+# session.info: movimentações (StockMovement) e produtos gravados pelo ORM (eventos de mapper)
+# ou em massa (evento do_orm_execute, usado pelo lote, pelas vendas e pela importação).
+# Depois do commit, se houver clientes conectados neste worker, o saldo desses produtos é lido numa
+# conexão nova e o canal do worker (pub/sub em memória) entrega a cada cliente um delta compacto
+# [id, quantidade, abaixo_do_minimo]. Leitura e entrega acontecem sob uma trava do canal: os lotes
+# saem na ordem das leituras e cada leitura vê ao menos o que a anterior viu, então um commit mais
+# antigo nunca sobrescreve no cliente o saldo de um mais novo.
+#
+# Com vários workers, um commit feito em outro processo não passa por este canal. No modo
+# 'banco' (ESTOQUE_EVENTOS_MODO), uma thread por worker consulta periodicamente os produtos com
+# last_updated recente (índice ix_product_last_updated_id) e os das movimentações recentes (índice
+# ix_stock_movement_date_id; cobre os produtos fragmentados), só enquanto há clientes conectados.
+# O que já foi entregue com o mesmo valor é descartado; essa memória é esquecida quando o último
+# cliente se desconecta (um cliente novo carrega a tabela, que pode ter mudado sem ninguém ouvindo).
+#
+# Cada cliente conectado custa uma fila curta de lotes e um Event. A thread que atende a conexão
+# fica parada no Event (sem sessão do banco aberta) e manda um comentário de batimento de
+# tempos em tempos. Um cliente lento demais perde a fila e recebe 'resync' (recarrega a tabela).
+
+# Quantos produtos o canal lembra para descartar deltas repetidos
+MAXIMO_ULTIMOS = 10000
+
+# Ids por consulta ao ler os saldos alterados (abaixo do limite de parâmetros do SQLite)
+TAMANHO_BLOCO_IDS = 5000
+
+# Produtos alterados por consulta do vigia; acima disso os clientes recarregam a tabela
+LIMITE_VIGIA = 5000
+
+
+class CanalCheioError(Exception):
+    """Levantada quando o worker já atende o número máximo de clientes de eventos."""
+
+
+class Assinatura:
+    """Fila de lotes de deltas de um cliente conectado."""
+    __slots__ = ('fila', 'sinal', 'perdeu')
+
+    def __init__(self, tamanho_fila):
+        self.fila = deque(maxlen=tamanho_fila)
+        self.sinal = threading.Event()
+        self.perdeu = False
+
+
+class CanalEstoque:
+    """Pub/sub do worker: publicar() entrega cada lote de deltas a todas as assinaturas."""
+
+    def __init__(self, maximo_clientes, tamanho_fila):
+        self.maximo_clientes = maximo_clientes
+        self.tamanho_fila = tamanho_fila
+        self._assinaturas = set()
+        self._ultimos = OrderedDict() # product_id -> (quantidade, abaixo_do_minimo) já publicado
+        self._trava = threading.Lock()
+        self._ordem = threading.Lock() # Uma leitura + entrega por vez (ver publicar)
+
+    def __len__(self):
+        return len(self._assinaturas)
+
+    def assinar(self):
+        with self._trava:
+            if len(self._assinaturas) >= self.maximo_clientes:
+                raise CanalCheioError('Clientes demais conectados aos eventos de estoque neste servidor.')
+            assinatura = Assinatura(self.tamanho_fila)
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+            if not self._assinaturas:
+                self._ultimos.clear()
+
+    def publicar(self, ids, ler):
+        """
+        Lê os deltas (product_id, quantidade, abaixo_do_minimo) dos produtos com ler(ids), de dados já
+        gravados, e os publica, ignorando os já publicados. A leitura fica dentro da trava de ordem:
+        dois commits concorrentes nunca entregam o saldo mais antigo por último.
+        """
+        with self._ordem:
+            if self._assinaturas:
+                self._entregar(ler(ids))
+
+    def _entregar(self, deltas):
+        with self._trava:
+            novos = []
+            for product_id, quantidade, abaixo in deltas:
+                if self._ultimos.get(product_id) == (quantidade, abaixo):
+                    continue
+                self._ultimos[product_id] = (quantidade, abaixo)
+                self._ultimos.move_to_end(product_id)
+                novos.append([product_id, quantidade, abaixo])
+            while len(self._ultimos) > MAXIMO_ULTIMOS:
+                self._ultimos.popitem(last=False)
+            if not novos:
+                return
+            # Serializado uma vez para todos os clientes: a fila guarda o texto dos deltas, sem os colchetes
+            texto = json.dumps(novos, separators=(',', ':'))[1:-1]
+            for assinatura in self._assinaturas:
+                if len(assinatura.fila) == assinatura.fila.maxlen:
+                    assinatura.perdeu = True # O lote mais antigo vai ser descartado pelo deque
+                assinatura.fila.append(texto)
+                assinatura.sinal.set()
+
+    def resincronizar(self):
+        """Pede a todos os clientes que recarreguem a tabela (alterações demais para enviar uma a uma)."""
+        with self._trava:
+            self._ultimos.clear()
+            for assinatura in self._assinaturas:
+                assinatura.perdeu = True
+                assinatura.sinal.set()
+
+
+def fluxo(canal, assinatura, batimento):
+    """
+    Corpo da resposta text/event-stream de um cliente. Não usa o contexto da requisição
+    nem a sessão do banco, então a conexão parada não prende nada além da própria thread.
+    """
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            if not assinatura.sinal.wait(batimento):
+                yield ': batimento\n\n' # Mantém proxies abertos e detecta clientes que foram embora
+                continue
+            assinatura.sinal.clear()
+            if assinatura.perdeu:
+                assinatura.perdeu = False
+                assinatura.fila.clear()
+                yield 'event: resync\ndata: {}\n\n'
+                continue
+            lotes = []
+            while assinatura.fila:
+                lotes.append(assinatura.fila.popleft())
+            if lotes:
+                yield f"event: estoque\ndata: [{','.join(lotes)}]\n\n"
+    finally:
+        canal.cancelar(assinatura)
+
+
+def _ler_deltas(conexao_ou_sessao, ids):
+    """Saldo atual e alerta de estoque baixo dos produtos, lidos em blocos de ids."""
+    deltas = []
+    for inicio in range(0, len(ids), TAMANHO_BLOCO_IDS):
+        linhas = conexao_ou_sessao.execute(
+            select(Product.id, locais.expressao_total().label('quantity_in_stock'), Product.minimum_stock)
+            .where(Product.id.in_(ids[inicio:inicio + TAMANHO_BLOCO_IDS]))
+        ).all()
+        deltas += [(linha.id, linha.quantity_in_stock or 0,
+                    (linha.quantity_in_stock or 0) <= (linha.minimum_stock or 0)) for linha in linhas]
+    return deltas
+
+
+class VigiaBanco:
+    """Modo 'banco': publica as alterações feitas por outros workers, lidas por last_updated."""
+
+    def __init__(self, app, canal):
+        self.app = app
+        self.canal = canal
+        self.intervalo = app.config['ESTOQUE_EVENTOS_INTERVALO']
+        self.folga = timedelta(seconds=app.config['ESTOQUE_EVENTOS_FOLGA'])
+        self._thread = None
+        self._trava = threading.Lock()
+
+    def garantir(self):
+        """Inicia a thread na primeira conexão de um cliente."""
+        with self._trava:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._vigiar, name='vigia-estoque', daemon=True)
+                self._thread.start()
+
+    def _vigiar(self):
+        marca = datetime.utcnow()
+        while True:
+            time.sleep(self.intervalo)
+            if not len(self.canal):
+                marca = datetime.utcnow()
+                continue
+            try:
+                with self.app.app_context(), db.engine.connect() as conexao:
+                    # A folga relê os últimos segundos: um commit pode terminar depois de outro com last_updated mais novo
+                    linhas = conexao.execute(
+                        select(Product.id, Product.last_updated)
+                        .where(Product.last_updated >= marca - self.folga)
+                        .order_by(Product.last_updated).limit(LIMITE_VIGIA)
+                    ).all()
+                    # Movimentações dos produtos fragmentados não mudam o Product: lidas pelo índice de data
+                    movimentacoes = conexao.execute(
+                        select(StockMovement.product_id, StockMovement.date)
+                        .where(StockMovement.date >= marca - self.folga)
+                        .order_by(StockMovement.date).limit(LIMITE_VIGIA)
+                    ).all()
+                    if len(linhas) == LIMITE_VIGIA or len(movimentacoes) == LIMITE_VIGIA:
+                        # Alteração em massa (ex.: importação) em outro worker
+                        marca = datetime.utcnow()
+                        self.canal.resincronizar()
+                    elif linhas or movimentacoes:
+                        marca = max([marca] + [grupo[-1][1] for grupo in (linhas, movimentacoes) if grupo])
+                        ids = {linha[0] for linha in linhas} | {linha[0] for linha in movimentacoes}
+                        self.canal.publicar(list(ids), lambda ids: _ler_deltas(conexao, ids))
+            except Exception:
+                self.app.logger.exception('Falha ao consultar alterações de estoque.')
+
+
+def init_app(app):
+    """Cria o canal de eventos de estoque do worker (e o vigia do banco, no modo 'banco')."""
+    modo = app.config['ESTOQUE_EVENTOS_MODO']
+    if modo not in ('local', 'banco'):
+        raise ValueError(f"ESTOQUE_EVENTOS_MODO inválido: {modo!r} (use 'local' ou 'banco').")
+    canal = CanalEstoque(app.config['ESTOQUE_EVENTOS_MAXIMO_CLIENTES'], app.config['ESTOQUE_EVENTOS_FILA'])
+    app.extensions['canal_estoque'] = canal
+    app.extensions['vigia_estoque'] = VigiaBanco(app, canal) if modo == 'banco' else None
+
+
+def assinar():
+    """Assina o canal do worker. Levanta CanalCheioError se já houver clientes demais."""
+    assinatura = current_app.extensions['canal_estoque'].assinar()
+    if current_app.extensions['vigia_estoque']:
+        current_app.extensions['vigia_estoque'].garantir()
+    return assinatura
+
+
+# --- Captura dos produtos alterados em cada transação ---
+
+CHAVE_ALTERADOS = 'eventos_estoque_produtos'
+
+
+def _anotar(sessao, ids):
+    if sessao is not None:
+        sessao.info.setdefault(CHAVE_ALTERADOS, set()).update(ids)
+
+
+def _produto_gravado(mapper, conexao, alvo):
+    _anotar(object_session(alvo), [alvo.id])
+
+
+def _movimentacao_gravada(mapper, conexao, alvo):
+    _anotar(object_session(alvo), [alvo.product_id])
+
+
+event.listen(Product, 'after_insert', _produto_gravado)
+event.listen(Product, 'after_update', _produto_gravado)
+event.listen(StockMovement, 'after_insert', _movimentacao_gravada)
+
+# Coluna com o id do produto nos parâmetros de INSERT/UPDATE em massa de cada modelo
+COLUNA_PRODUTO = {Product: 'id', StockMovement: 'product_id'}
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _gravacao_em_massa(estado):
+    """INSERT/UPDATE em massa com lista de parâmetros (ex.: insert(StockMovement), [...])."""
+    if not (estado.is_insert or estado.is_update) or estado.bind_mapper is None:
+        return
+    coluna = COLUNA_PRODUTO.get(estado.bind_mapper.class_)
+    parametros = estado.parameters
+    if coluna and parametros:
+        lista = parametros if isinstance(parametros, list) else [parametros]
+        _anotar(estado.session, [linha[coluna] for linha in lista if linha.get(coluna) is not None])
+
+
+def _canal():
+    if has_app_context():
+        return current_app.extensions.get('canal_estoque')
+    return None
+
+
+def _ler_do_banco(ids):
+    """Deltas lidos numa conexão própria: depois do commit a sessão não executa mais SQL."""
+    with db.engine.connect() as conexao:
+        return _ler_deltas(conexao, ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_depois_do_commit(sessao):
+    ids = sessao.info.pop(CHAVE_ALTERADOS, None)
+    canal = _canal()
+    if ids and canal is not None and len(canal):
+        canal.publicar(list(ids), _ler_do_banco)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar(sessao, transacao_anterior):
+    sessao.info.pop(CHAVE_ALTERADOS, None)
@@ -0,0 +1,176 @@
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Product, StockMovement
+from app.paginacao import aplicar_keyset, codificar_cursor, decodificar_cursor
+from app.services import arquivo, saldos
+
+# Histórico de movimentações de estoque: consulta filtrada, paginação por cursor e exportação CSV.
+#
+# A listagem vem da mais recente para a mais antiga, paginada por keyset em (date, id).
+# Usa o índice ix_stock_movement_date_id ou, com filtro de produto, ix_stock_movement_product_date
+# (no SQLite o id entra no fim de todo índice, então ele também serve como (product_id, date, id)).
+# O filtro de motivo (texto contido) não usa índice: é aplicado às linhas percorridas na ordem do índice.
+#
+# A exportação percorre o intervalo em ordem cronológica com yield_per e devolve o CSV aos pedaços;
+# só um bloco de linhas fica em memória, não importa o tamanho do intervalo.
+#
+# As movimentações arquivadas (app.services.arquivo) são todas mais antigas que as da tabela:
+# a listagem passa para os blocos do arquivo quando as linhas da tabela acabam, e a exportação
+# começa por eles. Os filtros são aplicados às linhas descomprimidas.
+
+TIPOS = ('entrada', 'saida')
+CAMPOS_EXPORTACAO = ['id', 'date', 'code', 'name', 'movement_type', 'quantity', 'reason']
+TAMANHO_BLOCO = 5000
+
+Filtros = namedtuple('Filtros', 'produto tipo de ate motivo')
+
+# Linha do arquivo com os mesmos campos da consulta à tabela
+Linha = namedtuple('Linha', 'id date code name movement_type quantity reason')
+
+
+def interpretar_filtros(argumentos):
+    """
+    Lê os filtros de um dicionário de parâmetros (ex.: request.args):
+    produto (código), tipo (entrada/saida), de e ate (AAAA-MM-DD ou AAAA-MM-DDTHH:MM;
+    'ate' sem hora vale até o fim do dia) e motivo (texto contido no motivo).
+    Levanta ValueError se algum filtro for inválido.
+    """
+    tipo = argumentos.get('tipo') or None
+    if tipo is not None and tipo not in TIPOS:
+        raise ValueError(f'Tipo inválido: {tipo}')
+    try:
+        # 'de' sem hora começa à meia-noite; 'ate' sem hora vai até o fim do dia
+        de = datetime.fromisoformat(argumentos['de']) if argumentos.get('de') else None
+        ate = saldos.interpretar_momento(argumentos['ate']) if argumentos.get('ate') else None
+    except ValueError:
+        raise ValueError('Data inválida (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM).')
+    return Filtros(
+        produto=(argumentos.get('produto') or '').strip() or None,
+        tipo=tipo, de=de, ate=ate,
+        motivo=(argumentos.get('motivo') or '').strip() or None,
+    )
+
+
+def _consulta(filtros):
+    """SELECT das movimentações (com código e nome do produto) que atendem aos filtros."""
+    consulta = (
+        select(StockMovement.id, StockMovement.date, Product.code, Product.name, StockMovement.movement_type,
+               StockMovement.quantity, StockMovement.reason)
+        .join(Product, Product.id == StockMovement.product_id)
+    )
+    if filtros.produto:
+        # Subconsulta pelo código: o filtro fica em stock_movement.product_id (e usa o índice por produto)
+        consulta = consulta.where(
+            StockMovement.product_id == select(Product.id).where(Product.code == filtros.produto).scalar_subquery())
+    if filtros.tipo:
+        consulta = consulta.where(StockMovement.movement_type == filtros.tipo)
+    if filtros.de:
+        consulta = consulta.where(StockMovement.date >= filtros.de)
+    if filtros.ate:
+        consulta = consulta.where(StockMovement.date <= filtros.ate)
+    if filtros.motivo:
+        consulta = consulta.where(StockMovement.reason.icontains(filtros.motivo, autoescape=True))
+    return consulta
+
+
+def pagina(filtros, cursor=None, tamanho=50):
+    """
+    Uma página do histórico, da movimentação mais recente para a mais antiga.
+    Retorna (linhas, proximo_cursor); proximo_cursor é None na última página.
+    Levanta ValueError se o cursor for inválido.
+    """
+    consulta = aplicar_keyset(_consulta(filtros), StockMovement.date, StockMovement.id, cursor, descendente=True)
+    linhas = db.session.execute(consulta.limit(tamanho + 1)).all()
+    if len(linhas) <= tamanho and arquivo.limite() is not None:
+        # A tabela acabou: continua pelas movimentações arquivadas, a partir da última posição
+        if linhas:
+            posicao = (linhas[-1].date, linhas[-1].id)
+        else:
+            posicao = decodificar_cursor(cursor) if cursor else None
+        arquivadas = []
+        for linha in _arquivadas(filtros, posicao, descendente=True):
+            arquivadas.append(linha)
+            if len(linhas) + len(arquivadas) > tamanho:
+                break
+        linhas += _com_nomes(arquivadas)
+    proximo_cursor = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        proximo_cursor = codificar_cursor(linhas[-1].date, linhas[-1].id)
+    return linhas, proximo_cursor
+
+
+def exportar_csv(filtros, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera o CSV das movimentações filtradas, em ordem cronológica, aos pedaços (um por bloco de linhas)."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(CAMPOS_EXPORTACAO)
+
+    if arquivo.limite() is not None:
+        bloco = []
+        for linha in _arquivadas(filtros):
+            bloco.append(linha)
+            if len(bloco) == tamanho_bloco:
+                yield _escrever(escritor, buffer, _com_nomes(bloco))
+                bloco = []
+        if bloco:
+            yield _escrever(escritor, buffer, _com_nomes(bloco))
+
+    consulta = _consulta(filtros).order_by(StockMovement.date, StockMovement.id)
+    resultado = db.session.execute(consulta.execution_options(yield_per=tamanho_bloco))
+    for particao in resultado.partitions():
+        yield _escrever(escritor, buffer, particao)
+    if buffer.tell():
+        yield buffer.getvalue() # Só o cabeçalho, quando não há nenhuma linha
+
+
+def _escrever(escritor, buffer, linhas):
+    """Escreve as linhas no CSV e devolve o texto acumulado no buffer (que é esvaziado)."""
+    for linha in linhas:
+        escritor.writerow([linha.id, linha.date.isoformat(sep=' '), linha.code, linha.name,
+                           linha.movement_type, linha.quantity, linha.reason or ''])
+    texto = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return texto
+
+
+def _arquivadas(filtros, antes_de=None, descendente=False):
+    """Movimentações arquivadas que atendem aos filtros; com antes_de=(date, id), só as anteriores a essa posição."""
+    product_id = None
+    if filtros.produto:
+        product_id = db.session.scalar(select(Product.id).where(Product.code == filtros.produto))
+        if product_id is None:
+            return
+    ate = filtros.ate
+    if antes_de is not None and (ate is None or antes_de[0] < ate):
+        ate = antes_de[0]
+    motivo = filtros.motivo.lower() if filtros.motivo else None
+    for linha in arquivo.movimentacoes(filtros.de, ate, product_id, descendente):
+        if antes_de is not None and (linha.date, linha.id) >= tuple(antes_de):
+            continue
+        if filtros.tipo and linha.movement_type != filtros.tipo:
+            continue
+        if motivo and motivo not in (linha.reason or '').lower():
+            continue
+        yield linha
+
+
+def _com_nomes(linhas):
+    """Converte movimentações arquivadas em Linha, com o código e o nome atuais do produto."""
+    ids = list({linha.product_id for linha in linhas})
+    produtos = {}
+    for inicio in range(0, len(ids), TAMANHO_BLOCO):
+        produtos.update((linha.id, linha) for linha in db.session.execute(
+            select(Product.id, Product.code, Product.name).where(Product.id.in_(ids[inicio:inicio + TAMANHO_BLOCO]))))
+    return [
+        Linha(linha.id, linha.date, produtos[linha.product_id].code, produtos[linha.product_id].name,
+              linha.movement_type, linha.quantity, linha.reason)
+        for linha in linhas
+    ]
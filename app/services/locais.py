@@ -0,0 +1,264 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, select, insert, update, delete, func, exists, literal, case
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Location, LocationStock, Product
+
+# Estoque por local (lojas, depósitos) e fragmentação do saldo de produtos muito movimentados.
+#
+# O saldo de cada produto em cada local fica em LocationStock. Product.quantity_in_stock continua
+# sendo o total de todos os locais, atualizado na mesma transação das movimentações, então as
+# telas, os formulários e o alerta de estoque baixo seguem lendo só o Product.
+#
+# As linhas são criadas sob demanda, na primeira movimentação do produto no local (materializar).
+# A linha do local padrão começa com o que o Product tem além dos outros locais: produtos cadastrados
+# antes dos locais (ou pela importação do catálogo) não precisam de migração.
+#
+# Fragmentação: o saldo de um produto muito vendido pode ser dividido em N linhas no local
+# (fragmentar). Cada baixa escolhe uma linha ao acaso e trava só ela (ver
+# app.services.movimentacao.ajustar_saldo), em vez de todas as vendas do produto esperarem pela
+# mesma linha. Essas movimentações não atualizam o Product, que seria de novo uma linha disputada:
+# o total desses produtos é a soma dos locais, calculada na leitura (expressao_total, usada pela
+# listagem, pelos eventos ao vivo, pelo formulário de movimentação e pela previsão).
+# Product.quantity_in_stock deles só é refeito por consolidar(), que deve rodar periodicamente
+# (flask estoque consolidar ou a tarefa 'consolidar_locais'); até lá a ordenação por estoque, o
+# filtro e o alerta de estoque baixo, que usam os índices do Product, podem estar atrasados.
+
+# Limite de fragmentos por produto e local
+MAXIMO_FRAGMENTOS = 64
+
+# Produtos por consulta ao criar as linhas de um lote (abaixo do limite de parâmetros do SQLite)
+TAMANHO_BLOCO_PRODUTOS = 5000
+
+# Marca, em session.info, que o local padrão foi criado na transação atual
+CHAVE_PADRAO_CRIADO = 'locais_padrao_criado'
+
+
+def init_app(app):
+    """Cria o cache do worker com o id do local padrão (preenchido na primeira movimentação)."""
+    app.extensions['locais'] = {}
+
+
+def _insert(modelo):
+    """insert() do dialeto: no SQLite e no PostgreSQL aceita on_conflict_do_nothing()."""
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        return insert_dialeto(modelo)
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        return insert_dialeto(modelo)
+    return insert(modelo)
+
+
+def _ignorando_duplicados(comando):
+    """Ignora linhas já existentes (chamadas concorrentes); nos outros bancos, a segunda transação recebe IntegrityError."""
+    return comando.on_conflict_do_nothing() if hasattr(comando, 'on_conflict_do_nothing') else comando
+
+
+def padrao_id():
+    """Id do local padrão (ESTOQUE_LOCAL_PADRAO), criado na transação atual se ainda não existir."""
+    cache = current_app.extensions['locais']
+    if 'padrao' in cache:
+        return cache['padrao']
+    codigo = current_app.config['ESTOQUE_LOCAL_PADRAO']
+    location_id = db.session.scalar(select(Location.id).where(Location.code == codigo))
+    if location_id is None:
+        db.session.execute(_ignorando_duplicados(_insert(Location).values(code=codigo, name='Estoque principal')))
+        db.session.info[CHAVE_PADRAO_CRIADO] = True
+        return db.session.scalar(select(Location.id).where(Location.code == codigo))
+    if not db.session.info.get(CHAVE_PADRAO_CRIADO):
+        # Só guarda um local já gravado: o criado numa transação desfeita deixaria de existir
+        cache['padrao'] = location_id
+    return location_id
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _fim_da_transacao(sessao, *_):
+    sessao.info.pop(CHAVE_PADRAO_CRIADO, None)
+
+
+def buscar(codigo):
+    """Id do local com este código, ou None."""
+    return db.session.scalar(select(Location.id).where(Location.code == codigo))
+
+
+def criar(codigo, nome):
+    """Cadastra um local. Levanta ValueError se o código já existir."""
+    if buscar(codigo) is not None:
+        raise ValueError(f'Já existe um local com o código {codigo!r}.')
+    local = Location(code=codigo, name=nome)
+    db.session.add(local)
+    db.session.commit()
+    return local
+
+
+def materializar(product_ids, location_id):
+    """
+    Cria a linha (fragmento 0) dos produtos que ainda não têm saldo no local, na transação atual.
+    No local padrão a linha começa com o total do Product menos o que está nos outros locais;
+    nos demais, com zero. Produtos inexistentes são ignorados.
+    """
+    if location_id == padrao_id():
+        outros = (
+            select(func.coalesce(func.sum(LocationStock.quantity), 0))
+            .where(LocationStock.product_id == Product.id, LocationStock.location_id != location_id)
+            .scalar_subquery()
+        )
+        inicial = func.coalesce(Product.quantity_in_stock, 0) - outros
+    else:
+        inicial = literal(0)
+    ja_existe = exists().where(LocationStock.product_id == Product.id, LocationStock.location_id == location_id)
+    tabela = LocationStock.__table__
+    product_ids = list(product_ids)
+    for inicio in range(0, len(product_ids), TAMANHO_BLOCO_PRODUTOS):
+        bloco = product_ids[inicio:inicio + TAMANHO_BLOCO_PRODUTOS]
+        selecao = (
+            select(Product.id, literal(location_id), literal(0), inicial)
+            .where(Product.id.in_(bloco), ~ja_existe)
+        )
+        db.session.execute(_ignorando_duplicados(
+            _insert(tabela).from_select(['product_id', 'location_id', 'shard', 'quantity'], selecao)))
+
+
+def fragmentados(product_ids, location_id):
+    """Ids, entre os informados, dos produtos com o saldo do local dividido em mais de uma linha."""
+    product_ids = list(product_ids)
+    resultado = set()
+    for inicio in range(0, len(product_ids), TAMANHO_BLOCO_PRODUTOS):
+        resultado.update(db.session.scalars(
+            select(LocationStock.product_id)
+            .where(LocationStock.location_id == location_id,
+                   LocationStock.product_id.in_(product_ids[inicio:inicio + TAMANHO_BLOCO_PRODUTOS]))
+            .group_by(LocationStock.product_id).having(func.count() > 1)
+        ))
+    return resultado
+
+
+def expressao_total():
+    """
+    Expressão SQL do total do produto, correlacionada com Product: a soma dos locais quando o
+    saldo está fragmentado em algum local (mais linhas que locais), senão o Product.quantity_in_stock.
+    Uma busca pela chave primária de LocationStock por produto: para páginas e listas de ids.
+    """
+    linhas = LocationStock.__table__.alias('saldo_total')
+    soma = (
+        select(case((func.count() > func.count(linhas.c.location_id.distinct()), func.sum(linhas.c.quantity))))
+        .where(linhas.c.product_id == Product.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(soma, Product.quantity_in_stock)
+
+
+def saldo_total(product_id):
+    """Total do produto em todos os locais (ver expressao_total); None se o produto não existir."""
+    linha = db.session.execute(select(expressao_total()).where(Product.id == product_id)).first()
+    if linha is None:
+        return None
+    return linha[0] or 0
+
+
+def saldos_por_local(product_id):
+    """
+    Saldo do produto em cada local (soma dos fragmentos), incluindo o local padrão de produtos
+    que ainda não têm linha nele. Retorna None se o produto não existir; senão um dicionário
+    com o total somado, o Product.quantity_in_stock e a lista de locais.
+    """
+    produto = db.session.execute(select(Product.quantity_in_stock).where(Product.id == product_id)).first()
+    if produto is None:
+        return None
+    agregado = produto.quantity_in_stock or 0
+    linhas = db.session.execute(
+        select(Location.id, Location.code, Location.name,
+               func.sum(LocationStock.quantity).label('quantity'), func.count().label('fragmentos'))
+        .join(LocationStock, LocationStock.location_id == Location.id)
+        .where(LocationStock.product_id == product_id)
+        .group_by(Location.id, Location.code, Location.name)
+        .order_by(Location.code)
+    ).all()
+    saldos = [{'location_id': linha.id, 'code': linha.code, 'name': linha.name,
+               'quantity': linha.quantity, 'fragmentos': linha.fragmentos} for linha in linhas]
+    padrao = padrao_id()
+    if not any(saldo['location_id'] == padrao for saldo in saldos):
+        local = db.session.get(Location, padrao)
+        saldos.insert(0, {'location_id': padrao, 'code': local.code, 'name': local.name,
+                          'quantity': agregado - sum(saldo['quantity'] for saldo in saldos), 'fragmentos': 0})
+    return {'product_id': product_id, 'total': sum(saldo['quantity'] for saldo in saldos),
+            'quantity_in_stock': agregado, 'locais': saldos}
+
+
+def _ids_fragmentados():
+    """SELECT dos ids dos produtos com o saldo dividido em mais de uma linha em algum local."""
+    return (
+        select(LocationStock.product_id)
+        .group_by(LocationStock.product_id, LocationStock.location_id)
+        .having(func.count() > 1)
+    )
+
+
+def somas_fragmentados():
+    """Subconsulta (product_id, quantity) com a soma dos locais de cada produto fragmentado, só leitura."""
+    return (
+        select(LocationStock.product_id, func.sum(LocationStock.quantity).label('quantity'))
+        .where(LocationStock.product_id.in_(_ids_fragmentados()))
+        .group_by(LocationStock.product_id)
+        .subquery()
+    )
+
+
+def _consolidar(product_ids=None):
+    """UPDATE do Product.quantity_in_stock pela soma dos locais; retorna quantos produtos mudaram."""
+    soma = select(func.sum(LocationStock.quantity)).where(LocationStock.product_id == Product.id).scalar_subquery()
+    condicoes = [Product.id.in_(_ids_fragmentados()), func.coalesce(Product.quantity_in_stock, 0) != soma]
+    if product_ids is not None:
+        condicoes.append(Product.id.in_(product_ids))
+    resultado = db.session.execute(
+        update(Product).where(*condicoes).values(quantity_in_stock=soma, last_updated=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+def consolidar():
+    """
+    Corrige Product.quantity_in_stock dos produtos fragmentados que divergiram da soma dos locais.
+    Só considera produtos com mais de uma linha em algum local: os demais podem ter o total
+    editado no cadastro e não são tocados. Um único UPDATE; retorna quantos produtos mudaram.
+    """
+    alterados = _consolidar()
+    db.session.commit()
+    return alterados
+
+
+def fragmentar(product_id, location_id, fragmentos):
+    """
+    Divide (ou junta, com fragmentos=1) o saldo do produto no local em `fragmentos` linhas,
+    repartindo o saldo igualmente. O total do Product é consolidado antes de redividir.
+    Levanta ValueError se o produto não existir ou o número de fragmentos for inválido.
+    """
+    if not 1 <= fragmentos <= MAXIMO_FRAGMENTOS:
+        raise ValueError(f'O número de fragmentos deve estar entre 1 e {MAXIMO_FRAGMENTOS}.')
+    # O local padrão é materializado antes: o total do Product só deixa de ser exato depois disso
+    materializar([product_id], padrao_id())
+    materializar([product_id], location_id)
+    filtro = (LocationStock.product_id == product_id, LocationStock.location_id == location_id)
+    saldos = db.session.scalars(select(LocationStock.quantity).where(*filtro).with_for_update()).all()
+    if not saldos:
+        db.session.rollback()
+        raise ValueError(f'Produto {product_id} não encontrado.')
+    saldo = sum(saldos)
+    _consolidar([product_id]) # Enquanto ainda fragmentado; depois de juntar, o produto sai do consolidar()
+
+    base, resto = divmod(saldo, fragmentos)
+    db.session.execute(delete(LocationStock).where(*filtro))
+    db.session.execute(insert(LocationStock.__table__), [
+        {'product_id': product_id, 'location_id': location_id, 'shard': shard,
+         'quantity': base + (1 if shard < resto else 0)}
+        for shard in range(fragmentos)
+    ])
+    db.session.commit()
+    return saldo
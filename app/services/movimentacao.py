@@ -0,0 +1,376 @@
+import random
+import time
+from datetime import datetime
+from functools import wraps
+
+from sqlalchemy import select, update, insert, func, bindparam
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Product, LocationStock, StockMovement
+from app.services import locais
+
+# Serviço de movimentação de estoque.
+# A checagem de saldo e a baixa acontecem num único UPDATE condicional sobre o saldo do local
+# (UPDATE ... SET qty = qty - :n WHERE ... AND qty >= :n), então dois workers concorrentes
+# nunca conseguem vender a mesma unidade: o banco decide qual UPDATE encontra saldo suficiente.
+# Não há lock explícito na aplicação. O total do produto (Product.quantity_in_stock) é
+# atualizado na mesma transação, exceto nos produtos fragmentados (ver app/services/locais.py).
+
+TIPOS_MOVIMENTO = ('entrada', 'saida')
+
+# Parâmetros da retentativa quando o banco está ocupado (SQLite "database is locked")
+TENTATIVAS_MAXIMAS = 8
+ESPERA_INICIAL = 0.01 # segundos; dobra a cada tentativa
+ESPERA_MAXIMA = 0.5
+
+# Quantos códigos de produto vão em cada cláusula IN ao resolver um lote.
+# Fica bem abaixo do limite de parâmetros do SQLite (32766) e cobre um palete inteiro numa consulta só.
+TAMANHO_BLOCO_CODIGOS = 5000
+
+
+class EstoqueInsuficienteError(Exception):
+    """Levantada quando uma saída pede mais unidades do que há em estoque."""
+
+    def __init__(self, product_id, solicitado, disponivel):
+        self.product_id = product_id
+        self.solicitado = solicitado
+        self.disponivel = disponivel
+        super().__init__(f'Quantidade insuficiente em estoque. Disponível: {disponivel}.')
+
+
+class ProdutoNaoEncontradoError(Exception):
+    """Levantada quando o produto da movimentação não existe."""
+
+
+class LoteInvalidoError(Exception):
+    """
+    Levantada quando uma ou mais linhas de um lote não podem ser aplicadas.
+    Nada do lote é gravado. `erros` é uma lista de {'linha': n, 'erro': mensagem}, com n começando em 1.
+    """
+
+    def __init__(self, erros):
+        self.erros = erros
+        super().__init__(f'{len(erros)} linha(s) inválida(s) no lote.')
+
+
+def banco_ocupado(exc):
+    """Indica se o erro é transitório (banco ocupado/travado) e vale tentar de novo."""
+    mensagem = str(exc.orig).lower() if exc.orig is not None else str(exc).lower()
+    if 'database is locked' in mensagem or 'database table is locked' in mensagem or 'busy' in mensagem:
+        return True
+    # PostgreSQL: falha de serialização ou deadlock detectado
+    return getattr(exc.orig, 'pgcode', None) in ('40001', '40P01')
+
+
+def com_retentativa(funcao):
+    """
+    Decorador que reexecuta a transação quando o banco está ocupado.
+    Usa espera exponencial com jitter para que os workers não tentem de novo todos ao mesmo tempo.
+    A função decorada deve ser uma transação completa (termina com commit).
+    """
+    @wraps(funcao)
+    def executar(*args, **kwargs):
+        espera = ESPERA_INICIAL
+        for tentativa in range(1, TENTATIVAS_MAXIMAS + 1):
+            try:
+                return funcao(*args, **kwargs)
+            except OperationalError as exc:
+                db.session.rollback()
+                if tentativa == TENTATIVAS_MAXIMAS or not banco_ocupado(exc):
+                    raise
+                time.sleep(random.uniform(0, espera))
+                espera = min(espera * 2, ESPERA_MAXIMA)
+    return executar
+
+
+def _linhas_do_local(product_id, location_id):
+    return db.session.execute(
+        select(LocationStock.shard, LocationStock.quantity)
+        .where(LocationStock.product_id == product_id, LocationStock.location_id == location_id)
+        .order_by(LocationStock.shard)
+    ).all()
+
+
+def _aplicar_no_fragmento(product_id, location_id, shard, variacao):
+    """UPDATE de uma linha de saldo; na saída, só se houver saldo. Indica se a linha foi alterada."""
+    comando = update(LocationStock).where(
+        LocationStock.product_id == product_id, LocationStock.location_id == location_id, LocationStock.shard == shard)
+    if variacao < 0:
+        comando = comando.where(LocationStock.quantity >= -variacao)
+    resultado = db.session.execute(
+        comando.values(quantity=LocationStock.quantity + variacao).execution_options(synchronize_session=False))
+    return resultado.rowcount == 1
+
+
+def _ajustar_fragmentado(product_id, location_id, linhas, variacao):
+    """Aplica a variação num saldo dividido em várias linhas, travando uma só sempre que possível."""
+    ordem = [linha.shard for linha in linhas]
+    random.shuffle(ordem) # Cada transação começa por um fragmento diferente
+    if variacao > 0:
+        _aplicar_no_fragmento(product_id, location_id, ordem[0], variacao)
+        return
+    saldos = dict(linhas)
+    for shard in ordem:
+        if saldos[shard] >= -variacao and _aplicar_no_fragmento(product_id, location_id, shard, variacao):
+            return
+    # Nenhum fragmento sozinho tem a quantidade: trava todos (sempre na mesma ordem) e reparte a baixa.
+    # Sem lock de linha (SQLite), outra transação ainda pode ter mudado um fragmento: relê e continua
+    restante = -variacao
+    while restante > 0:
+        linhas = db.session.execute(
+            select(LocationStock.shard, LocationStock.quantity)
+            .where(LocationStock.product_id == product_id, LocationStock.location_id == location_id)
+            .order_by(LocationStock.shard).with_for_update()
+        ).all()
+        disponivel = sum(linha.quantity for linha in linhas)
+        if disponivel < restante:
+            raise EstoqueInsuficienteError(product_id, -variacao, disponivel - variacao - restante)
+        for linha in linhas:
+            retirada = min(linha.quantity, restante)
+            if retirada > 0 and _aplicar_no_fragmento(product_id, location_id, linha.shard, -retirada):
+                restante -= retirada
+
+
+def ajustar_saldo(product_id, location_id, variacao, agora, agregado=True):
+    """
+    Soma `variacao` (positiva na entrada, negativa na saída) ao saldo do produto no local,
+    dentro da transação atual (sem commit). A linha do local é criada se ainda não existir.
+
+    Com agregado=True também atualiza Product.quantity_in_stock e last_updated, exceto quando o
+    saldo do local é fragmentado: a linha do Product seria de novo o ponto de disputa que os
+    fragmentos evitam. O total desses produtos é a soma dos locais (locais.expressao_total).
+
+    Levanta ProdutoNaoEncontradoError ou EstoqueInsuficienteError (com o saldo do local);
+    quem chama deve desfazer a transação.
+    """
+    linhas = _linhas_do_local(product_id, location_id)
+    if not linhas:
+        locais.materializar([product_id], location_id)
+        linhas = _linhas_do_local(product_id, location_id)
+        if not linhas:
+            raise ProdutoNaoEncontradoError(f'Produto {product_id} não encontrado.')
+    if len(linhas) > 1:
+        _ajustar_fragmentado(product_id, location_id, linhas, variacao)
+        return
+
+    if not _aplicar_no_fragmento(product_id, location_id, linhas[0].shard, variacao):
+        raise EstoqueInsuficienteError(product_id, -variacao, _linhas_do_local(product_id, location_id)[0].quantity)
+    if agregado:
+        db.session.execute(
+            update(Product).where(Product.id == product_id)
+            .values(quantity_in_stock=func.coalesce(Product.quantity_in_stock, 0) + variacao, last_updated=agora)
+            .execution_options(synchronize_session=False)
+        )
+
+
+@com_retentativa
+def aplicar_movimentacao(product_id, movement_type, quantity, reason=None, location_id=None):
+    """
+    Registra uma entrada ou saída de estoque de forma atômica.
+
+    A atualização do saldo (no local informado, ou no local padrão) e a inserção do StockMovement
+    são gravadas na mesma transação. Retorna o total do produto após a movimentação.
+
+    Levanta:
+        ValueError: tipo de movimento ou quantidade inválidos.
+        ProdutoNaoEncontradoError: o produto não existe.
+        EstoqueInsuficienteError: saída maior que o estoque disponível no local.
+    """
+    if movement_type not in TIPOS_MOVIMENTO:
+        raise ValueError(f'Tipo de movimento inválido: {movement_type}')
+    if quantity is None or quantity <= 0:
+        raise ValueError('A quantidade deve ser um número positivo.')
+
+    location_id = location_id or locais.padrao_id()
+    agora = datetime.utcnow()
+    try:
+        ajustar_saldo(product_id, location_id, quantity if movement_type == 'entrada' else -quantity, agora)
+    except (ProdutoNaoEncontradoError, EstoqueInsuficienteError):
+        db.session.rollback()
+        raise
+
+    db.session.add(StockMovement(
+        date=agora,
+        movement_type=movement_type,
+        quantity=quantity,
+        reason=reason or None,
+        product_id=product_id,
+        location_id=location_id,
+    ))
+    # Total resultante, lido dentro da mesma transação (já com a nossa alteração)
+    novo_saldo = locais.saldo_total(product_id)
+    db.session.commit()
+    return novo_saldo
+
+
+@com_retentativa
+def transferir(product_id, origem_id, destino_id, quantity, reason=None):
+    """
+    Transfere unidades do produto entre dois locais numa única transação, registrada como uma
+    saída na origem e uma entrada no destino, marcadas com is_transfer (a previsão de demanda
+    as ignora). O total do produto não muda, então o Product
+    (a linha mais disputada) não é alterado.
+
+    Levanta ValueError (locais iguais ou quantidade inválida), ProdutoNaoEncontradoError ou
+    EstoqueInsuficienteError (saldo da origem).
+    """
+    if origem_id == destino_id:
+        raise ValueError('A origem e o destino da transferência devem ser locais diferentes.')
+    if quantity is None or quantity <= 0:
+        raise ValueError('A quantidade deve ser um número positivo.')
+
+    agora = datetime.utcnow()
+    try:
+        # Locais em ordem de id: transferências opostas do mesmo produto travam as linhas na mesma ordem
+        for location_id, variacao in sorted([(origem_id, -quantity), (destino_id, quantity)]):
+            ajustar_saldo(product_id, location_id, variacao, agora, agregado=False)
+    except (ProdutoNaoEncontradoError, EstoqueInsuficienteError):
+        db.session.rollback()
+        raise
+
+    motivo = reason or 'Transferência entre locais'
+    db.session.add_all([
+        StockMovement(date=agora, movement_type='saida', quantity=quantity, reason=motivo,
+                      product_id=product_id, location_id=origem_id, is_transfer=True),
+        StockMovement(date=agora, movement_type='entrada', quantity=quantity, reason=motivo,
+                      product_id=product_id, location_id=destino_id, is_transfer=True),
+    ])
+    db.session.commit()
+
+
+def _validar_linha(linha):
+    """Valida o formato de uma linha do lote. Retorna a mensagem de erro ou None."""
+    if not isinstance(linha, dict):
+        return 'A linha deve ser um objeto com code, movement_type, quantity e reason.'
+    if not isinstance(linha.get('code'), str) or not linha['code'].strip():
+        return 'Código do produto não informado.'
+    if linha.get('movement_type') not in TIPOS_MOVIMENTO:
+        return f"Tipo de movimento inválido: {linha.get('movement_type')!r}."
+    quantidade = linha.get('quantity')
+    if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+        return 'A quantidade deve ser um número inteiro positivo.'
+    motivo = linha.get('reason')
+    if motivo is not None and (not isinstance(motivo, str) or len(motivo) > 128):
+        return 'O motivo deve ser um texto de até 128 caracteres.'
+    if linha['movement_type'] == 'saida' and not motivo:
+        return 'O motivo é obrigatório para saídas de estoque.'
+    return None
+
+
+@com_retentativa
+def aplicar_lote(linhas, location_id=None):
+    """
+    Aplica um lote de movimentações (recebimento ou separação) numa única transação.
+
+    Cada linha é um dict com code, movement_type ('entrada' ou 'saida'), quantity e reason.
+    Todos os códigos são resolvidos de uma vez, o saldo de cada produto é ajustado uma única vez
+    pelo total do lote e os StockMovement são inseridos em massa, com um só commit no final.
+    O saldo é verificado pelo resultado líquido do lote por produto, no local informado
+    (ou no local padrão).
+
+    É tudo ou nada: se qualquer linha for inválida, nada é gravado e LoteInvalidoError
+    traz o erro de cada linha. Retorna um resumo {'linhas': n, 'produtos': n}.
+    """
+    linhas = list(linhas)
+    if not linhas:
+        raise LoteInvalidoError([{'linha': 0, 'erro': 'O lote está vazio.'}])
+
+    erros = []
+    validas = []
+    for numero, linha in enumerate(linhas, start=1):
+        erro = _validar_linha(linha)
+        if erro:
+            erros.append({'linha': numero, 'erro': erro})
+        else:
+            validas.append((numero, linha))
+
+    # Resolve todos os códigos do lote (uma consulta por bloco de TAMANHO_BLOCO_CODIGOS códigos)
+    codigos = list({linha['code'].strip() for _, linha in validas})
+    ids_por_codigo = {}
+    for inicio in range(0, len(codigos), TAMANHO_BLOCO_CODIGOS):
+        bloco = codigos[inicio:inicio + TAMANHO_BLOCO_CODIGOS]
+        ids_por_codigo.update(db.session.execute(
+            select(Product.code, Product.id).where(Product.code.in_(bloco))
+        ).all())
+
+    # Variação líquida por produto
+    variacoes = {}
+    for numero, linha in validas:
+        product_id = ids_por_codigo.get(linha['code'].strip())
+        if product_id is None:
+            erros.append({'linha': numero, 'erro': f"Produto com código {linha['code']!r} não encontrado."})
+            continue
+        sinal = 1 if linha['movement_type'] == 'entrada' else -1
+        variacoes[product_id] = variacoes.get(product_id, 0) + sinal * linha['quantity']
+    if erros:
+        raise LoteInvalidoError(sorted(erros, key=lambda erro: erro['linha']))
+
+    agora = datetime.utcnow()
+    location_id = location_id or locais.padrao_id()
+    locais.materializar(variacoes, location_id)
+    fragmentados = locais.fragmentados(variacoes, location_id)
+    simples = [(product_id, variacao) for product_id, variacao in variacoes.items() if product_id not in fragmentados]
+
+    # Um único UPDATE preparado por tabela, executado em lote (executemany) com a variação de cada produto
+    if simples:
+        saldos = LocationStock.__table__
+        db.session.execute(
+            update(saldos)
+            .where(saldos.c.product_id == bindparam('b_id'), saldos.c.location_id == location_id, saldos.c.shard == 0)
+            .values(quantity=saldos.c.quantity + bindparam('b_variacao')),
+            [{'b_id': product_id, 'b_variacao': variacao} for product_id, variacao in simples],
+        )
+        tabela = Product.__table__
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.id == bindparam('b_id'))
+            .values(quantity_in_stock=func.coalesce(tabela.c.quantity_in_stock, 0) + bindparam('b_variacao'),
+                    last_updated=agora),
+            [{'b_id': product_id, 'b_variacao': variacao} for product_id, variacao in simples],
+        )
+
+    # Produtos que ficaram negativos no local: o lote inteiro é desfeito. disponivel = saldo antes do lote
+    ids_com_saida = [product_id for product_id, variacao in simples if variacao < 0]
+    negativos = {}
+    for inicio in range(0, len(ids_com_saida), TAMANHO_BLOCO_CODIGOS):
+        bloco = ids_com_saida[inicio:inicio + TAMANHO_BLOCO_CODIGOS]
+        negativos.update(
+            (linha.product_id, linha.quantity - variacoes[linha.product_id])
+            for linha in db.session.execute(
+                select(LocationStock.product_id, LocationStock.quantity)
+                .where(LocationStock.product_id.in_(bloco), LocationStock.location_id == location_id,
+                       LocationStock.quantity < 0)
+            )
+        )
+    # Produtos fragmentados: um fragmento por vez, como nas movimentações avulsas
+    if not negativos:
+        for product_id in sorted(fragmentados):
+            try:
+                ajustar_saldo(product_id, location_id, variacoes[product_id], agora)
+            except EstoqueInsuficienteError as exc:
+                negativos[product_id] = exc.disponivel
+    if negativos:
+        db.session.rollback()
+        for numero, linha in enumerate(linhas, start=1):
+            product_id = ids_por_codigo[linha['code'].strip()]
+            if product_id in negativos and linha['movement_type'] == 'saida':
+                erros.append({'linha': numero, 'erro': (
+                    f"Quantidade insuficiente em estoque para {linha['code']!r}. "
+                    f"Disponível: {negativos[product_id]}, saldo do lote: {variacoes[product_id]}."
+                )})
+        raise LoteInvalidoError(erros)
+
+    db.session.execute(insert(StockMovement), [
+        {
+            'date': agora,
+            'movement_type': linha['movement_type'],
+            'quantity': linha['quantity'],
+            'reason': linha.get('reason') or None,
+            'product_id': ids_por_codigo[linha['code'].strip()],
+            'location_id': location_id,
+        }
+        for linha in linhas
+    ])
+    db.session.commit()
+    return {'linhas': len(linhas), 'produtos': len(variacoes)}
@@ -0,0 +1,190 @@
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import select, insert, delete, func
+
+from app import db
+from app.models import Product, StockMovement, ReorderSuggestion, Supplier
+from app.services import locais
+
+# Previsão de demanda e sugestões de compra a partir do histórico de saídas.
+#
+# O histórico é lido numa única consulta agregada (saídas por produto e por dia, sem as
+# transferências entre locais) e vira três
+# vetores NumPy: índice do produto, idade do dia (0 = ontem) e quantidade. Médias móveis, desvio
+# padrão e ponto de pedido são calculados para todos os produtos de uma vez com np.bincount,
+# sem laço por produto e sem montar a matriz produtos x dias: os dias sem venda entram só
+# pela contagem de dias, então o custo é proporcional ao número de pares (produto, dia) com saída.
+#
+# Para cada produto:
+#   demanda diária  = maior entre as médias móveis de JANELA_CURTA e JANELA_LONGA dias
+#                     (reage a alta de demanda sem derrubar o pedido numa semana fraca);
+#   desvio          = desvio padrão da demanda diária em todo o histórico lido;
+#   ponto de pedido = demanda x prazo de entrega + z x desvio x raiz(prazo), nunca abaixo do estoque mínimo;
+#   sugestão        = quando o estoque está no ponto de pedido ou abaixo, o que falta para cobrir
+#                     o prazo de entrega + a cobertura desejada (mais o estoque de segurança).
+
+JANELA_CURTA = 30
+JANELA_LONGA = 90
+DIAS_HISTORICO = 365
+TAMANHO_BLOCO = 50000
+
+
+def carregar_historico(fim, dias=DIAS_HISTORICO, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Saídas por produto e por dia nos `dias` anteriores a `fim` (um datetime; o dia de `fim` não entra).
+    Retorna três vetores: product_id, idade do dia (0 = véspera de `fim`) e quantidade total do dia.
+    """
+    fim_dia = np.datetime64(fim.date(), 'D')
+    inicio = datetime.combine(fim.date() - timedelta(days=dias), datetime.min.time())
+    dia = func.date(StockMovement.date)
+    consulta = (
+        select(StockMovement.product_id, dia, func.sum(StockMovement.quantity))
+        .where(StockMovement.movement_type == 'saida',
+               StockMovement.is_transfer.is_(False), # Transferências entre locais não são demanda
+               StockMovement.date >= inicio,
+               StockMovement.date < datetime.combine(fim.date(), datetime.min.time()))
+        .group_by(StockMovement.product_id, dia)
+    )
+    produtos, idades, quantidades = [], [], []
+    resultado = db.session.execute(consulta.execution_options(yield_per=tamanho_bloco))
+    for bloco in resultado.partitions():
+        ids, dias_bloco, qtds = zip(*bloco)
+        produtos.append(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        # func.date devolve texto no SQLite e date no PostgreSQL; str() normaliza para AAAA-MM-DD
+        datas = np.array([str(d) for d in dias_bloco], dtype='datetime64[D]')
+        idades.append((fim_dia - datas).astype(np.int64) - 1)
+        quantidades.append(np.fromiter(qtds, dtype=np.float64, count=len(qtds)))
+    if not produtos:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+    return np.concatenate(produtos), np.concatenate(idades), np.concatenate(quantidades)
+
+
+def calcular(estoque, minimo, indices, idades, quantidades, dias=DIAS_HISTORICO,
+             prazo=7, cobertura=30, z=1.65):
+    """
+    Calcula demanda, desvio, ponto de pedido e sugestão de compra para todos os produtos.
+
+    `estoque` e `minimo` têm uma posição por produto; `indices`, `idades` e `quantidades`
+    descrevem as saídas diárias (posição do produto, idade do dia e quantidade).
+    Retorna um dicionário de vetores com uma posição por produto.
+    """
+    n = len(estoque)
+    estoque = np.asarray(estoque, dtype=np.float64)
+    minimo = np.asarray(minimo, dtype=np.float64)
+
+    # Dias observados: produtos com histórico menor que a janela não têm a média diluída
+    # por dias anteriores à primeira venda
+    primeira = np.full(n, -1, dtype=np.int64)
+    np.maximum.at(primeira, indices, idades)
+    observados = np.where(primeira >= 0, np.minimum(primeira + 1, dias), dias).astype(np.float64)
+
+    def media_movel(janela):
+        recentes = idades < janela
+        soma = np.bincount(indices[recentes], weights=quantidades[recentes], minlength=n)
+        return soma / np.minimum(observados, janela)
+
+    demanda = np.maximum(media_movel(JANELA_CURTA), media_movel(JANELA_LONGA))
+
+    soma = np.bincount(indices, weights=quantidades, minlength=n)
+    soma_quadrados = np.bincount(indices, weights=quantidades * quantidades, minlength=n)
+    media = soma / observados
+    variancia = np.maximum(soma_quadrados / observados - media * media, 0.0)
+    desvio = np.sqrt(variancia * observados / np.maximum(observados - 1, 1)) # Desvio amostral
+
+    seguranca = z * desvio * np.sqrt(prazo)
+    ponto_pedido = np.maximum(np.ceil(demanda * prazo + seguranca), minimo)
+    alvo = np.maximum(np.ceil(demanda * (prazo + cobertura) + seguranca), ponto_pedido)
+    sugestao = np.where(estoque <= ponto_pedido, np.maximum(alvo - estoque, 0), 0)
+
+    return {
+        'demanda': demanda,
+        'desvio': desvio,
+        'ponto_pedido': ponto_pedido.astype(np.int64),
+        'sugestao': sugestao.astype(np.int64),
+    }
+
+
+def gerar_sugestoes(prazo, cobertura, z, momento=None, dias=DIAS_HISTORICO):
+    """
+    Recalcula a tabela ReorderSuggestion para todos os produtos a partir das saídas dos
+    `dias` anteriores a `momento` (padrão: agora). Grava só os produtos com demanda ou com
+    sugestão de compra. Retorna um dicionário com produtos, com_demanda, sugestoes e os
+    tempos de leitura (segundos_leitura) e de cálculo (segundos_calculo).
+    """
+    momento = momento or datetime.utcnow()
+    inicio_leitura = time.perf_counter()
+
+    # Estoque dos produtos fragmentados pela soma dos locais (uma passada agrupada em LocationStock)
+    fragmentados = locais.somas_fragmentados()
+    linhas = db.session.execute(
+        select(Product.id, func.coalesce(fragmentados.c.quantity, Product.quantity_in_stock, 0),
+               func.coalesce(Product.minimum_stock, 0))
+        .outerjoin(fragmentados, fragmentados.c.product_id == Product.id)
+        .order_by(Product.id)
+    ).all()
+    ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+    estoque = np.fromiter((linha[1] for linha in linhas), dtype=np.float64, count=len(linhas))
+    minimo = np.fromiter((linha[2] for linha in linhas), dtype=np.float64, count=len(linhas))
+
+    produtos, idades, quantidades = carregar_historico(momento, dias)
+    # product_id -> posição no vetor de produtos (ids está ordenado); descarta ids inexistentes
+    indices = np.searchsorted(ids, produtos)
+    validos = indices < len(ids)
+    validos[validos] = ids[indices[validos]] == produtos[validos]
+    indices, idades, quantidades = indices[validos], idades[validos], quantidades[validos]
+
+    inicio_calculo = time.perf_counter()
+    resultado = calcular(estoque, minimo, indices, idades, quantidades, dias, prazo, cobertura, z)
+    fim_calculo = time.perf_counter()
+
+    gravar = np.flatnonzero((resultado['demanda'] > 0) | (resultado['sugestao'] > 0))
+    db.session.execute(delete(ReorderSuggestion))
+    if len(gravar):
+        db.session.execute(insert(ReorderSuggestion), [
+            {
+                'product_id': product_id,
+                'computed_at': momento,
+                'avg_daily_demand': demanda,
+                'demand_std': desvio,
+                'reorder_point': ponto_pedido,
+                'suggested_quantity': sugestao,
+            }
+            for product_id, demanda, desvio, ponto_pedido, sugestao in zip(
+                ids[gravar].tolist(), resultado['demanda'][gravar].tolist(), resultado['desvio'][gravar].tolist(),
+                resultado['ponto_pedido'][gravar].tolist(), resultado['sugestao'][gravar].tolist())
+        ])
+    db.session.commit()
+
+    return {
+        'produtos': len(ids),
+        'com_demanda': int(np.count_nonzero(resultado['demanda'] > 0)),
+        'sugestoes': int(np.count_nonzero(resultado['sugestao'] > 0)),
+        'segundos_leitura': inicio_calculo - inicio_leitura,
+        'segundos_calculo': fim_calculo - inicio_calculo,
+    }
+
+
+def sugestoes_por_fornecedor():
+    """
+    Sugestões de compra (quantidade > 0) agrupadas por fornecedor, em uma consulta.
+    Retorna uma lista de dicionários com fornecedor (None = sem fornecedor) e itens.
+    """
+    linhas = db.session.execute(
+        select(Supplier.id.label('supplier_id'), Supplier.name.label('fornecedor'),
+               Product.id, Product.code, Product.name, locais.expressao_total().label('quantity_in_stock'),
+               Product.minimum_stock,
+               ReorderSuggestion.avg_daily_demand, ReorderSuggestion.demand_std,
+               ReorderSuggestion.reorder_point, ReorderSuggestion.suggested_quantity,
+               ReorderSuggestion.computed_at)
+        .join(Product, Product.id == ReorderSuggestion.product_id)
+        .outerjoin(Supplier, Supplier.id == Product.supplier_id)
+        .where(ReorderSuggestion.suggested_quantity > 0)
+        .order_by(Supplier.name, Supplier.id, Product.name)
+    ).all()
+    return [
+        {'supplier_id': supplier_id, 'fornecedor': fornecedor, 'itens': list(itens)}
+        for (supplier_id, fornecedor), itens in groupby(linhas, key=lambda linha: (linha.supplier_id, linha.fornecedor))
+    ]
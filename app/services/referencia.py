@@ -0,0 +1,183 @@
+from collections import namedtuple
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.cache import CacheLRU
+from app.models import Category, Supplier, Location, Product, User, CacheVersion
+
+# Cache dos dados de referência (categorias, fornecedores e locais de estoque) usados nos formulários e filtros.
+#
+# Cada worker guarda as listas num CacheLRU (app/cache.py) com a chave (conjunto, versão).
+# A versão fica na tabela CacheVersion e é incrementada logo depois do commit de qualquer
+# INSERT/UPDATE/DELETE em Category, Supplier ou Location, seja pelo ORM (eventos de mapper) ou em massa
+# (evento do_orm_execute, usado pela importação do catálogo). Durante a transação os conjuntos
+# alterados só são anotados em session.info: incrementar antes do commit deixaria uma leitura na
+# mesma conexão guardar no cache, com a versão nova, dados que um rollback ainda pode desfazer.
+# Entre o commit e o incremento um leitor pode guardar os dados novos com a versão antiga, o que
+# só antecipa a recarga. As versões são lidas numa
+# única consulta por requisição, por chave primária; as listas só são recarregadas quando
+# a versão muda (ou quando a entrada expira pelo TTL). Assim uma alteração feita em um worker é vista
+# pelos demais na requisição seguinte, sem reinício.
+#
+# As mesmas versões compõem os ETags da listagem de produtos (ver app/condicional.py).
+
+Referencia = namedtuple('Referencia', 'id name')
+
+# Conjunto de dados em cache de cada modelo (nome usado em CacheVersion)
+CONJUNTOS = {Category: 'categorias', Supplier: 'fornecedores', Location: 'locais'}
+
+# Produtos: só as exclusões incrementam a versão. Inclusões e alterações já mudam
+# max(Product.last_updated); incrementar a versão a cada movimentação faria desta linha
+# um ponto de disputa entre todas as escritas de estoque.
+CONJUNTOS_EXCLUSAO = {Product: 'produtos'}
+
+# Usuários: alterações e exclusões. Não há lista em cache; a versão invalida, em todos os
+# workers, o cache de usuários logados (ver app/services/usuarios.py).
+CONJUNTOS_ALTERACAO = {User: 'usuarios'}
+
+
+# Conjuntos alterados na transação atual, em session.info
+CHAVE_ALTERADOS = 'referencia_conjuntos'
+
+
+def _incrementar(conexao, conjunto):
+    """Incrementa a versão do conjunto (cria a linha na primeira vez)."""
+    tabela = CacheVersion.__table__
+    dialeto = conexao.dialect.name
+    if dialeto in ('sqlite', 'postgresql'):
+        if dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        comando = insert_dialeto(tabela).values(name=conjunto, version=1)
+        conexao.execute(comando.on_conflict_do_update(index_elements=['name'],
+                                                      set_={'version': tabela.c.version + 1}))
+        return
+    # Outros bancos: UPDATE e, se a linha ainda não existe, INSERT
+    resultado = conexao.execute(update(tabela).where(tabela.c.name == conjunto).values(version=tabela.c.version + 1))
+    if resultado.rowcount == 0:
+        conexao.execute(insert(tabela).values(name=conjunto, version=1))
+
+
+def _anotar(sessao, conjunto):
+    if sessao is not None:
+        sessao.info.setdefault(CHAVE_ALTERADOS, set()).add(conjunto)
+
+
+def _alteracao_pelo_orm(mapper, conexao, alvo):
+    _anotar(object_session(alvo), CONJUNTOS[mapper.class_])
+
+
+def _exclusao_pelo_orm(mapper, conexao, alvo):
+    _anotar(object_session(alvo), CONJUNTOS_EXCLUSAO[mapper.class_])
+
+
+def _alteracao_sem_insercao(mapper, conexao, alvo):
+    _anotar(object_session(alvo), CONJUNTOS_ALTERACAO[mapper.class_])
+
+
+for _modelo in CONJUNTOS:
+    for _evento in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_modelo, _evento, _alteracao_pelo_orm)
+for _modelo in CONJUNTOS_EXCLUSAO:
+    event.listen(_modelo, 'after_delete', _exclusao_pelo_orm)
+for _modelo in CONJUNTOS_ALTERACAO:
+    for _evento in ('after_update', 'after_delete'):
+        event.listen(_modelo, _evento, _alteracao_sem_insercao)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _alteracao_em_massa(estado):
+    """INSERT/UPDATE/DELETE em massa (ex.: db.session.execute(insert(Category), [...]))."""
+    if not (estado.is_insert or estado.is_update or estado.is_delete) or estado.bind_mapper is None:
+        return
+    conjunto = CONJUNTOS.get(estado.bind_mapper.class_)
+    if conjunto is None and estado.is_delete:
+        conjunto = CONJUNTOS_EXCLUSAO.get(estado.bind_mapper.class_)
+    if conjunto is None and not estado.is_insert:
+        conjunto = CONJUNTOS_ALTERACAO.get(estado.bind_mapper.class_)
+    if conjunto:
+        _anotar(estado.session, conjunto)
+
+
+@event.listens_for(Session, 'after_commit')
+def _incrementar_depois_do_commit(sessao):
+    """Incrementa, numa transação própria, as versões dos conjuntos alterados pelo commit."""
+    conjuntos = sessao.info.pop(CHAVE_ALTERADOS, None)
+    if not conjuntos or not has_app_context():
+        return
+    if has_request_context():
+        g.pop('_versoes_referencia', None) # A própria requisição alterou os dados: relê a versão
+    try:
+        with db.engine.begin() as conexao:
+            for conjunto in sorted(conjuntos):
+                _incrementar(conexao, conjunto)
+    except SQLAlchemyError:
+        # Os dados já foram gravados: não propaga o erro (quem chamou repetiria a transação).
+        # Os workers veem a alteração quando as entradas do cache expirarem pelo TTL.
+        current_app.logger.exception('Falha ao incrementar a versão do cache de %s.', ', '.join(sorted(conjuntos)))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar(sessao, transacao_anterior):
+    sessao.info.pop(CHAVE_ALTERADOS, None)
+
+
+def init_app(app):
+    """Cria o cache do worker com os limites da configuração."""
+    app.extensions['cache_referencia'] = CacheLRU(app.config['CACHE_REFERENCIA_MAXIMO'],
+                                                  app.config['CACHE_REFERENCIA_TTL'])
+
+
+def _versoes():
+    """Versões atuais dos conjuntos; lidas uma vez por requisição."""
+    if has_request_context() and '_versoes_referencia' in g:
+        return g._versoes_referencia
+    versoes = dict(db.session.execute(select(CacheVersion.name, CacheVersion.version)).all())
+    if has_request_context():
+        g._versoes_referencia = versoes
+    return versoes
+
+
+def versao(conjunto):
+    """Versão atual de um conjunto ('categorias', 'fornecedores', 'produtos' ou 'usuarios')."""
+    return _versoes().get(conjunto, 0)
+
+
+def _obter(chave, conjunto, carregar):
+    cache = current_app.extensions['cache_referencia']
+    # A versão é lida antes dos dados: se mudar durante a carga, a próxima leitura já recarrega
+    return cache.obter((chave, versao(conjunto)), carregar)
+
+
+def _lista(modelo):
+    return [Referencia(*linha) for linha in db.session.execute(select(modelo.id, modelo.name).order_by(modelo.name))]
+
+
+def categorias():
+    """Categorias (id, name) em ordem de nome."""
+    return _obter('categorias', 'categorias', lambda: _lista(Category))
+
+
+def fornecedores():
+    """Fornecedores (id, name) em ordem de nome."""
+    return _obter('fornecedores', 'fornecedores', lambda: _lista(Supplier))
+
+
+def locais():
+    """Locais de estoque (id, name) em ordem de nome."""
+    return _obter('locais', 'locais', lambda: _lista(Location))
+
+
+def categoria_existe(nome):
+    """Indica se já existe uma categoria com este nome."""
+    return nome in _obter('nomes_categorias', 'categorias', lambda: frozenset(c.name for c in categorias()))
+
+
+def fornecedor_existe(nome):
+    """Indica se já existe um fornecedor com este nome."""
+    return nome in _obter('nomes_fornecedores', 'fornecedores', lambda: frozenset(f.name for f in fornecedores()))
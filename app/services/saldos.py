@@ -0,0 +1,289 @@
+from datetime import datetime, time as hora
+
+from sqlalchemy import select, insert, delete, func, and_, literal, DateTime
+
+from app import db
+from app.models import Product, StockMovement, StockCheckpoint, StockMovementSummary
+from app.services import arquivo, locais
+
+# Saldos de estoque em uma data (consultas "ponto no tempo") e conferência do livro de movimentações.
+#
+# O StockMovement é um livro só de inclusão. Para saber o saldo numa data partimos do
+# StockCheckpoint mais próximo e somamos apenas as movimentações entre ele e a data pedida,
+# usando o índice (product_id, date) de stock_movement.
+# O primeiro checkpoint de cada produto é ancorado no saldo atual (saldo atual menos tudo o que
+# foi movimentado depois da data). Assim o estoque inicial cadastrado sem movimentação
+# também entra na conta. Os checkpoints seguintes vêm do anterior mais as movimentações do período.
+#
+# Antes do último arquivamento (app.services.arquivo) as movimentações não estão mais na tabela:
+# o saldo parte do checkpoint gravado no corte e desconta o que foi movimentado entre a data e o
+# corte, pelos resumos mensais (e, no saldo de um produto, pelos blocos do mês da data).
+
+
+def interpretar_momento(texto):
+    """
+    Converte um texto ISO 8601 em datetime. Uma data sem hora (ex.: '2024-01-31')
+    significa o fim daquele dia, que é o que se espera num fechamento de mês.
+    Levanta ValueError se o texto for inválido.
+    """
+    momento = datetime.fromisoformat(texto)
+    if len(texto) == 10:
+        momento = datetime.combine(momento.date(), hora.max)
+    return momento
+
+
+def _variacao(*condicoes):
+    """Soma das quantidades com sinal das movimentações que atendem às condições."""
+    return db.session.scalar(
+        select(func.coalesce(func.sum(StockMovement.quantidade_com_sinal()), 0)).where(*condicoes)
+    )
+
+
+def saldo_em(product_id, momento):
+    """
+    Saldo do produto na data `momento` (movimentações até essa data, inclusive).
+    Retorna None se o produto não existir.
+    """
+    corte = arquivo.limite()
+    if corte is not None and momento < arquivo.instante_do_checkpoint(corte):
+        ancora = db.session.scalar(
+            select(StockCheckpoint.quantity)
+            .where(StockCheckpoint.product_id == product_id,
+                   StockCheckpoint.date == arquivo.instante_do_checkpoint(corte)))
+        if ancora is not None:
+            return ancora - arquivo.variacao_ate_o_corte(product_id, momento, corte)
+    anterior = db.session.execute(
+        select(StockCheckpoint.date, StockCheckpoint.quantity)
+        .where(StockCheckpoint.product_id == product_id, StockCheckpoint.date <= momento)
+        .order_by(StockCheckpoint.date.desc()).limit(1)
+    ).first()
+    if anterior is not None:
+        # Para frente: checkpoint anterior + movimentações até a data
+        return anterior.quantity + _variacao(
+            StockMovement.product_id == product_id,
+            StockMovement.date > anterior.date, StockMovement.date <= momento)
+
+    posterior = db.session.execute(
+        select(StockCheckpoint.date, StockCheckpoint.quantity)
+        .where(StockCheckpoint.product_id == product_id, StockCheckpoint.date > momento)
+        .order_by(StockCheckpoint.date).limit(1)
+    ).first()
+    if posterior is not None:
+        # Para trás: checkpoint seguinte - movimentações entre a data e ele
+        return posterior.quantity - _variacao(
+            StockMovement.product_id == product_id,
+            StockMovement.date > momento, StockMovement.date <= posterior.date)
+
+    atual = locais.saldo_total(product_id)
+    if atual is None:
+        return None
+    # Sem checkpoints: saldo atual - tudo o que foi movimentado depois da data
+    return atual - _variacao(
+        StockMovement.product_id == product_id, StockMovement.date > momento)
+
+
+def _consulta_saldos_em(momento):
+    """
+    SELECT (product_id, saldo) de todos os produtos na data `momento`, calculado inteiramente no banco.
+    Usa o último checkpoint até a data quando existe; caso contrário, parte do saldo atual
+    (a soma dos locais, nos produtos fragmentados).
+    Antes do último arquivamento, só no fim de um mês (ver _consulta_saldos_arquivados).
+    """
+    corte = arquivo.limite()
+    if corte is not None and momento < arquivo.instante_do_checkpoint(corte):
+        return _consulta_saldos_arquivados(momento, corte)
+    sinal = StockMovement.quantidade_com_sinal()
+
+    ultimo = (
+        select(StockCheckpoint.product_id, func.max(StockCheckpoint.date).label('date'))
+        .where(StockCheckpoint.date <= momento)
+        .group_by(StockCheckpoint.product_id)
+        .subquery()
+    )
+    checkpoint = (
+        select(StockCheckpoint.product_id, StockCheckpoint.date, StockCheckpoint.quantity)
+        .join(ultimo, and_(ultimo.c.product_id == StockCheckpoint.product_id, ultimo.c.date == StockCheckpoint.date))
+        .subquery()
+    )
+    # Movimentações entre o checkpoint e a data
+    desde_checkpoint = (
+        select(StockMovement.product_id, func.sum(sinal).label('variacao'))
+        .join(checkpoint, checkpoint.c.product_id == StockMovement.product_id)
+        .where(StockMovement.date > checkpoint.c.date, StockMovement.date <= momento)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    # Produtos sem checkpoint: movimentações depois da data, a descontar do saldo atual
+    depois = (
+        select(StockMovement.product_id, func.sum(sinal).label('variacao'))
+        .where(StockMovement.date > momento, StockMovement.product_id.notin_(select(checkpoint.c.product_id)))
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    fragmentados = locais.somas_fragmentados()
+    saldo = db.case(
+        (checkpoint.c.quantity.isnot(None), checkpoint.c.quantity + func.coalesce(desde_checkpoint.c.variacao, 0)),
+        else_=func.coalesce(fragmentados.c.quantity, Product.quantity_in_stock, 0) - func.coalesce(depois.c.variacao, 0),
+    )
+    return (
+        select(Product.id.label('product_id'), saldo.label('saldo'))
+        .outerjoin(checkpoint, checkpoint.c.product_id == Product.id)
+        .outerjoin(desde_checkpoint, desde_checkpoint.c.product_id == Product.id)
+        .outerjoin(depois, depois.c.product_id == Product.id)
+        .outerjoin(fragmentados, fragmentados.c.product_id == Product.id)
+    )
+
+
+def _consulta_saldos_arquivados(momento, corte):
+    """
+    SELECT (product_id, saldo) numa data anterior ao corte do arquivamento: checkpoint do corte
+    menos os resumos mensais seguintes à data e as movimentações ainda não arquivadas.
+    Os resumos são mensais, então `momento` precisa ser o fim de um mês (ex.: '2024-01-31');
+    senão levanta ValueError. Produtos sem checkpoint no corte (cadastrados depois) partem do saldo atual.
+    """
+    inicio_seguinte = momento + arquivo.UM_MICROSSEGUNDO
+    if inicio_seguinte != arquivo.inicio_do_mes(inicio_seguinte):
+        raise ValueError(f'As movimentações anteriores a {corte:%Y-%m-%d} estão arquivadas: '
+                         'para datas anteriores, use o fim de um mês (ex.: AAAA-MM-DD do último dia).')
+    sinal = StockMovement.quantidade_com_sinal()
+    ancora = (
+        select(StockCheckpoint.product_id, StockCheckpoint.quantity)
+        .where(StockCheckpoint.date == arquivo.instante_do_checkpoint(corte))
+        .subquery()
+    )
+    arquivada = (
+        select(StockMovementSummary.product_id,
+               func.sum(StockMovementSummary.units_in - StockMovementSummary.units_out).label('variacao'))
+        .where(StockMovementSummary.month >= inicio_seguinte.date())
+        .group_by(StockMovementSummary.product_id)
+        .subquery()
+    )
+    # Movimentações depois da data ainda na tabela: antes do corte (arquivamento interrompido) e depois
+    na_tabela = (
+        select(StockMovement.product_id,
+               func.sum(db.case((StockMovement.date < corte, sinal), else_=0)).label('antes_do_corte'),
+               func.sum(sinal).label('variacao'))
+        .where(StockMovement.date > momento)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    fragmentados = locais.somas_fragmentados()
+    saldo = db.case(
+        (ancora.c.quantity.isnot(None),
+         ancora.c.quantity - func.coalesce(arquivada.c.variacao, 0) - func.coalesce(na_tabela.c.antes_do_corte, 0)),
+        else_=func.coalesce(fragmentados.c.quantity, Product.quantity_in_stock, 0) - func.coalesce(na_tabela.c.variacao, 0),
+    )
+    return (
+        select(Product.id.label('product_id'), saldo.label('saldo'))
+        .outerjoin(ancora, ancora.c.product_id == Product.id)
+        .outerjoin(arquivada, arquivada.c.product_id == Product.id)
+        .outerjoin(na_tabela, na_tabela.c.product_id == Product.id)
+        .outerjoin(fragmentados, fragmentados.c.product_id == Product.id)
+    )
+
+
+def gerar_checkpoints(momento=None):
+    """
+    Grava um checkpoint de todos os produtos na data `momento` (padrão: agora).
+    Roda como um único INSERT ... SELECT, sem trazer as linhas para a aplicação.
+    Rodar de novo para a mesma data substitui os checkpoints daquela data.
+    Retorna o número de checkpoints gravados. Levanta ValueError para uma data já arquivada
+    que não seja o fim de um mês.
+    """
+    momento = momento or datetime.utcnow()
+    corte = arquivo.limite()
+    if corte is not None and momento == arquivo.instante_do_checkpoint(corte):
+        # Checkpoint do último arquivamento: é a âncora dos saldos anteriores e não é refeito
+        return db.session.scalar(select(func.count()).where(StockCheckpoint.date == momento))
+    saldos = _consulta_saldos_em(momento).subquery()
+    db.session.execute(delete(StockCheckpoint).where(StockCheckpoint.date == momento))
+    resultado = db.session.execute(
+        insert(StockCheckpoint).from_select(
+            ['product_id', 'date', 'quantity'],
+            select(saldos.c.product_id, literal(momento, DateTime), saldos.c.saldo),
+        )
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def valorizacao_em(momento):
+    """
+    Valor do estoque na data `momento`: soma de saldo x preço de todos os produtos.
+    O preço usado é o atual (o cadastro não guarda histórico de preços).
+    Retorna um dicionário com produtos, unidades e valor_total. Levanta ValueError para uma
+    data já arquivada que não seja o fim de um mês.
+    """
+    saldos = _consulta_saldos_em(momento).subquery()
+    produtos, unidades, valor = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(saldos.c.saldo), 0),
+               func.coalesce(func.sum(saldos.c.saldo * Product.price), 0))
+        .select_from(saldos).join(Product, Product.id == saldos.c.product_id)
+    ).one()
+    return {'momento': momento, 'produtos': produtos, 'unidades': unidades, 'valor_total': valor}
+
+
+def _consulta_reconciliacao(com_checkpoint):
+    """
+    Produtos cujo saldo atual difere do livro: (product_id, code, atual, saldo_livro).
+    Com checkpoint, o livro é o último checkpoint mais as movimentações posteriores; sem, é a soma
+    de todas as movimentações do produto. Nos fragmentados o saldo atual é a soma dos locais.
+    """
+    sinal = StockMovement.quantidade_com_sinal()
+    ultimo = (
+        select(StockCheckpoint.product_id, func.max(StockCheckpoint.date).label('date'))
+        .group_by(StockCheckpoint.product_id)
+        .subquery()
+    )
+    checkpoint = (
+        select(StockCheckpoint.product_id, StockCheckpoint.date, StockCheckpoint.quantity)
+        .join(ultimo, and_(ultimo.c.product_id == StockCheckpoint.product_id, ultimo.c.date == StockCheckpoint.date))
+        .subquery()
+    )
+    variacao = (
+        select(StockMovement.product_id, func.sum(sinal).label('variacao'))
+        .outerjoin(checkpoint, checkpoint.c.product_id == StockMovement.product_id)
+        .where((checkpoint.c.date.is_(None)) | (StockMovement.date > checkpoint.c.date))
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    fragmentados = locais.somas_fragmentados()
+    saldo_livro = func.coalesce(checkpoint.c.quantity, 0) + func.coalesce(variacao.c.variacao, 0)
+    atual = func.coalesce(fragmentados.c.quantity, Product.quantity_in_stock, 0)
+    tem_checkpoint = checkpoint.c.product_id.is_not(None) if com_checkpoint else checkpoint.c.product_id.is_(None)
+    return (
+        select(Product.id, Product.code, atual, saldo_livro)
+        .outerjoin(checkpoint, checkpoint.c.product_id == Product.id)
+        .outerjoin(variacao, variacao.c.product_id == Product.id)
+        .outerjoin(fragmentados, fragmentados.c.product_id == Product.id)
+        .where(tem_checkpoint, atual != saldo_livro)
+        .order_by(Product.id)
+    )
+
+
+def reconciliar(tamanho_bloco=5000):
+    """
+    Confere Product.quantity_in_stock contra o livro de movimentações, nos produtos com checkpoint.
+
+    Saldo esperado = último checkpoint do produto + movimentações posteriores a ele.
+    A comparação é feita numa única consulta agregada, lida em blocos (yield_per),
+    que devolve só os produtos divergentes: gera tuplas (product_id, code, quantity_in_stock, saldo_livro).
+    Só leitura: nos produtos fragmentados o saldo atual é a soma dos locais, calculada na mesma
+    consulta (nada é consolidado; ver app.services.locais).
+    Os produtos sem checkpoint ficam de fora (ver sem_checkpoint).
+    """
+    for linha in db.session.execute(_consulta_reconciliacao(True).execution_options(yield_per=tamanho_bloco)):
+        yield tuple(linha)
+
+
+def sem_checkpoint(tamanho_bloco=5000):
+    """
+    Produtos sem checkpoint cujo saldo atual difere da soma de todas as suas movimentações:
+    gera tuplas (product_id, code, quantity_in_stock, soma_movimentacoes).
+
+    Não são divergências: num banco anterior ao livro o estoque existia antes da primeira
+    movimentação. Um checkpoint (gerar_checkpoints, ancorado no saldo atual) fixa esse estoque
+    de abertura, e a partir dele o produto passa a ser conferido por reconciliar.
+    """
+    for linha in db.session.execute(_consulta_reconciliacao(False).execution_options(yield_per=tamanho_bloco)):
+        yield tuple(linha)
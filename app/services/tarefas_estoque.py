@@ -0,0 +1,115 @@
+import csv
+import os
+
+from flask import current_app
+
+from app.services import arquivo, catalogo, consolidados, locais, previsao, saldos
+from app.tarefas import tarefa
+
+# Operações pesadas de estoque executadas como tarefas em segundo plano (ver app/tarefas.py).
+# Cada função recebe o ContextoTarefa e informa o andamento por ele; é nesse ponto que um
+# pedido de cancelamento interrompe a tarefa.
+
+
+def _apagar_upload(caminho, **_):
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+@tarefa('importar_catalogo', publica=False, descartar=_apagar_upload)
+def importar_catalogo(contexto, entidade, formato, caminho):
+    """Importa o arquivo enviado (já salvo em `caminho`, que é apagado no fim)."""
+    def progresso(estatisticas):
+        contexto.progresso(estatisticas['lidos'], mensagem=(
+            f"{estatisticas['inseridos']} inseridas, {estatisticas['atualizados']} atualizadas, "
+            f"{estatisticas['erros']} com erro ({estatisticas['linhas_por_segundo']:.0f} linhas/s)"))
+
+    try:
+        with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+            return catalogo.importar(arquivo, entidade, formato, progresso=progresso)
+    finally:
+        _apagar_upload(caminho)
+
+
+@tarefa('exportar_catalogo')
+def exportar_catalogo(contexto, entidade, formato='csv'):
+    """Exporta produtos, categorias ou fornecedores para um arquivo, baixado depois pela rota de resultado."""
+    if entidade not in catalogo.ENTIDADES:
+        raise catalogo.ImportacaoError(f'Entidade inválida: {entidade}')
+    linhas = 0
+    with open(contexto.arquivo_resultado(f'{entidade}.{formato}'), 'w', encoding='utf-8', newline='') as saida:
+        for pedaco in catalogo.exportar(entidade, formato):
+            saida.write(pedaco)
+            linhas += pedaco.count('\n')
+            contexto.progresso(linhas)
+    return {'linhas': linhas - (1 if formato == 'csv' else 0)}
+
+
+@tarefa('checkpoint')
+def gerar_checkpoint(contexto, data=None):
+    """Grava o saldo de todos os produtos na data informada (padrão: agora)."""
+    momento = saldos.interpretar_momento(data) if data else None
+    return {'checkpoints': saldos.gerar_checkpoints(momento)}
+
+
+@tarefa('reconciliar')
+def reconciliar(contexto):
+    """
+    Confere o estoque contra o livro de movimentações. O CSV lista as divergências e, à parte
+    (situacao 'sem_checkpoint'), os produtos sem checkpoint com estoque anterior ao livro, não conferidos.
+    """
+    divergentes = sem_checkpoint = 0
+    with open(contexto.arquivo_resultado('divergencias.csv'), 'w', encoding='utf-8', newline='') as saida:
+        escritor = csv.writer(saida)
+        escritor.writerow(['product_id', 'code', 'quantity_in_stock', 'saldo_livro', 'diferenca', 'situacao'])
+        for product_id, codigo, atual, livro in saldos.reconciliar():
+            divergentes += 1
+            escritor.writerow([product_id, codigo, atual, livro, atual - livro, 'divergente'])
+            contexto.progresso(divergentes)
+        for product_id, codigo, atual, livro in saldos.sem_checkpoint():
+            sem_checkpoint += 1
+            escritor.writerow([product_id, codigo, atual, livro, atual - livro, 'sem_checkpoint'])
+    return {'divergentes': divergentes, 'sem_checkpoint': sem_checkpoint}
+
+
+@tarefa('consolidar_locais')
+def consolidar_locais(contexto):
+    """Corrige o total dos produtos fragmentados que divergiu da soma dos saldos por local."""
+    return {'produtos': locais.consolidar()}
+
+
+@tarefa('arquivar_movimentacoes')
+def arquivar_movimentacoes(contexto, antes):
+    """Arquiva as movimentações dos meses anteriores ao mês de `antes` (AAAA-MM-DD)."""
+    meses = []
+
+    def progresso(mes, quantidade):
+        meses.append(mes)
+        contexto.progresso(len(meses), mensagem=f'{mes:%Y-%m}: {quantidade} movimentações arquivadas')
+
+    return arquivo.arquivar(saldos.interpretar_momento(antes), progresso=progresso)
+
+
+@tarefa('reconstruir_consolidados')
+def reconstruir_consolidados(contexto, desde=None):
+    """Recalcula os consolidados de vendas (a partir do mês de `desde`, ou todo o histórico)."""
+    inicio = saldos.interpretar_momento(desde) if desde else None
+    meses = []
+
+    def progresso(mes):
+        meses.append(mes)
+        contexto.progresso(len(meses), mensagem=f'{mes:%Y-%m} gravado')
+
+    return {'itens': consolidados.reconstruir(inicio, progresso=progresso), 'meses': len(meses)}
+
+
+@tarefa('sugestoes_compra')
+def gerar_sugestoes_compra(contexto, prazo=None, cobertura=None, z=None, dias=previsao.DIAS_HISTORICO):
+    """Recalcula as sugestões de compra (parâmetros ausentes vêm da configuração)."""
+    config = current_app.config
+    return previsao.gerar_sugestoes(
+        prazo=prazo if prazo is not None else config['PREVISAO_PRAZO_ENTREGA_DIAS'],
+        cobertura=cobertura if cobertura is not None else config['PREVISAO_COBERTURA_DIAS'],
+        z=z if z is not None else config['PREVISAO_NIVEL_SERVICO_Z'],
+        dias=dias,
+    )
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotadoError
+
+from flask import current_app, has_app_context, session
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from werkzeug.security import check_password_hash
+
+from app import db
+from app.cache import CacheLRU
+from app.models import User
+from app.services import referencia
+
+# Carregamento de usuários logados e verificação de senha no login.
+#
+# O user_loader do Flask-Login roda em toda requisição autenticada. Em vez de buscar o User
+# no banco a cada vez, cada worker guarda um UsuarioSessao (cópia somente leitura,
+# desligada da sessão do SQLAlchemy) num CacheLRU por id.
+#
+# A versão do usuário é um hash de password_hash, role e is_active, gravado na sessão
+# no login. Se a versão da sessão não bate com a do cache, o usuário é relido do banco.
+# Se ainda assim não bater (a senha, o papel ou o status mudaram depois do login), a sessão
+# deixa de valer.
+#
+# Cada entrada guarda também a versão do conjunto 'usuarios' em CacheVersion (app/services/referencia.py),
+# incrementada depois do commit de qualquer alteração ou exclusão de User. A versão é lida uma vez
+# por requisição (a mesma consulta das versões de referência, por chave primária numa tabela de
+# poucas linhas); se mudou, a entrada é relida. Assim uma desativação ou troca de senha feita em
+# um worker vale nos demais já na requisição seguinte, e não só depois de USUARIO_CACHE_TTL.
+# No próprio worker, os ids alterados são anotados em session.info e removidos do cache
+# depois do commit: removê-los no flush deixaria outra requisição recarregar a linha antiga
+# (ainda não confirmada) e guardá-la até o TTL.
+#
+# A verificação de senha (hash proposital e caro) roda num pool limitado de threads.
+# Logins além da capacidade do pool + fila são recusados na hora com LoginSobrecarregadoError,
+# em vez de ocupar as threads que atendem as páginas de estoque.
+
+CHAVE_SESSAO = '_versao_usuario'
+
+# Ids de usuários alterados na transação atual, em session.info
+CHAVE_ALTERADOS = 'usuarios_alterados'
+
+
+class LoginSobrecarregadoError(Exception):
+    """Levantada quando há logins demais sendo verificados ao mesmo tempo neste worker."""
+
+
+def versao_autenticacao(password_hash, role, is_active):
+    """Versão dos dados de autenticação: muda quando a senha, o papel ou o status mudam."""
+    texto = f'{password_hash}|{role}|{bool(is_active)}'
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+
+class UsuarioSessao(UserMixin):
+    """Cópia somente leitura do usuário logado, guardada no cache do worker."""
+
+    def __init__(self, id, username, email, role, is_active, versao):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.ativo = bool(is_active)
+        self.versao = versao
+
+    @property
+    def is_active(self):
+        return self.ativo
+
+    def __repr__(self):
+        return f'<UsuarioSessao {self.username}>'
+
+
+class VerificadorSenhas:
+    """Pool limitado para check_password_hash: `trabalhadores` em paralelo e até `fila` esperando."""
+
+    def __init__(self, trabalhadores, fila, espera):
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='verifica-senha')
+        self._vagas = threading.BoundedSemaphore(trabalhadores + fila)
+        self.espera = espera
+
+    def verificar(self, password_hash, senha):
+        if not self._vagas.acquire(blocking=False):
+            raise LoginSobrecarregadoError('Muitas tentativas de login simultâneas. Tente novamente em instantes.')
+        try:
+            futuro = self._executor.submit(check_password_hash, password_hash, senha)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.espera)
+        except TempoEsgotadoError:
+            raise LoginSobrecarregadoError('A verificação de login demorou demais. Tente novamente em instantes.')
+
+
+def init_app(app):
+    """Cria o cache de usuários e o pool de verificação de senhas do worker."""
+    app.extensions['cache_usuarios'] = CacheLRU(app.config['USUARIO_CACHE_MAXIMO'], app.config['USUARIO_CACHE_TTL'])
+    app.extensions['verificador_senhas'] = VerificadorSenhas(
+        app.config['LOGIN_VERIFICACOES_SIMULTANEAS'], app.config['LOGIN_FILA_MAXIMA'], app.config['LOGIN_ESPERA_MAXIMA'])
+
+
+def _ler(user_id):
+    linha = db.session.execute(
+        select(User.id, User.username, User.email, User.role, User.is_active, User.password_hash)
+        .where(User.id == user_id)
+    ).first()
+    if linha is None:
+        return None
+    return UsuarioSessao(linha.id, linha.username, linha.email, linha.role, linha.is_active,
+                         versao_autenticacao(linha.password_hash, linha.role, linha.is_active))
+
+
+def _do_cache(cache, user_id):
+    # A versão é lida antes do usuário: se mudar durante a carga, a próxima leitura já relê
+    versao = referencia.versao('usuarios')
+    versao_entrada, usuario = cache.obter(user_id, lambda: (versao, _ler(user_id)))
+    if versao_entrada != versao:
+        cache.remover(user_id) # Usuário alterado em algum worker depois da carga
+        versao_entrada, usuario = cache.obter(user_id, lambda: (versao, _ler(user_id)))
+    if usuario is None:
+        cache.remover(user_id) # Não guarda ids inexistentes
+    return usuario
+
+
+def carregar_usuario(user_id):
+    """
+    user_loader do Flask-Login. Devolve o UsuarioSessao ou None (id inexistente, usuário inativo
+    ou sessão aberta antes de uma troca de senha/papel/status).
+    """
+    cache = current_app.extensions['cache_usuarios']
+    usuario = _do_cache(cache, user_id)
+    carimbo = session.get(CHAVE_SESSAO)
+    if usuario is not None and carimbo is not None and carimbo != usuario.versao:
+        # A entrada do cache pode estar desatualizada (alteração feita em outro worker)
+        cache.remover(user_id)
+        usuario = _do_cache(cache, user_id)
+        if usuario is not None and carimbo != usuario.versao:
+            return None
+    if usuario is None or not usuario.is_active:
+        return None
+    if carimbo is None:
+        session[CHAVE_SESSAO] = usuario.versao # Sessões anteriores ao carimbo ou restauradas pelo "lembrar-me"
+    return usuario
+
+
+def carimbar_sessao(usuario):
+    """Grava na sessão a versão atual do usuário (chamar após login_user ou troca de senha)."""
+    session[CHAVE_SESSAO] = versao_autenticacao(usuario.password_hash, usuario.role, usuario.is_active)
+
+
+def verificar_senha(usuario, senha):
+    """Confere a senha no pool limitado do worker. Levanta LoginSobrecarregadoError se estiver cheio."""
+    return current_app.extensions['verificador_senhas'].verificar(usuario.password_hash, senha)
+
+
+def _usuario_alterado(mapper, conexao, alvo):
+    sessao = object_session(alvo)
+    if sessao is not None:
+        sessao.info.setdefault(CHAVE_ALTERADOS, set()).add(alvo.id)
+
+
+event.listen(User, 'after_update', _usuario_alterado)
+event.listen(User, 'after_delete', _usuario_alterado)
+
+
+@event.listens_for(Session, 'after_commit')
+def _remover_depois_do_commit(sessao):
+    """Remove do cache do worker os usuários alterados pelo commit."""
+    ids = sessao.info.pop(CHAVE_ALTERADOS, None)
+    if not ids or not has_app_context() or 'cache_usuarios' not in current_app.extensions:
+        return
+    cache = current_app.extensions['cache_usuarios']
+    for user_id in ids:
+        cache.remover(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar(sessao, transacao_anterior):
+    sessao.info.pop(CHAVE_ALTERADOS, None)
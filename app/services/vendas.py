@@ -0,0 +1,141 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import select, insert
+
+from app import db
+from app.models import Product, Sale, SaleItem, StockMovement
+from app.services import consolidados, locais
+from app.services.movimentacao import com_retentativa, ajustar_saldo, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+
+# Serviço de checkout (finalização de vendas do PDV).
+#
+# Ordem das operações dentro da transação:
+#   1. baixa de estoque no local do caixa com UPDATE condicional (ajustar_saldo), produto a
+#      produto, em ordem crescente de id. O UPDATE trava as linhas do produto, e como todos os
+#      caixas travam na mesma ordem não há deadlock entre vendas concorrentes com produtos em comum;
+#   2. uma única consulta para os preços de todo o carrinho (linhas já travadas pelo passo 1);
+#   3. cálculo com Decimal e gravação da venda, dos itens e das movimentações em massa;
+#   4. atualização dos consolidados de vendas (relatórios);
+#   5. um único commit.
+
+CENTAVOS = Decimal('0.01')
+
+
+class VendaInvalidaError(Exception):
+    """Levantada quando o carrinho ou o pagamento são inválidos. Nada é gravado."""
+
+
+def _decimal(valor):
+    """Converte o valor recebido (str, int, Decimal) para Decimal com duas casas."""
+    try:
+        numero = Decimal(str(valor))
+        if not numero.is_finite():
+            raise InvalidOperation # NaN passaria pelo quantize e só falharia na comparação com o total
+        return numero.quantize(CENTAVOS)
+    except (InvalidOperation, ValueError):
+        raise VendaInvalidaError(f'Valor inválido: {valor!r}.')
+
+
+def _agrupar_itens(itens):
+    """Soma as quantidades por produto (o mesmo produto pode ter sido lido várias vezes no caixa)."""
+    quantidades = {}
+    for item in itens:
+        product_id = item.get('product_id') if isinstance(item, dict) else None
+        quantidade = item.get('quantity') if isinstance(item, dict) else None
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise VendaInvalidaError('Cada item precisa de um product_id inteiro.')
+        if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+            raise VendaInvalidaError(f'Quantidade inválida para o produto {product_id}.')
+        quantidades[product_id] = quantidades.get(product_id, 0) + quantidade
+    if not quantidades:
+        raise VendaInvalidaError('O carrinho está vazio.')
+    return quantidades
+
+
+@com_retentativa
+def finalizar_venda(user_id, itens, amount_paid=None, location_id=None):
+    """
+    Finaliza uma venda de forma atômica.
+
+    `itens` é uma lista de {'product_id': int, 'quantity': int}. `amount_paid` é o valor pago
+    (se None, considera-se o valor exato). A baixa é feita no local `location_id` (padrão: o local
+    padrão do estoque). Retorna um dicionário com sale_id, total_amount,
+    amount_paid, change e os itens com o preço congelado no momento da venda.
+
+    Levanta:
+        VendaInvalidaError: carrinho, produto ou pagamento inválidos.
+        EstoqueInsuficienteError: algum produto não tem saldo suficiente no local.
+    """
+    quantidades = _agrupar_itens(itens)
+    pago_informado = None if amount_paid in (None, '') else _decimal(amount_paid)
+    ids = sorted(quantidades) # Ordem fixa de travamento das linhas
+    agora = datetime.utcnow()
+    location_id = location_id or locais.padrao_id()
+
+    for product_id in ids:
+        try:
+            ajustar_saldo(product_id, location_id, -quantidades[product_id], agora)
+        except EstoqueInsuficienteError:
+            db.session.rollback()
+            raise
+        except ProdutoNaoEncontradoError:
+            db.session.rollback()
+            raise VendaInvalidaError(f'Produto {product_id} não encontrado.')
+
+    # Preços (e categoria/fornecedor, para os consolidados) de todo o carrinho numa consulta só
+    produtos = {
+        linha.id: linha for linha in db.session.execute(
+            select(Product.id, Product.price, Product.category_id, Product.supplier_id).where(Product.id.in_(ids))
+        )
+    }
+
+    itens_venda = []
+    total = Decimal('0.00')
+    for product_id in ids:
+        preco = Decimal(produtos[product_id].price).quantize(CENTAVOS)
+        subtotal = (preco * quantidades[product_id]).quantize(CENTAVOS)
+        total += subtotal
+        itens_venda.append({
+            'product_id': product_id,
+            'quantity': quantidades[product_id],
+            'price_per_item': preco,
+            'subtotal': subtotal,
+        })
+
+    pago = total if pago_informado is None else pago_informado
+    if pago < total:
+        db.session.rollback()
+        raise VendaInvalidaError(f'Valor pago ({pago}) menor que o total da venda ({total}).')
+
+    venda = Sale(date=agora, total_amount=total, amount_paid=pago, change=pago - total, user_id=user_id)
+    db.session.add(venda)
+    db.session.flush() # Gera o id da venda para os itens
+
+    db.session.execute(insert(SaleItem), [dict(item, sale_id=venda.id) for item in itens_venda])
+    db.session.execute(insert(StockMovement), [
+        {
+            'date': agora,
+            'movement_type': 'saida',
+            'quantity': item['quantity'],
+            'reason': f'Venda #{venda.id}',
+            'product_id': item['product_id'],
+            'location_id': location_id,
+        }
+        for item in itens_venda
+    ])
+    # Consolidados de vendas (relatórios), na mesma transação da venda
+    consolidados.registrar_venda(agora, user_id, [
+        dict(item, category_id=produtos[item['product_id']].category_id,
+             supplier_id=produtos[item['product_id']].supplier_id)
+        for item in itens_venda
+    ])
+    resumo = {
+        'sale_id': venda.id,
+        'total_amount': total,
+        'amount_paid': pago,
+        'change': pago - total,
+        'itens': itens_venda,
+    }
+    db.session.commit()
+    return resumo
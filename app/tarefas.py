@@ -0,0 +1,242 @@
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import BackgroundJob
+
+# Tarefas em segundo plano (tabela BackgroundJob).
+#
+# A requisição grava a tarefa como 'pendente' e a entrega a um pool limitado de threads do
+# worker. Em seguida responde com o id. Cada tarefa roda no seu próprio app context e,
+# portanto, na sua própria sessão do banco. Ela é descartada (db.session.remove) ao terminar.
+# Quando o pool e a fila estão cheios, a submissão é recusada com TarefasSobrecarregadasError,
+# em vez de acumular trabalho sem limite.
+#
+# O andamento é gravado numa conexão à parte (a tarefa pode ter a própria transação aberta),
+# no máximo a cada TAREFAS_INTERVALO_PROGRESSO segundos. Nesse mesmo momento a tarefa
+# confere se o cancelamento foi pedido. O cancelamento é cooperativo: a tarefa para no
+# próximo registro de andamento, com rollback do que ainda não foi confirmado.
+# No SQLite isso depende do WAL (perfil sqlite-wal, o padrão): sem ele, gravar o andamento
+# enquanto a própria tarefa lê em blocos espera o busy_timeout e o registro é pulado.
+# Estado e pedido de cancelamento ficam no banco, então qualquer worker pode consultar ou
+# cancelar. Tarefas de um processo que morreu ficam como estão (pendente/executando).
+
+# tipo -> (função, pode ser submetida pela API genérica, limpeza se cancelada antes de começar)
+TIPOS = {}
+
+
+class TarefaCancelada(Exception):
+    """Levantada dentro da tarefa quando o cancelamento foi pedido."""
+
+
+class TarefasSobrecarregadasError(Exception):
+    """Levantada quando o pool de tarefas do worker e a sua fila estão cheios."""
+
+
+class ParametrosTarefaError(ValueError):
+    """Tipo de tarefa desconhecido ou parâmetros que a tarefa não aceita."""
+
+
+def tarefa(tipo, publica=True, descartar=None):
+    """
+    Registra uma função como tipo de tarefa. A função recebe um ContextoTarefa e os parâmetros
+    (serializáveis em JSON) e devolve um resumo, também serializável, do resultado.
+    Tarefas não públicas só podem ser submetidas pelo código da aplicação (ex.: a importação,
+    que recebe o caminho de um arquivo no servidor). `descartar`, se informado, recebe os
+    parâmetros de uma tarefa cancelada antes de começar (ex.: para apagar o arquivo enviado).
+    """
+    def registrar(funcao):
+        TIPOS[tipo] = (funcao, publica, descartar)
+        return funcao
+    return registrar
+
+
+class ContextoTarefa:
+    """Andamento, cancelamento e arquivo de resultado de uma tarefa em execução."""
+
+    def __init__(self, job_id, intervalo, diretorio):
+        self.job_id = job_id
+        self.intervalo = intervalo
+        self.diretorio = diretorio
+        self.caminho_resultado = None
+        self._ultimo_registro = 0.0
+
+    def progresso(self, feito, total=None, mensagem=None):
+        """
+        Registra o andamento (limitado a um registro por intervalo) e levanta
+        TarefaCancelada se o cancelamento foi pedido.
+        """
+        agora = time.monotonic()
+        if agora - self._ultimo_registro < self.intervalo:
+            return
+        self._ultimo_registro = agora
+        valores = {'progress': feito, 'updated_at': datetime.utcnow()}
+        if total is not None:
+            valores['progress_total'] = total
+        if mensagem is not None:
+            valores['message'] = mensagem[:255]
+        try:
+            with db.engine.begin() as conexao:
+                conexao.execute(update(BackgroundJob).where(BackgroundJob.id == self.job_id).values(**valores))
+                cancelar = conexao.scalar(select(BackgroundJob.cancel_requested).where(BackgroundJob.id == self.job_id))
+        except OperationalError:
+            # Banco ocupado: o andamento é informativo, fica para o próximo registro
+            current_app.logger.debug('Andamento da tarefa %s não gravado (banco ocupado).', self.job_id)
+            return
+        if cancelar:
+            raise TarefaCancelada()
+
+    def arquivo_resultado(self, nome):
+        """Caminho do arquivo de resultado da tarefa (apagado se a tarefa não terminar)."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.caminho_resultado = os.path.join(self.diretorio, f'tarefa-{self.job_id}-{nome}')
+        return self.caminho_resultado
+
+
+class ExecutorTarefas:
+    """Pool limitado: `trabalhadores` tarefas em paralelo e até `fila` esperando."""
+
+    def __init__(self, trabalhadores, fila):
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='tarefa')
+        self._vagas = threading.BoundedSemaphore(trabalhadores + fila)
+
+    def reservar(self):
+        if not self._vagas.acquire(blocking=False):
+            raise TarefasSobrecarregadasError('Há tarefas demais em andamento. Tente novamente em instantes.')
+
+    def liberar(self):
+        self._vagas.release()
+
+    def executar(self, funcao, *args):
+        futuro = self._executor.submit(funcao, *args)
+        futuro.add_done_callback(lambda _: self.liberar())
+        return futuro
+
+
+def init_app(app):
+    """Cria o pool de tarefas em segundo plano do worker."""
+    app.extensions['tarefas'] = ExecutorTarefas(app.config['TAREFAS_TRABALHADORES'], app.config['TAREFAS_FILA_MAXIMA'])
+
+
+def submeter(tipo, parametros=None, user_id=None, interna=False):
+    """
+    Grava a tarefa e a coloca no pool do worker. Retorna o BackgroundJob (status 'pendente').
+    Levanta ParametrosTarefaError para tipo ou parâmetros inválidos e
+    TarefasSobrecarregadasError se o pool estiver cheio.
+    """
+    parametros = parametros or {}
+    if tipo not in TIPOS or not (TIPOS[tipo][1] or interna):
+        raise ParametrosTarefaError(f'Tipo de tarefa desconhecido: {tipo}')
+    funcao = TIPOS[tipo][0]
+    try:
+        inspect.signature(funcao).bind(None, **parametros)
+    except TypeError as erro:
+        raise ParametrosTarefaError(f'Parâmetros inválidos para {tipo}: {erro}') from erro
+
+    executor = current_app.extensions['tarefas']
+    executor.reservar()
+    try:
+        job = BackgroundJob(kind=tipo, status='pendente', params=json.dumps(parametros), user_id=user_id)
+        db.session.add(job)
+        db.session.commit()
+        executor.executar(_executar, current_app._get_current_object(), job.id)
+    except BaseException:
+        executor.liberar()
+        raise
+    return job
+
+
+def _finalizar(job_id, status, **valores):
+    db.session.execute(
+        update(BackgroundJob).where(BackgroundJob.id == job_id)
+        .values(status=status, finished_at=datetime.utcnow(), **valores)
+    )
+    db.session.commit()
+
+
+def _remover_arquivo(caminho):
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def _executar(app, job_id):
+    """Roda a tarefa numa thread do pool, com app context e sessão do banco próprios."""
+    with app.app_context():
+        contexto = ContextoTarefa(job_id, app.config['TAREFAS_INTERVALO_PROGRESSO'], app.config['TAREFAS_DIRETORIO'])
+        try:
+            # Só começa se ainda estiver pendente (pode ter sido cancelada na fila)
+            iniciada = db.session.execute(
+                update(BackgroundJob).where(BackgroundJob.id == job_id, BackgroundJob.status == 'pendente')
+                .values(status='executando', started_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            tipo, parametros = db.session.execute(
+                select(BackgroundJob.kind, BackgroundJob.params).where(BackgroundJob.id == job_id)).one()
+            funcao, _, descartar = TIPOS[tipo]
+            if not iniciada:
+                if descartar:
+                    descartar(**json.loads(parametros or '{}'))
+                return
+            resultado = funcao(contexto, **json.loads(parametros or '{}'))
+            db.session.commit()
+            _finalizar(job_id, 'concluida', result=json.dumps(resultado, default=str),
+                       result_path=contexto.caminho_resultado)
+        except TarefaCancelada:
+            db.session.rollback()
+            _remover_arquivo(contexto.caminho_resultado)
+            _finalizar(job_id, 'cancelada')
+        except Exception as erro:
+            db.session.rollback()
+            app.logger.exception('Tarefa %s falhou.', job_id)
+            _remover_arquivo(contexto.caminho_resultado)
+            _finalizar(job_id, 'erro', error=str(erro) or type(erro).__name__)
+        finally:
+            db.session.remove()
+
+
+def cancelar(job_id):
+    """
+    Pede o cancelamento da tarefa. Uma tarefa pendente é cancelada na hora; uma em execução
+    para no próximo registro de andamento. Retorna False se a tarefa já tinha terminado.
+    """
+    agora = datetime.utcnow()
+    cancelada = db.session.execute(
+        update(BackgroundJob).where(BackgroundJob.id == job_id, BackgroundJob.status == 'pendente')
+        .values(status='cancelada', cancel_requested=True, finished_at=agora)
+    ).rowcount
+    if not cancelada:
+        cancelada = db.session.execute(
+            update(BackgroundJob).where(BackgroundJob.id == job_id, BackgroundJob.status == 'executando')
+            .values(cancel_requested=True)
+        ).rowcount
+    db.session.commit()
+    return bool(cancelada)
+
+
+def descrever(job):
+    """Dicionário (JSON) com o estado da tarefa, usado pelas rotas de consulta."""
+    return {
+        'id': job.id,
+        'tipo': job.kind,
+        'status': job.status,
+        'parametros': json.loads(job.params or '{}'),
+        'progresso': job.progress,
+        'total': job.progress_total,
+        'mensagem': job.message,
+        'resultado': json.loads(job.result) if job.result else None,
+        'tem_arquivo': bool(job.result_path),
+        'erro': job.error,
+        'cancelamento_pedido': job.cancel_requested,
+        'criada_em': job.created_at.isoformat() if job.created_at else None,
+        'iniciada_em': job.started_at.isoformat() if job.started_at else None,
+        'finalizada_em': job.finished_at.isoformat() if job.finished_at else None,
+    }
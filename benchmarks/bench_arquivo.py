@@ -0,0 +1,133 @@
+"""
+Benchmark do arquivamento de movimentações (app.services.arquivo).
+
+Gera um histórico de vários anos e mede, antes e depois de arquivar tudo o que é mais antigo
+que ARQUIVO_RETENCAO_DIAS:
+  1. linhas de stock_movement e páginas do banco ocupadas pela tabela e seus índices (dbstat,
+     quando o SQLite tem a extensão), e o tamanho dos blocos comprimidos contra o JSON original;
+  2. tempo das consultas que percorrem a tabela: reconciliação, checkpoint de todos os produtos,
+     primeira página do histórico e saldo de um produto numa data recente;
+  3. custo das leituras que passam a vir do arquivo: saldo numa data antiga, valorização no fim de
+     um mês antigo e a página do histórico logo depois das linhas da tabela;
+  4. tempo do arquivamento e da verificação.
+
+Uso:
+    python -m benchmarks.bench_arquivo --movimentos 1000000 --dias 1460
+"""
+import argparse
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import StockMovement, StockMovementArchive
+from app.paginacao import codificar_cursor
+from app.services import arquivo, historico, saldos
+from benchmarks.comum import criar_app_benchmark
+from benchmarks.semear import semear
+
+REPETICOES = 5
+
+
+def medir_ms(funcao, repeticoes=REPETICOES):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+        db.session.rollback()
+    return round((time.perf_counter() - inicio) / repeticoes * 1000, 2)
+
+
+def paginas_da_tabela():
+    """Páginas de stock_movement e dos seus índices (None se o SQLite não tiver dbstat)."""
+    try:
+        return db.session.scalar(text(
+            "SELECT count(*) FROM dbstat WHERE name = 'stock_movement' OR name LIKE 'ix_stock_movement_%'"))
+    except OperationalError:
+        db.session.rollback()
+        return None
+
+
+def medir_consultas(antiga, fim_de_mes):
+    """Consultas do dia a dia (tabela) e leituras de datas antigas."""
+    filtros = historico.interpretar_filtros({})
+    # Posição logo depois da última linha da tabela: a próxima página vem do arquivo (se houver)
+    ultima = db.session.execute(
+        select(StockMovement.date, StockMovement.id).order_by(StockMovement.date, StockMovement.id).limit(1)).one()
+    cursor = codificar_cursor(ultima.date, ultima.id)
+    recente = datetime.utcnow() - timedelta(days=30)
+    return {
+        'linhas_tabela': db.session.scalar(select(func.count(StockMovement.id))),
+        'paginas_tabela': paginas_da_tabela(),
+        'reconciliar_ms': medir_ms(lambda: sum(1 for _ in saldos.reconciliar()), 2),
+        'checkpoint_ms': medir_ms(lambda: saldos.gerar_checkpoints(recente), 2),
+        'historico_primeira_ms': medir_ms(lambda: historico.pagina(filtros, None, 50)),
+        'historico_apos_tabela_ms': medir_ms(lambda: historico.pagina(filtros, cursor, 50)),
+        'saldo_recente_ms': medir_ms(lambda: saldos.saldo_em(1, recente), 20),
+        'saldo_antigo_ms': medir_ms(lambda: saldos.saldo_em(1, antiga), 20),
+        'valorizacao_fim_de_mes_ms': medir_ms(lambda: saldos.valorizacao_em(fim_de_mes), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movimentos', type=int, default=1000000)
+    parser.add_argument('--produtos', type=int, default=10000)
+    parser.add_argument('--dias', type=int, default=1460, help='período coberto pelo histórico')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark()
+    resultados = {}
+    with app.app_context():
+        semear(produtos=args.produtos, movimentos=args.movimentos, vendas=0, usuarios=1, dias=args.dias,
+               progresso=lambda etapa, quantidade: print(f'{etapa}: {quantidade}', flush=True))
+        corte = datetime.utcnow() - timedelta(days=app.config['ARQUIVO_RETENCAO_DIAS'])
+        antiga = corte - timedelta(days=args.dias // 3)
+        fim_de_mes = arquivo.inicio_do_mes(antiga) - arquivo.UM_MICROSSEGUNDO
+
+        resultados['antes'] = medir_consultas(antiga, fim_de_mes)
+        esperados = (saldos.saldo_em(1, antiga), saldos.valorizacao_em(fim_de_mes))
+
+        inicio = time.perf_counter()
+        resultados['arquivamento'] = arquivo.arquivar(corte)
+        resultados['arquivamento']['segundos'] = round(time.perf_counter() - inicio, 2)
+        resultados['arquivamento']['corte'] = resultados['arquivamento']['corte'].isoformat()
+        db.session.execute(text('VACUUM'))
+
+        comprimido = original = 0
+        for dados in db.session.scalars(select(StockMovementArchive.data)):
+            comprimido += len(dados)
+            original += len(zlib.decompress(dados))
+        resultados['arquivo'] = {'bytes_json': original, 'bytes_comprimidos': comprimido,
+                                 'bytes_por_movimentacao': round(comprimido / max(resultados['arquivamento']['movimentacoes'], 1), 1)}
+
+        resultados['depois'] = medir_consultas(antiga, fim_de_mes)
+        if (saldos.saldo_em(1, antiga), saldos.valorizacao_em(fim_de_mes)) != esperados:
+            raise SystemExit('FALHA: saldos de datas antigas mudaram depois do arquivamento.')
+
+        inicio = time.perf_counter()
+        verificacao = arquivo.verificar()
+        resultados['verificacao'] = {'segundos': round(time.perf_counter() - inicio, 2), 'erros': len(verificacao['erros']),
+                                     'divergentes': verificacao['divergentes']}
+
+    arquivamento = resultados['arquivamento']
+    print(f"Arquivamento: {arquivamento['movimentacoes']} movimentações de {arquivamento['meses']} meses em "
+          f"{arquivamento['blocos']} blocos, {arquivamento['segundos']}s")
+    print(f"Arquivo: {resultados['arquivo']['bytes_json']} bytes de JSON -> {resultados['arquivo']['bytes_comprimidos']} "
+          f"comprimidos ({resultados['arquivo']['bytes_por_movimentacao']} bytes por movimentação)")
+    for chave in resultados['antes']:
+        print(f"{chave}: {resultados['antes'][chave]} -> {resultados['depois'][chave]}")
+    print(f"Verificação: {resultados['verificacao']['segundos']}s, {resultados['verificacao']['erros']} erro(s), "
+          f"{resultados['verificacao']['divergentes']} divergente(s)")
+    print(f'Banco: {caminho_db}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo_json:
+            json.dump(resultados, arquivo_json, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark do custo de autenticação (app.services.usuarios).
+
+1. Sobrecarga por requisição autenticada: tempo médio e consultas SQL de uma rota
+   trivial com @login_required, com o user_loader original (User.query.get a cada
+   requisição) e com o cache de usuários do worker.
+2. Rajada de logins: várias threads fazem login ao mesmo tempo enquanto outra mede a
+   latência de uma página autenticada. Mostra quantos logins foram aceitos, quantos foram
+   recusados com 429 pelo pool limitado e o p50/p95 da página durante a rajada.
+
+Uso:
+    python -m benchmarks.bench_autenticacao --requisicoes 2000 --logins 32
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+from flask_login import login_required
+
+from app import db, login_manager
+from app.models import User
+from app.services import usuarios
+from benchmarks.comum import criar_app_benchmark
+
+SENHA = 'senha-benchmark'
+
+
+def logar(cliente):
+    return cliente.post('/auth/login', data={'username': 'bench', 'password': SENHA})
+
+
+def medir_sobrecarga(app, requisicoes, carregar):
+    """Tempo médio (µs) e consultas por requisição autenticada com o user_loader `carregar`."""
+    login_manager.user_loader(carregar)
+    cliente = app.test_client()
+    assert logar(cliente).status_code == 302
+    cliente.get('/_bench') # Aquece o cache
+    consultas = 0
+    inicio = time.perf_counter()
+    for _ in range(requisicoes):
+        resposta = cliente.get('/_bench')
+        assert resposta.status_code == 200
+        consultas += int(resposta.headers['X-SQL-Queries'])
+    duracao = time.perf_counter() - inicio
+    return {'us_por_requisicao': round(duracao / requisicoes * 1e6, 1),
+            'consultas_por_requisicao': round(consultas / requisicoes, 2)}
+
+
+def medir_rajada(app, logins):
+    """Logins simultâneos contra latência de uma página autenticada."""
+    cliente_pagina = app.test_client()
+    assert logar(cliente_pagina).status_code == 302
+    parar = threading.Event()
+    latencias = []
+
+    def pagina():
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            cliente_pagina.get('/_bench')
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    resultados = []
+    barreira = threading.Barrier(logins)
+
+    def tentar_login():
+        cliente = app.test_client()
+        barreira.wait()
+        resultados.append(logar(cliente).status_code)
+
+    medidor = threading.Thread(target=pagina)
+    threads = [threading.Thread(target=tentar_login) for _ in range(logins)]
+    medidor.start()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    medidor.join()
+
+    latencias.sort()
+    return {
+        'logins': logins,
+        'aceitos': resultados.count(302),
+        'recusados_429': resultados.count(429),
+        'segundos': round(duracao, 3),
+        'pagina_p50_ms': round(statistics.median(latencias), 2),
+        'pagina_p95_ms': round(latencias[int(len(latencias) * 0.95) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--logins', type=int, default=32, help='logins simultâneos na rajada')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(SQL_INSTRUMENTACAO=True)
+
+    @app.route('/_bench')
+    @login_required
+    def rota_benchmark():
+        return 'ok'
+
+    with app.app_context():
+        usuario = User(username='bench')
+        usuario.set_password(SENHA)
+        db.session.add(usuario)
+        db.session.commit()
+
+    def carregar_original(user_id):
+        return User.query.get(int(user_id))
+
+    resultados = {
+        'antes': medir_sobrecarga(app, args.requisicoes, carregar_original),
+        'depois': medir_sobrecarga(app, args.requisicoes, lambda user_id: usuarios.carregar_usuario(int(user_id))),
+    }
+    for nome, resultado in resultados.items():
+        print(f"{nome:>6}: {resultado['us_por_requisicao']:.1f} µs/requisição, "
+              f"{resultado['consultas_por_requisicao']} consultas/requisição")
+
+    rajada = resultados['rajada'] = medir_rajada(app, args.logins)
+    print(f"Rajada: {rajada['logins']} logins em {rajada['segundos']:.2f}s, {rajada['aceitos']} aceitos, "
+          f"{rajada['recusados_429']} recusados (429); página autenticada p50 {rajada['pagina_p50_ms']} ms, "
+          f"p95 {rajada['pagina_p95_ms']} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
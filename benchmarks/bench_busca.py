@@ -0,0 +1,127 @@
+"""
+Benchmark da busca textual de produtos (app.services.busca).
+
+Gera o catálogo (os gatilhos indexam cada produto na própria carga) e mede:
+  1. tempo da carga dos produtos com o índice e páginas do banco ocupadas por ele (dbstat,
+     quando o SQLite tem a extensão); tempo do reindexar-busca;
+  2. primeira página, página seguinte (cursor) e contagem de buscas típicas: código, prefixo
+     digitado, palavras sem acento, nome + marca, categoria e fornecedor, com filtro de categoria;
+  3. as mesmas buscas pelo LIKE (o caminho dos bancos sem FTS5), para comparação;
+  4. custo dos gatilhos: renomear uma categoria reindexa todos os produtos dela.
+
+Uso:
+    python -m benchmarks.bench_busca --produtos 1000000
+"""
+import argparse
+import json
+import time
+
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Category, Product
+from app.services import busca
+from benchmarks.comum import criar_app_benchmark
+from benchmarks.semear import semear
+
+REPETICOES = 20
+TAMANHO_PAGINA = 25
+
+# (nome, texto digitado, filtrar pela primeira categoria)
+BUSCAS = [
+    ('codigo', 'P000123', False),
+    ('prefixo_curto', 'ar', False),
+    ('sem_acento', 'feijao', False),
+    ('prefixo_longo', 'refriger', False),
+    ('nome_marca_tamanho', 'arroz aurora 1kg', False),
+    ('categoria_fornecedor', 'categoria 0003 fornecedor 0007', False),
+    ('com_filtro', 'cafe serra', True),
+    ('sem_resultado', 'xyzzy', False),
+]
+
+
+def medir_ms(funcao, repeticoes=REPETICOES):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+        db.session.rollback()
+    return round((time.perf_counter() - inicio) / repeticoes * 1000, 2)
+
+
+def paginas_do_indice():
+    """Páginas das tabelas internas do FTS5 (None se o SQLite não tiver dbstat)."""
+    try:
+        return db.session.scalar(text("SELECT count(*) FROM dbstat WHERE name LIKE :nome"),
+                                 {'nome': busca.TABELA_INDICE + '%'})
+    except OperationalError:
+        db.session.rollback()
+        return None
+
+
+def medir_buscas(repeticoes):
+    categoria_id = db.session.scalar(select(Category.id).order_by(Category.id).limit(1))
+    resultados = {}
+    for nome, texto, filtrar in BUSCAS:
+        filtros = [Product.category_id == categoria_id] if filtrar else []
+        ids, cursor = busca.pesquisar(texto, TAMANHO_PAGINA, filtros=filtros)
+        resultados[nome] = {
+            'encontrados': busca.contar(texto, filtros),
+            'primeira_ms': medir_ms(lambda: busca.pesquisar(texto, TAMANHO_PAGINA, filtros=filtros), repeticoes),
+            'seguinte_ms': medir_ms(lambda: busca.pesquisar(texto, TAMANHO_PAGINA, cursor, filtros), repeticoes)
+            if cursor else None,
+            'contar_ms': medir_ms(lambda: busca.contar(texto, filtros), max(repeticoes // 4, 1)),
+        }
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, default=1000000)
+    parser.add_argument('--sem-like', action='store_true', help='não mede as buscas pelo LIKE (lentas no catálogo grande)')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark()
+    resultados = {}
+    with app.app_context():
+        carga = semear(produtos=args.produtos, movimentos=0, vendas=0, usuarios=1,
+                       progresso=lambda etapa, quantidade: print(f'{etapa}: {quantidade}', flush=True))
+        resultados['carga_produtos_s'] = carga['segundos']['produtos']
+        resultados['paginas_indice'] = paginas_do_indice()
+        inicio = time.perf_counter()
+        busca.reconstruir()
+        resultados['reindexar_s'] = round(time.perf_counter() - inicio, 2)
+
+        resultados['fts5'] = medir_buscas(REPETICOES)
+        if not args.sem_like:
+            current_app.extensions['busca']['indice'] = False # Força o caminho dos outros bancos
+            resultados['like'] = medir_buscas(1)
+            current_app.extensions['busca']['indice'] = True
+
+        categoria = db.session.scalar(select(Category).order_by(Category.id).limit(1))
+        inicio = time.perf_counter()
+        categoria.name = categoria.name + ' renomeada'
+        db.session.commit()
+        resultados['renomear_categoria_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        if busca.contar('renomeada') != db.session.query(Product).filter_by(category_id=categoria.id).count():
+            raise SystemExit('FALHA: o índice não acompanhou a categoria renomeada.')
+
+    print(f"Carga de {args.produtos} produtos (com os gatilhos): {resultados['carga_produtos_s']}s; "
+          f"índice: {resultados['paginas_indice']} páginas; reindexar: {resultados['reindexar_s']}s")
+    for nome, medida in resultados['fts5'].items():
+        linha = (f"{nome}: {medida['encontrados']} encontrados; primeira {medida['primeira_ms']} ms, "
+                 f"seguinte {medida['seguinte_ms']} ms, contar {medida['contar_ms']} ms")
+        if 'like' in resultados:
+            linha += f" (LIKE: primeira {resultados['like'][nome]['primeira_ms']} ms)"
+        print(linha)
+    print(f"Renomear uma categoria: {resultados['renomear_categoria_ms']} ms")
+    print(f'Banco: {caminho_db}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo_json:
+            json.dump(resultados, arquivo_json, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark do checkout (app.services.vendas.finalizar_venda).
+
+Mede vendas finalizadas por segundo com 1, 8 e 32 caixas (threads) simultâneos,
+todos vendendo de um mesmo conjunto de produtos. Ao final de cada rodada confere
+que a baixa de estoque bate com os itens vendidos.
+
+Uso:
+    python -m benchmarks.bench_checkout --vendas 200 --produtos 200 --caixas 1 8 32
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from sqlalchemy import select, func, insert
+
+from app import db
+from app.models import Product, SaleItem, User
+from app.services.movimentacao import EstoqueInsuficienteError
+from app.services.vendas import finalizar_venda
+from benchmarks.comum import criar_app_benchmark
+
+ESTOQUE_INICIAL = 1_000_000
+
+
+def caixa(app, user_id, ids_produtos, vendas, semente, contagem, barreira):
+    """Simula um caixa: `vendas` carrinhos de 1 a 5 itens escolhidos aleatoriamente."""
+    gerador = random.Random(semente)
+    finalizadas = 0
+    with app.app_context():
+        barreira.wait()
+        for _ in range(vendas):
+            itens = [{'product_id': gerador.choice(ids_produtos), 'quantity': gerador.randint(1, 3)}
+                     for _ in range(gerador.randint(1, 5))]
+            try:
+                finalizar_venda(user_id, itens)
+                finalizadas += 1
+            except EstoqueInsuficienteError:
+                pass
+        db.session.remove()
+    contagem.append(finalizadas)
+
+
+def rodada(app, user_id, ids_produtos, caixas, vendas_por_caixa):
+    contagem = []
+    barreira = threading.Barrier(caixas)
+    threads = [
+        threading.Thread(target=caixa, args=(app, user_id, ids_produtos, vendas_por_caixa, semente, contagem, barreira))
+        for semente in range(caixas)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    return sum(contagem), duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vendas', type=int, default=200, help='vendas por caixa em cada rodada')
+    parser.add_argument('--produtos', type=int, default=200)
+    parser.add_argument('--caixas', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--db', help='arquivo SQLite a usar (padrão: temporário)')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(args.db)
+    with app.app_context():
+        usuario = User(username='caixa_benchmark')
+        usuario.set_password('benchmark')
+        db.session.add(usuario)
+        db.session.execute(insert(Product), [
+            {'code': f'BENCH-{i}', 'name': f'Produto {i}', 'price': f'{1 + i % 50}.90',
+             'quantity_in_stock': ESTOQUE_INICIAL, 'minimum_stock': 5}
+            for i in range(args.produtos)
+        ])
+        db.session.commit()
+        user_id = usuario.id
+        ids_produtos = list(db.session.scalars(select(Product.id)))
+
+    resultados = []
+    print(f'Banco: {caminho_db}')
+    print(f"{'caixas':>7} {'vendas':>8} {'segundos':>9} {'vendas/s':>9}")
+    for caixas in args.caixas:
+        finalizadas, duracao = rodada(app, user_id, ids_produtos, caixas, args.vendas)
+        resultados.append({'caixas': caixas, 'vendas': finalizadas, 'segundos': round(duracao, 3),
+                           'vendas_por_segundo': round(finalizadas / duracao, 1)})
+        print(f'{caixas:>7} {finalizadas:>8} {duracao:>9.2f} {finalizadas / duracao:>9.1f}')
+
+    # Conferência: tudo o que saiu do estoque está nos itens de venda
+    with app.app_context():
+        baixa = db.session.scalar(select(func.sum(ESTOQUE_INICIAL - Product.quantity_in_stock)))
+        vendido = db.session.scalar(select(func.sum(SaleItem.quantity)))
+    if baixa != vendido:
+        print(f'FALHA: baixa de estoque ({baixa}) diferente da quantidade vendida ({vendido})')
+        sys.exit(1)
+    print(f'OK: baixa de estoque ({baixa}) igual à quantidade vendida.')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
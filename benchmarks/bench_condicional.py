@@ -0,0 +1,101 @@
+"""
+Benchmark do GET condicional da listagem de produtos (app/condicional.py).
+
+Simula visitas repetidas a /estoque/produtos/dados: a primeira busca cada página
+completa (200), as seguintes reenviam o ETag em If-None-Match. Mede, por página:
+  1. bytes transferidos (cabeçalhos + corpo) na resposta completa e no 304;
+  2. tempo de CPU do processo por requisição (test client, sem rede) nos dois casos.
+Ao final, registra uma movimentação e confirma que a próxima revalidação volta a receber 200.
+
+Uso:
+    python -m benchmarks.bench_condicional --produtos 100000
+"""
+import argparse
+import json
+import time
+
+from flask import url_for
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Product
+from app.services.movimentacao import aplicar_movimentacao
+from benchmarks.comum import criar_app_benchmark
+from benchmarks.semear import SENHA_USUARIOS, nome_usuario, semear
+
+REPETICOES = 200
+
+# Páginas visitadas: (nome, parâmetros)
+PAGINAS = [
+    ('primeira_com_total', {'ordenar': 'name', 'tamanho': 25, 'contar': '1'}),
+    ('estoque_desc_100', {'ordenar': 'quantity_in_stock', 'direcao': 'desc', 'tamanho': 100}),
+    ('abaixo_minimo_200', {'ordenar': 'name', 'tamanho': 200, 'abaixo_minimo': '1'}),
+]
+
+
+def tamanho(resposta):
+    """Bytes da resposta: linha de status, cabeçalhos e corpo."""
+    cabecalhos = ''.join(f'{nome}: {valor}\r\n' for nome, valor in resposta.headers.items())
+    return len(f'HTTP/1.1 {resposta.status}\r\n{cabecalhos}\r\n') + len(resposta.get_data())
+
+
+def medir_cpu_ms(funcao):
+    inicio = time.process_time()
+    for _ in range(REPETICOES):
+        funcao()
+    return round((time.process_time() - inicio) / REPETICOES * 1000, 3)
+
+
+def medir_pagina(cliente, url):
+    completa = cliente.get(url)
+    assert completa.status_code == 200, completa.status
+    etag = completa.headers['ETag']
+    revalidada = cliente.get(url, headers={'If-None-Match': etag})
+    assert revalidada.status_code == 304, revalidada.status
+    return {
+        'bytes_200': tamanho(completa),
+        'bytes_304': tamanho(revalidada),
+        'cpu_ms_200': medir_cpu_ms(lambda: cliente.get(url)),
+        'cpu_ms_304': medir_cpu_ms(lambda: cliente.get(url, headers={'If-None-Match': etag})),
+    }, etag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, default=100000)
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    # Folga zero: o semeador acabou de gravar last_updated em todos os produtos
+    app, caminho_db = criar_app_benchmark(VALIDADORES_FOLGA=0)
+    with app.app_context():
+        semear(produtos=args.produtos, movimentos=0, vendas=0, usuarios=1)
+        produto_id = db.session.scalar(select(func.min(Product.id)))
+
+    cliente = app.test_client()
+    with app.test_request_context():
+        assert cliente.post(url_for('auth.login'), data={'username': nome_usuario(0), 'password': SENHA_USUARIOS}).status_code == 302
+        urls = {nome: url_for('estoque.produtos_dados', **parametros) for nome, parametros in PAGINAS}
+
+    resultados, etags = {}, {}
+    for nome, url in urls.items():
+        resultados[nome], etags[nome] = medir_pagina(cliente, url)
+        medida = resultados[nome]
+        print(f"{nome}: 200 = {medida['bytes_200']} bytes, {medida['cpu_ms_200']} ms CPU; "
+              f"304 = {medida['bytes_304']} bytes, {medida['cpu_ms_304']} ms CPU")
+
+    # Uma movimentação muda max(last_updated): o ETag antigo deixa de valer
+    with app.app_context():
+        aplicar_movimentacao(produto_id, 'entrada', 1, 'benchmark')
+    url = urls['primeira_com_total']
+    resultados['apos_movimentacao'] = cliente.get(url, headers={'If-None-Match': etags['primeira_com_total']}).status_code
+    print(f"Revalidação depois de uma movimentação: {resultados['apos_movimentacao']}")
+
+    print(f'Banco: {caminho_db}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
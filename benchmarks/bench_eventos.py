@@ -0,0 +1,138 @@
+"""
+Benchmark dos saldos ao vivo (app.services.eventos_estoque).
+
+Abre N clientes parados no canal de eventos (cada um numa thread, consumindo o mesmo gerador
+usado pela rota /estoque/produtos/eventos) e mede:
+  1. memória Python por cliente conectado (tracemalloc; não inclui a pilha da thread do servidor);
+  2. custo extra de uma movimentação (aplicar_movimentacao) com N clientes conectados;
+  3. atraso entre o commit e a chegada do delta em todos os clientes, no modo 'local'
+     (mesmo worker) e no modo 'banco' (commit feito por outra instância da aplicação,
+     simulando outro worker).
+
+Uso:
+    python -m benchmarks.bench_eventos --clientes 300 --movimentos 200
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+
+from app import db
+from app.models import Product
+from app.services import eventos_estoque
+from app.services.movimentacao import aplicar_movimentacao
+from benchmarks.comum import criar_app_benchmark
+
+
+class Cliente(threading.Thread):
+    """Consome o fluxo de eventos e guarda o instante em que cada quantidade do produto 1 chegou."""
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        with app.app_context():
+            assinatura = eventos_estoque.assinar() # No modo 'banco' também inicia o vigia
+        self.fluxo = eventos_estoque.fluxo(app.extensions['canal_estoque'], assinatura,
+                                           app.config['ESTOQUE_EVENTOS_BATIMENTO'])
+        self.chegadas = {}
+
+    def run(self):
+        for pedaco in self.fluxo:
+            if pedaco.startswith('event: estoque'):
+                agora = time.perf_counter()
+                for product_id, quantidade, _ in json.loads(pedaco.split('data: ', 1)[1]):
+                    if product_id == 1:
+                        self.chegadas.setdefault(quantidade, agora)
+
+
+def medir_movimentos(app, movimentos):
+    """Tempo médio (µs) de aplicar_movimentacao e o instante do commit de cada saldo resultante."""
+    commits = {}
+    with app.app_context():
+        inicio = time.perf_counter()
+        for _ in range(movimentos):
+            saldo = aplicar_movimentacao(1, 'entrada', 1, 'benchmark')
+            commits[saldo] = time.perf_counter()
+        duracao = time.perf_counter() - inicio
+    return round(duracao / movimentos * 1e6, 1), commits
+
+
+def atrasos(clientes, commits):
+    """
+    Atraso (ms) entre cada commit e o primeiro saldo igual ou mais novo recebido por cada cliente.
+    (O modo 'banco' entrega só o saldo mais recente de cada consulta; os intermediários são agrupados.)
+    """
+    valores = []
+    for cliente in clientes:
+        chegadas = sorted(cliente.chegadas.items())
+        for saldo, instante in commits.items():
+            chegada = next((momento for quantidade, momento in chegadas if quantidade >= saldo), None)
+            if chegada is not None:
+                valores.append((chegada - instante) * 1000)
+    valores.sort()
+    return {'entregues': len(valores), 'esperados': len(clientes) * len(commits),
+            'p50_ms': round(statistics.median(valores), 2) if valores else None,
+            'p99_ms': round(valores[int(len(valores) * 0.99) - 1], 2) if valores else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clientes', type=int, default=300)
+    parser.add_argument('--movimentos', type=int, default=200)
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    resultados = {'clientes': args.clientes}
+    app, caminho_db = criar_app_benchmark(ESTOQUE_EVENTOS_MAXIMO_CLIENTES=args.clientes,
+                                          ESTOQUE_EVENTOS_FILA=args.movimentos + 1)
+    with app.app_context():
+        db.session.add(Product(code='B1', name='Produto benchmark', price=1, quantity_in_stock=0, minimum_stock=5))
+        db.session.commit()
+
+    resultados['us_por_movimento_sem_clientes'], _ = medir_movimentos(app, args.movimentos)
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    clientes = [Cliente(app) for _ in range(args.clientes)]
+    for cliente in clientes:
+        cliente.start()
+    time.sleep(0.5)
+    resultados['kb_por_cliente'] = round((tracemalloc.get_traced_memory()[0] - antes) / args.clientes / 1024, 2)
+    tracemalloc.stop()
+
+    resultados['us_por_movimento_com_clientes'], commits = medir_movimentos(app, args.movimentos)
+    time.sleep(0.5)
+    resultados['local'] = atrasos(clientes, commits)
+
+    # Modo 'banco': os clientes estão numa instância, o commit é feito por outra (outro worker)
+    app_leitor, _ = criar_app_benchmark(caminho_db, ESTOQUE_EVENTOS_MODO='banco', ESTOQUE_EVENTOS_INTERVALO=0.2,
+                                        ESTOQUE_EVENTOS_MAXIMO_CLIENTES=args.clientes,
+                                        ESTOQUE_EVENTOS_FILA=args.movimentos + 1)
+    leitores = [Cliente(app_leitor) for _ in range(args.clientes)]
+    for cliente in leitores:
+        cliente.start()
+    time.sleep(0.5)
+    commits = {}
+    with app.app_context():
+        for _ in range(20):
+            commits[aplicar_movimentacao(1, 'entrada', 1, 'benchmark')] = time.perf_counter()
+            time.sleep(0.05)
+    time.sleep(1.5)
+    resultados['banco'] = atrasos(leitores, commits)
+
+    print(f"{args.clientes} clientes: {resultados['kb_por_cliente']} KB por cliente (Python)")
+    print(f"Movimentação: {resultados['us_por_movimento_sem_clientes']} µs sem clientes, "
+          f"{resultados['us_por_movimento_com_clientes']} µs com {args.clientes} clientes")
+    for modo in ('local', 'banco'):
+        medida = resultados[modo]
+        print(f"Modo {modo}: {medida['entregues']}/{medida['esperados']} deltas entregues, "
+              f"atraso p50 {medida['p50_ms']} ms, p99 {medida['p99_ms']} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
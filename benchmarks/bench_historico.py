@@ -0,0 +1,133 @@
+"""
+Benchmark do histórico de movimentações (app.services.historico).
+
+1. Latência de uma página do histórico no começo e no fim da lista: cursor (keyset em
+   (date, id)) contra OFFSET.
+2. Exportação CSV de um ano de movimentações: pico de memória Python (tracemalloc) e
+   velocidade da exportação em blocos (yield_per), comparada a carregar o intervalo
+   inteiro com .all() antes de escrever.
+
+Uso:
+    python -m benchmarks.bench_historico --movimentos 1000000
+    python -m benchmarks.bench_historico --db /tmp/carga.db   # banco já semeado (benchmarks.semear)
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import StockMovement
+from app.paginacao import codificar_cursor
+from app.services import historico
+from benchmarks.comum import criar_app_benchmark
+from benchmarks.semear import semear
+
+REPETICOES = 20
+
+
+def medir_ms(funcao, repeticoes=REPETICOES):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return round((time.perf_counter() - inicio) / repeticoes * 1000, 2)
+
+
+def medir_paginas(tamanho):
+    """Primeira e última página do histórico, por cursor e por OFFSET."""
+    filtros = historico.interpretar_filtros({})
+    total = db.session.scalar(select(func.count(StockMovement.id)))
+    # Cursor da última página: posição (date, id) da linha logo antes dela
+    antes_ultima = db.session.execute(
+        select(StockMovement.date, StockMovement.id)
+        .order_by(StockMovement.date.desc(), StockMovement.id.desc()).offset(max(total - tamanho - 1, 0)).limit(1)
+    ).one()
+    cursor = codificar_cursor(antes_ultima.date, antes_ultima.id)
+    por_offset = (historico._consulta(filtros)
+                  .order_by(StockMovement.date.desc(), StockMovement.id.desc()).limit(tamanho))
+    return {
+        'movimentos': total,
+        'cursor_primeira_ms': medir_ms(lambda: historico.pagina(filtros, None, tamanho)),
+        'cursor_ultima_ms': medir_ms(lambda: historico.pagina(filtros, cursor, tamanho)),
+        'offset_ultima_ms': medir_ms(lambda: db.session.execute(por_offset.offset(total - tamanho)).all(), 3),
+    }
+
+
+def _em_blocos(filtros):
+    linhas = 0
+    for pedaco in historico.exportar_csv(filtros):
+        linhas += pedaco.count('\n')
+    return linhas - 1 # Sem o cabeçalho
+
+
+def _tudo_em_memoria(filtros):
+    todas = db.session.execute(historico._consulta(filtros).order_by(StockMovement.date, StockMovement.id)).all()
+    escritor = csv.writer(io.StringIO())
+    for linha in todas:
+        escritor.writerow(linha)
+    return len(todas)
+
+
+def medir_exportacao(filtros):
+    """
+    Pico de memória e tempo da exportação em blocos contra a leitura inteira com .all().
+    O tempo é medido numa execução sem tracemalloc (que deixa cada alocação bem mais lenta).
+    """
+    resultados = {}
+    for nome, funcao in (('em_blocos', _em_blocos), ('tudo_em_memoria', _tudo_em_memoria)):
+        inicio = time.perf_counter()
+        linhas = funcao(filtros)
+        duracao = time.perf_counter() - inicio
+        db.session.rollback()
+        tracemalloc.start()
+        funcao(filtros)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        db.session.rollback()
+        resultados[nome] = {'linhas': linhas, 'segundos': round(duracao, 2), 'pico_memoria_mb': round(pico / 1e6, 1)}
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='banco SQLite já semeado (senão, cria um temporário)')
+    parser.add_argument('--movimentos', type=int, default=1000000, help='movimentações geradas no banco temporário')
+    parser.add_argument('--produtos', type=int, default=10000)
+    parser.add_argument('--tamanho', type=int, default=50, help='linhas por página')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    existente = args.db and os.path.exists(args.db)
+    app, caminho_db = criar_app_benchmark(args.db)
+    with app.app_context():
+        if not existente:
+            semear(produtos=args.produtos, movimentos=args.movimentos, vendas=0, usuarios=1, dias=730,
+                   progresso=lambda etapa, quantidade: print(f'{etapa}: {quantidade}', flush=True))
+
+        resultados = {'paginas': medir_paginas(args.tamanho)}
+        paginas = resultados['paginas']
+        print(f"{paginas['movimentos']} movimentações, página de {args.tamanho}: cursor primeira "
+              f"{paginas['cursor_primeira_ms']} ms, cursor última {paginas['cursor_ultima_ms']} ms, "
+              f"OFFSET última {paginas['offset_ultima_ms']} ms")
+
+        fim = datetime.utcnow()
+        filtros = historico.interpretar_filtros({'de': (fim - timedelta(days=365)).isoformat(), 'ate': fim.isoformat()})
+        resultados['exportacao_um_ano'] = medir_exportacao(filtros)
+        for nome, medida in resultados['exportacao_um_ano'].items():
+            print(f"Exportação de um ano ({nome}): {medida['linhas']} linhas em {medida['segundos']:.1f}s, "
+                  f"pico de memória {medida['pico_memoria_mb']} MB")
+
+    print(f'Banco: {caminho_db}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
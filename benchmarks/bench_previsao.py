@@ -0,0 +1,138 @@
+"""
+Benchmark da previsão de demanda (app.services.previsao).
+
+Duas medições:
+  1. cálculo vetorizado (previsao.calcular) sobre um histórico sintético em memória,
+     por padrão 100 mil produtos x 730 dias, conferido contra um cálculo produto a produto
+     numa amostra;
+  2. ponta a ponta (previsao.gerar_sugestoes) num banco SQLite com movimentações reais:
+     leitura agregada, cálculo e gravação da tabela de sugestões.
+
+Uso:
+    python -m benchmarks.bench_previsao --produtos 100000 --dias 730 --densidade 0.2
+    python -m benchmarks.bench_previsao --produtos-db 2000 --dias-db 365
+"""
+import argparse
+import json
+import math
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert, select
+
+from app import db
+from app.models import Product, StockMovement
+from app.services import previsao
+from benchmarks.comum import criar_app_benchmark
+
+PRAZO, COBERTURA, Z = 7, 30, 1.65
+
+
+def historico_sintetico(produtos, dias, densidade, semente=0):
+    """Saídas diárias aleatórias: cada par (produto, dia) tem venda com probabilidade `densidade`."""
+    gerador = np.random.default_rng(semente)
+    total = int(produtos * dias * densidade)
+    indices = gerador.integers(0, produtos, total)
+    idades = gerador.integers(0, dias, total)
+    # Pares repetidos viram um só dia com a soma, como na consulta agregada
+    chave = np.unique(indices * dias + idades)
+    quantidades = gerador.poisson(3, len(chave)).astype(np.float64) + 1
+    return chave // dias, chave % dias, quantidades
+
+
+def conferir_amostra(resultado, estoque, minimo, indices, idades, quantidades, dias, amostra):
+    """Refaz o cálculo produto a produto (laço Python) para alguns produtos e compara."""
+    for produto in amostra:
+        serie = np.zeros(dias)
+        proprio = indices == produto
+        serie[idades[proprio]] = quantidades[proprio]
+        observados = min(idades[proprio].max() + 1, dias) if proprio.any() else dias
+        serie = serie[:observados]
+        demanda = max(serie[:previsao.JANELA_CURTA].sum() / min(observados, previsao.JANELA_CURTA),
+                      serie[:previsao.JANELA_LONGA].sum() / min(observados, previsao.JANELA_LONGA))
+        desvio = serie.std(ddof=1) if observados > 1 else 0.0
+        ponto_pedido = max(math.ceil(demanda * PRAZO + Z * desvio * math.sqrt(PRAZO)), minimo[produto])
+        assert math.isclose(resultado['demanda'][produto], demanda, rel_tol=1e-9, abs_tol=1e-9), produto
+        assert math.isclose(resultado['desvio'][produto], desvio, rel_tol=1e-6, abs_tol=1e-9), produto
+        assert resultado['ponto_pedido'][produto] == ponto_pedido, produto
+
+
+def medir_calculo(produtos, dias, densidade):
+    indices, idades, quantidades = historico_sintetico(produtos, dias, densidade)
+    gerador = np.random.default_rng(1)
+    estoque = gerador.integers(0, 200, produtos)
+    minimo = gerador.integers(0, 20, produtos)
+
+    inicio = time.perf_counter()
+    resultado = previsao.calcular(estoque, minimo, indices, idades, quantidades, dias, PRAZO, COBERTURA, Z)
+    duracao = time.perf_counter() - inicio
+
+    conferir_amostra(resultado, estoque, minimo, indices, idades, quantidades, dias,
+                     gerador.choice(produtos, size=min(50, produtos), replace=False))
+    return {'produtos': produtos, 'dias': dias, 'pares_produto_dia': len(indices),
+            'segundos': round(duracao, 3), 'sugestoes': int(np.count_nonzero(resultado['sugestao']))}
+
+
+def medir_ponta_a_ponta(produtos, dias, densidade):
+    app, caminho_db = criar_app_benchmark()
+    agora = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(insert(Product), [
+            {'code': f'PREV-{i}', 'name': f'Produto {i}', 'price': '9.90', 'quantity_in_stock': i % 40, 'minimum_stock': 5}
+            for i in range(produtos)
+        ])
+        ids = np.array(db.session.scalars(select(Product.id).order_by(Product.id)).all())
+        indices, idades, quantidades = historico_sintetico(produtos, dias, densidade)
+        # Duas saídas por dia com venda, para a consulta ter de agregar
+        for bloco in range(0, len(indices), 50000):
+            fatia = slice(bloco, bloco + 50000)
+            linhas = []
+            for indice, idade, quantidade in zip(indices[fatia].tolist(), idades[fatia].tolist(),
+                                                 quantidades[fatia].tolist()):
+                dia = agora - timedelta(days=idade + 1)
+                metade = int(quantidade) // 2
+                for parte, hora in ((metade, 9), (int(quantidade) - metade, 15)):
+                    if parte:
+                        linhas.append({'date': dia.replace(hour=hora), 'movement_type': 'saida', 'quantity': parte,
+                                       'reason': 'Benchmark', 'product_id': int(ids[indice])})
+            db.session.execute(insert(StockMovement), linhas)
+        db.session.commit()
+
+        inicio = time.perf_counter()
+        resumo = previsao.gerar_sugestoes(PRAZO, COBERTURA, Z, momento=agora, dias=dias)
+        duracao = time.perf_counter() - inicio
+    resumo.update({'banco': caminho_db, 'dias': dias, 'segundos_total': round(duracao, 3),
+                   'segundos_leitura': round(resumo['segundos_leitura'], 3),
+                   'segundos_calculo': round(resumo['segundos_calculo'], 3)})
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, default=100_000)
+    parser.add_argument('--dias', type=int, default=730)
+    parser.add_argument('--densidade', type=float, default=0.2, help='fração dos pares (produto, dia) com venda')
+    parser.add_argument('--produtos-db', type=int, default=2000, help='produtos no teste ponta a ponta (0 pula)')
+    parser.add_argument('--dias-db', type=int, default=365)
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    resultados = {'calculo': medir_calculo(args.produtos, args.dias, args.densidade)}
+    calculo = resultados['calculo']
+    print(f"Cálculo: {calculo['produtos']} produtos x {calculo['dias']} dias "
+          f"({calculo['pares_produto_dia']} pares com venda) em {calculo['segundos']:.2f}s; amostra conferida.")
+
+    if args.produtos_db:
+        resumo = resultados['ponta_a_ponta'] = medir_ponta_a_ponta(args.produtos_db, args.dias_db, args.densidade)
+        print(f"Ponta a ponta: {resumo['produtos']} produtos x {resumo['dias']} dias em {resumo['segundos_total']:.2f}s "
+              f"(leitura {resumo['segundos_leitura']:.2f}s, cálculo {resumo['segundos_calculo']:.2f}s), "
+              f"{resumo['sugestoes']} sugestões. Banco: {resumo['banco']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark das tarefas em segundo plano (app.tarefas).
+
+1. Tempo de resposta da importação do catálogo: o envio feito como antes (importação dentro
+   da requisição) contra o envio que só grava a tarefa e responde 202.
+2. Latência de uma página de estoque (/estoque/produtos/dados) parada e enquanto uma
+   importação roda em segundo plano, medida por outra thread.
+
+Uso:
+    python -m benchmarks.bench_tarefas --linhas 200000
+"""
+import argparse
+import io
+import json
+import statistics
+import tempfile
+import threading
+import time
+
+from app import db
+from app.models import User
+from app.services import catalogo
+from benchmarks.comum import criar_app_benchmark
+
+SENHA = 'senha-benchmark'
+
+
+def gerar_csv(linhas, prefixo):
+    cabecalho = 'code,name,price,quantity_in_stock,minimum_stock,category,supplier\n'
+    return (cabecalho + ''.join(
+        f'{prefixo}{i:07d},Produto {prefixo} {i},{1 + i % 500}.90,{i % 300},{i % 20},Categoria {i % 40},Fornecedor {i % 80}\n'
+        for i in range(linhas))).encode('utf-8')
+
+
+def enviar(cliente, conteudo):
+    return cliente.post('/estoque/catalogo/importar/produtos', data={'arquivo': (io.BytesIO(conteudo), 'produtos.csv')},
+                        content_type='multipart/form-data')
+
+
+def percentis(latencias):
+    latencias = sorted(latencias)
+    return {'requisicoes': len(latencias), 'p50_ms': round(statistics.median(latencias), 2),
+            'p95_ms': round(latencias[int(len(latencias) * 0.95) - 1], 2)}
+
+
+def medir_pagina(cliente, parar, latencias):
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        resposta = cliente.get('/estoque/produtos/dados?length=50')
+        assert resposta.status_code == 200
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=200000, help='linhas de cada arquivo importado')
+    parser.add_argument('--amostra', type=float, default=2.0, help='segundos medindo a página parada')
+    parser.add_argument('--json', help='grava os resultados neste arquivo JSON')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(TAREFAS_DIRETORIO=tempfile.mkdtemp(prefix='estoque_tarefas_'))
+    with app.app_context():
+        usuario = User(username='bench')
+        usuario.set_password(SENHA)
+        db.session.add(usuario)
+        db.session.commit()
+
+    def cliente_logado():
+        cliente = app.test_client()
+        assert cliente.post('/auth/login', data={'username': 'bench', 'password': SENHA}).status_code == 302
+        return cliente
+
+    resultados = {'linhas': args.linhas}
+
+    # Como era antes: a importação inteira dentro da requisição
+    @app.route('/_bench/importar_sincrono', methods=['POST'])
+    def importar_sincrono():
+        arquivo = io.TextIOWrapper(io.BytesIO(app.config['_BENCH_CSV']), encoding='utf-8-sig', newline='')
+        return catalogo.importar(arquivo, 'produtos', 'csv')
+
+    cliente = cliente_logado()
+    app.config['_BENCH_CSV'] = gerar_csv(args.linhas, 'S')
+    inicio = time.perf_counter()
+    assert cliente.post('/_bench/importar_sincrono').status_code == 200
+    resultados['resposta_sincrona_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    latencias = []
+    parar = threading.Event()
+    medidor = threading.Thread(target=medir_pagina, args=(cliente_logado(), parar, latencias))
+    medidor.start()
+    time.sleep(args.amostra)
+    parar.set()
+    medidor.join()
+    resultados['pagina_parada'] = percentis(latencias)
+
+    conteudo = gerar_csv(args.linhas, 'T')
+    latencias = []
+    parar = threading.Event()
+    medidor = threading.Thread(target=medir_pagina, args=(cliente_logado(), parar, latencias))
+    medidor.start()
+    inicio = time.perf_counter()
+    resposta = enviar(cliente, conteudo)
+    resultados['resposta_tarefa_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    assert resposta.status_code == 202, resposta.get_data(as_text=True)
+    endereco = resposta.headers['Location']
+    while True:
+        estado = cliente.get(endereco).get_json()
+        if estado['status'] in ('concluida', 'erro', 'cancelada'):
+            break
+        time.sleep(0.2)
+    resultados['tarefa_segundos'] = round(time.perf_counter() - inicio, 2)
+    resultados['tarefa_status'] = estado['status']
+    parar.set()
+    medidor.join()
+    resultados['pagina_durante_tarefa'] = percentis(latencias)
+
+    print(f"Importação de {args.linhas} linhas: resposta síncrona {resultados['resposta_sincrona_ms']:.0f} ms, "
+          f"com tarefa {resultados['resposta_tarefa_ms']:.0f} ms (tarefa {estado['status']} em "
+          f"{resultados['tarefa_segundos']:.1f}s)")
+    for nome in ('pagina_parada', 'pagina_durante_tarefa'):
+        medida = resultados[nome]
+        print(f"{nome}: p50 {medida['p50_ms']} ms, p95 {medida['p95_ms']} ms ({medida['requisicoes']} requisições)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+Teste de carga da aplicação real (create_app) com usuários simulados concorrentes.
+
+Cada usuário simulado é uma thread com seu próprio cliente (cookies/sessão), que faz login
+e, até o fim do tempo, escolhe ações ponderadas: listagem paginada de produtos, busca,
+entradas e saídas de estoque, checkout, relatório de vendas e o CRUD de categorias e
+fornecedores. Ações cujas rotas não estão registradas na aplicação são puladas (e listadas
+no resultado). Tudo roda em processo, com SQLite, sem serviços externos.
+
+Resultado (JSON): vazão e latência p50/p95/p99 por endpoint, com o commit, a escala dos
+dados e os parâmetros, para comparar execuções (--comparar resultado_anterior.json).
+
+Uso:
+    python -m benchmarks.carga --usuarios-simulados 16 --duracao 30 --saida carga.json
+    python -m benchmarks.carga --db /tmp/carga.db --sem-semear --comparar carga_anterior.json
+"""
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import url_for
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Category, Product, Supplier, User
+from benchmarks import semear
+from benchmarks.comum import criar_app_benchmark
+
+PESOS = {
+    'produtos_dados': 30,
+    'buscar_produtos': 15,
+    'movimentar_entrada': 10,
+    'movimentar_saida': 15,
+    'checkout': 10,
+    'relatorio_vendas': 5,
+    'categorias_crud': 5,
+    'fornecedores_crud': 5,
+    'relogin': 2,
+}
+
+# Rotas exigidas por cada ação (a ação é pulada se alguma não existir)
+ROTAS = {
+    'produtos_dados': ('estoque.produtos_dados',),
+    'buscar_produtos': ('estoque.buscar_produtos',),
+    'movimentar_entrada': ('estoque.movimentar_entrada',),
+    'movimentar_saida': ('estoque.movimentar_saida',),
+    'checkout': ('vendas.checkout',),
+    'relatorio_vendas': ('relatorios.vendas_por_periodo',),
+    'categorias_crud': ('estoque.listar_categorias', 'estoque.adicionar_categoria',
+                        'estoque.editar_categoria', 'estoque.excluir_categoria'),
+    'fornecedores_crud': ('estoque.listar_fornecedores', 'estoque.adicionar_fornecedor',
+                          'estoque.editar_fornecedor', 'estoque.excluir_fornecedor'),
+    'relogin': ('auth.login', 'auth.logout'),
+}
+
+ORDENACOES = ('name', 'code', 'quantity_in_stock', 'last_updated')
+
+
+class Registro:
+    """Latências (ms) e status por endpoint, compartilhado entre as threads."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.amostras = {}
+
+    def medir(self, nome, chamada):
+        inicio = time.perf_counter()
+        resposta = chamada()
+        duracao = (time.perf_counter() - inicio) * 1000
+        with self._trava:
+            self.amostras.setdefault(nome, []).append((duracao, resposta.status_code))
+        return resposta
+
+
+class UsuarioSimulado:
+    def __init__(self, app, indice, contexto, registro, semente):
+        self.app = app
+        self.cliente = app.test_client()
+        self.username = semear.nome_usuario(indice)
+        self.contexto = contexto
+        self.registro = registro
+        self.gerador = random.Random(semente)
+        self.cursor = None
+        self.ordenar = 'name'
+        self.sequencia = 0
+        self.indice = indice
+
+    def url(self, endpoint, **valores):
+        with self.app.test_request_context():
+            return url_for(endpoint, **valores)
+
+    def login(self):
+        # O pool de verificação de senhas pode recusar (429) numa rajada: tenta de novo com espera
+        for tentativa in range(10):
+            resposta = self.registro.medir('login', lambda: self.cliente.post(
+                self.url('auth.login'), data={'username': self.username, 'password': semear.SENHA_USUARIOS}))
+            if resposta.status_code == 302:
+                return
+            time.sleep(self.gerador.uniform(0, 0.05 * 2 ** tentativa))
+        raise RuntimeError(f'{self.username} não conseguiu fazer login.')
+
+    def produto(self):
+        return self.gerador.randint(self.contexto['menor_id'], self.contexto['maior_id'])
+
+    def produtos_dados(self):
+        if self.cursor is None or self.gerador.random() < 0.3:
+            self.ordenar = self.gerador.choice(ORDENACOES)
+            self.cursor = None
+        parametros = {'ordenar': self.ordenar, 'tamanho': 25}
+        if self.cursor:
+            parametros['cursor'] = self.cursor
+        else:
+            parametros['contar'] = '1'
+        resposta = self.registro.medir('produtos_dados', lambda: self.cliente.get(
+            self.url('estoque.produtos_dados', **parametros)))
+        self.cursor = resposta.get_json().get('next_cursor') if resposta.status_code == 200 else None
+
+    def buscar_produtos(self):
+        termo = self.gerador.choice(semear.PRODUTOS_BASE)[:self.gerador.randint(2, 5)]
+        self.registro.medir('buscar_produtos', lambda: self.cliente.get(self.url('estoque.buscar_produtos', q=termo)))
+
+    def movimentar(self, tipo):
+        dados = {'product': self.produto(), 'quantity': self.gerador.randint(1, 5),
+                 'reason': 'Teste de carga', 'movement_type': tipo}
+        self.registro.medir(f'movimentar_{tipo}', lambda: self.cliente.post(
+            self.url(f'estoque.movimentar_{tipo}'), data=dados))
+
+    def checkout(self):
+        itens = [{'product_id': self.produto(), 'quantity': self.gerador.randint(1, 3)}
+                 for _ in range(self.gerador.randint(1, 5))]
+        self.registro.medir('checkout', lambda: self.cliente.post(self.url('vendas.checkout'), json={'itens': itens}))
+
+    def relatorio_vendas(self):
+        fim = date.today() - timedelta(days=self.gerador.randint(0, 300))
+        parametros = {'periodo': 'dia', 'dimensao': self.gerador.choice(('categoria', 'fornecedor', 'vendedor')),
+                      'de': (fim - timedelta(days=30)).isoformat(), 'ate': fim.isoformat()}
+        self.registro.medir('relatorio_vendas', lambda: self.cliente.get(
+            self.url('relatorios.vendas_por_periodo', **parametros)))
+
+    def crud(self, entidade, singular, campo_id):
+        """Lista, cria, edita e exclui um registro (categoria ou fornecedor)."""
+        self.sequencia += 1
+        nome = f'Carga {self.indice:03d}-{self.sequencia:06d}'
+        self.registro.medir(f'listar_{entidade}', lambda: self.cliente.get(self.url(f'estoque.listar_{entidade}')))
+        self.registro.medir(f'adicionar_{singular}', lambda: self.cliente.post(
+            self.url(f'estoque.adicionar_{singular}'), data={'name': nome}))
+        with self.app.app_context():
+            modelo = self.contexto['modelos'][singular]
+            registro_id = db.session.scalar(select(modelo.id).where(modelo.name == nome))
+            db.session.remove()
+        if registro_id is None:
+            return
+        self.registro.medir(f'editar_{singular}', lambda: self.cliente.post(
+            self.url(f'estoque.editar_{singular}', **{campo_id: registro_id}), data={'name': nome + ' (editado)'}))
+        self.registro.medir(f'excluir_{singular}', lambda: self.cliente.post(
+            self.url(f'estoque.excluir_{singular}', **{campo_id: registro_id})))
+
+    def relogin(self):
+        self.registro.medir('logout', lambda: self.cliente.get(self.url('auth.logout')))
+        self.login()
+
+    def executar(self, acao):
+        if acao == 'movimentar_entrada':
+            self.movimentar('entrada')
+        elif acao == 'movimentar_saida':
+            self.movimentar('saida')
+        elif acao == 'categorias_crud':
+            self.crud('categorias', 'categoria', 'category_id')
+        elif acao == 'fornecedores_crud':
+            self.crud('fornecedores', 'fornecedor', 'supplier_id')
+        else:
+            getattr(self, acao)()
+
+
+def simular(usuario, acoes, pesos, barreira, fim, erros):
+    try:
+        barreira.wait()
+        usuario.login()
+        while time.monotonic() < fim:
+            usuario.executar(usuario.gerador.choices(acoes, pesos)[0])
+    except Exception as erro: # Registra e encerra só este usuário simulado
+        erros.append(f'{usuario.username}: {erro!r}')
+
+
+def percentil(ordenados, p):
+    """Percentil pelo método do posto mais próximo."""
+    if not ordenados:
+        return None
+    posicao = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return round(ordenados[posicao], 2)
+
+
+def resumir(amostras, duracao):
+    resultado = {}
+    for nome, medidas in sorted(amostras.items()):
+        latencias = sorted(duracao_ms for duracao_ms, _ in medidas)
+        erros = sum(1 for _, status in medidas if status >= 500 or status in (400, 401, 403, 404))
+        resultado[nome] = {
+            'requisicoes': len(medidas),
+            'erros': erros,
+            'status': {str(status): sum(1 for _, s in medidas if s == status) for status in sorted({s for _, s in medidas})},
+            'requisicoes_por_segundo': round(len(medidas) / duracao, 2),
+            'media_ms': round(sum(latencias) / len(latencias), 2),
+            'p50_ms': percentil(latencias, 50),
+            'p95_ms': percentil(latencias, 95),
+            'p99_ms': percentil(latencias, 99),
+            'maximo_ms': round(latencias[-1], 2),
+        }
+    return resultado
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, caminho_anterior):
+    with open(caminho_anterior, encoding='utf-8') as arquivo:
+        anterior = json.load(arquivo)
+    print(f"\nComparação com {caminho_anterior} (commit {anterior.get('commit')}):")
+    print(f"{'endpoint':<22} {'req/s':>16} {'p95 ms':>18}")
+    for nome, dados in atual['endpoints'].items():
+        antes = anterior.get('endpoints', {}).get(nome)
+        if not antes:
+            continue
+        print(f"{nome:<22} {antes['requisicoes_por_segundo']:>7.1f} -> {dados['requisicoes_por_segundo']:<7.1f}"
+              f" {antes['p95_ms']:>8.2f} -> {dados['p95_ms']:<8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='arquivo SQLite (padrão: temporário)')
+    parser.add_argument('--sem-semear', action='store_true', help='usa os dados já existentes em --db')
+    parser.add_argument('--perfil-banco', default='auto', help='DATABASE_PROFILE da aplicação')
+    parser.add_argument('--usuarios-simulados', type=int, default=16)
+    parser.add_argument('--duracao', type=float, default=30, help='segundos de carga')
+    parser.add_argument('--semente-carga', type=int, default=7)
+    parser.add_argument('--saida', default='carga.json', help='arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='resultado anterior (JSON) para comparar')
+    semear.adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(args.db, DATABASE_PROFILE=args.perfil_banco)
+    escala = None
+    with app.app_context():
+        if not args.sem_semear:
+            print('Semeando o banco...', flush=True)
+            escala = semear.semear_com_argumentos(args)
+        menor_id, maior_id = db.session.execute(select(func.min(Product.id), func.max(Product.id))).one()
+        usuarios_disponiveis = db.session.scalar(select(func.count()).where(User.username.like('usuario%')))
+        escala = escala or {'produtos': db.session.scalar(select(func.count(Product.id)))}
+    if menor_id is None or not usuarios_disponiveis:
+        parser.error('O banco não tem produtos ou usuários gerados por benchmarks.semear.')
+
+    contexto = {'menor_id': menor_id, 'maior_id': maior_id, 'modelos': {'categoria': Category, 'fornecedor': Supplier}}
+    acoes = [acao for acao in PESOS if all(rota in app.view_functions for rota in ROTAS[acao])]
+    puladas = [acao for acao in PESOS if acao not in acoes]
+    if puladas:
+        print(f"Ações puladas (rotas inexistentes): {', '.join(puladas)}")
+
+    registro = Registro()
+    erros = []
+    quantidade = args.usuarios_simulados
+    barreira = threading.Barrier(quantidade)
+    fim = time.monotonic() + args.duracao
+    usuarios = [UsuarioSimulado(app, i % usuarios_disponiveis, contexto, registro, args.semente_carga + i)
+                for i in range(quantidade)]
+    threads = [threading.Thread(target=simular, args=(usuario, acoes, [PESOS[a] for a in acoes], barreira, fim, erros))
+               for usuario in usuarios]
+    print(f'{quantidade} usuários simulados por {args.duracao:.0f}s...', flush=True)
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    endpoints = resumir(registro.amostras, duracao)
+    total = sum(dados['requisicoes'] for dados in endpoints.values())
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'banco': caminho_db,
+        'perfil_banco': app.config['DATABASE_PROFILE'],
+        'usuarios_simulados': quantidade,
+        'duracao_segundos': round(duracao, 2),
+        'escala': escala,
+        'acoes_puladas': puladas,
+        'erros_usuarios': erros,
+        'requisicoes': total,
+        'requisicoes_por_segundo': round(total / duracao, 2),
+        'endpoints': endpoints,
+    }
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    print(f"{'endpoint':<22} {'req':>7} {'erros':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for nome, dados in endpoints.items():
+        print(f"{nome:<22} {dados['requisicoes']:>7} {dados['erros']:>6} {dados['requisicoes_por_segundo']:>8.1f} "
+              f"{dados['p50_ms']:>8.2f} {dados['p95_ms']:>8.2f} {dados['p99_ms']:>8.2f}")
+    print(f"Total: {total} requisições, {resultado['requisicoes_por_segundo']:.1f} req/s. Resultado em {args.saida}")
+    for erro in erros:
+        print(f'ERRO: {erro}')
+
+    if args.comparar:
+        comparar(resultado, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from config import Config
+from app import create_app, db
+
+# Utilitários compartilhados pelos scripts de benchmark/estresse.
+# Os scripts rodam com a aplicação real (create_app), apontando para um
+# banco SQLite temporário, sem nenhum serviço externo.
+
+
+def criar_app_benchmark(caminho_db=None, **configuracoes):
+    """
+    Cria a aplicação com um banco SQLite próprio para o benchmark e cria as tabelas.
+    Se caminho_db não for informado, usa um arquivo temporário novo.
+    Configurações extras (ex.: SQLALCHEMY_ENGINE_OPTIONS) podem ser passadas como argumentos nomeados.
+    """
+    if caminho_db is None:
+        descritor, caminho_db = tempfile.mkstemp(prefix='estoque_bench_', suffix='.db')
+        os.close(descritor)
+        os.remove(caminho_db)
+
+    class ConfigBenchmark(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(caminho_db)
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+
+    for chave, valor in configuracoes.items():
+        setattr(ConfigBenchmark, chave, valor)
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        db.create_all()
+    return app, caminho_db
@@ -0,0 +1,185 @@
+"""
+Gerador de dados realistas para benchmarks e testes de carga.
+
+Cria usuários, categorias, fornecedores, produtos, movimentações de estoque e vendas
+(com itens) usando inserts em massa (db.session.execute(insert(Modelo), [...])) em blocos,
+com um commit por bloco. No fim reconstrói os consolidados de vendas, para os relatórios.
+Os dados são determinísticos para uma mesma semente.
+
+Uso:
+    python -m benchmarks.semear --db /tmp/carga.db --produtos 100000 --movimentos 1000000 --vendas 200000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Category, Product, Sale, SaleItem, StockMovement, Supplier, User
+from app.services import consolidados
+from benchmarks.comum import criar_app_benchmark
+
+# Senha de todos os usuários gerados (usuario000, usuario001, ...)
+SENHA_USUARIOS = 'carga-123'
+
+PRODUTOS_BASE = ('Arroz', 'Feijão', 'Café', 'Açúcar', 'Leite', 'Óleo', 'Macarrão', 'Farinha', 'Sabão', 'Detergente',
+                 'Biscoito', 'Suco', 'Refrigerante', 'Água', 'Sal', 'Molho', 'Queijo', 'Manteiga', 'Iogurte', 'Pão')
+MARCAS = ('Bom Dia', 'Da Casa', 'Primavera', 'Estrela', 'Sertão', 'Nativa', 'Real', 'Aurora', 'Serra', 'Vale')
+TAMANHOS = ('200g', '500g', '1kg', '2kg', '5kg', '350ml', '1L', '2L', 'cx 12', 'pct 6')
+
+
+def nome_usuario(indice):
+    return f'usuario{indice:03d}'
+
+
+def _em_blocos(quantidade, tamanho_bloco):
+    for inicio in range(0, quantidade, tamanho_bloco):
+        yield range(inicio, min(inicio + tamanho_bloco, quantidade))
+
+
+def semear(categorias=50, fornecedores=100, produtos=10000, movimentos=100000, vendas=10000, usuarios=20,
+           dias=365, semente=42, tamanho_bloco=10000, progresso=None):
+    """
+    Popula o banco da aplicação atual (precisa de app context) e devolve um dicionário
+    com as quantidades criadas e o tempo gasto em cada etapa.
+    `progresso`, se informado, recebe (etapa, quantidade_gravada) a cada bloco.
+    """
+    gerador = random.Random(semente)
+    agora = datetime.utcnow()
+    tempos = {}
+    avisar = progresso or (lambda etapa, quantidade: None)
+
+    inicio = time.perf_counter()
+    senha = generate_password_hash(SENHA_USUARIOS) # Um único hash para todos: o custo é proposital
+    db.session.execute(insert(User), [
+        {'username': nome_usuario(i), 'email': f'{nome_usuario(i)}@carga.local', 'password_hash': senha,
+         'role': 'admin' if i == 0 else 'user', 'is_active': True}
+        for i in range(usuarios)
+    ])
+    db.session.execute(insert(Category), [{'name': f'Categoria {i:04d}'} for i in range(categorias)])
+    db.session.execute(insert(Supplier), [
+        {'name': f'Fornecedor {i:04d}', 'contact_info': f'contato{i}@fornecedor.local'} for i in range(fornecedores)
+    ])
+    db.session.commit()
+    ids_usuarios = db.session.scalars(select(User.id).where(User.username.like('usuario%'))).all()
+    ids_categorias = db.session.scalars(select(Category.id)).all()
+    ids_fornecedores = db.session.scalars(select(Supplier.id)).all()
+    tempos['cadastros'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    primeiro_produto = (db.session.scalar(select(func.max(Product.id))) or 0) + 1
+    precos = {}
+    for bloco in _em_blocos(produtos, tamanho_bloco):
+        linhas = []
+        for i in bloco:
+            preco = Decimal(gerador.randint(100, 50000)) / 100
+            precos[primeiro_produto + i] = preco
+            linhas.append({
+                'id': primeiro_produto + i,
+                'code': f'P{i:07d}',
+                'name': f'{gerador.choice(PRODUTOS_BASE)} {gerador.choice(MARCAS)} {gerador.choice(TAMANHOS)} #{i}',
+                'price': preco,
+                'quantity_in_stock': gerador.randint(0, 500),
+                'minimum_stock': gerador.randint(0, 30),
+                'category_id': gerador.choice(ids_categorias) if ids_categorias else None,
+                'supplier_id': gerador.choice(ids_fornecedores) if ids_fornecedores else None,
+                'last_updated': agora - timedelta(minutes=gerador.randint(0, dias * 1440)),
+            })
+        db.session.execute(insert(Product), linhas)
+        db.session.commit()
+        avisar('produtos', bloco.stop)
+    ids_produtos = list(precos)
+    tempos['produtos'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for bloco in _em_blocos(movimentos if ids_produtos else 0, tamanho_bloco):
+        linhas = []
+        for _ in bloco:
+            saida = gerador.random() < 0.7
+            linhas.append({
+                'date': agora - timedelta(seconds=gerador.randint(0, dias * 86400)),
+                'movement_type': 'saida' if saida else 'entrada',
+                'quantity': gerador.randint(1, 10) if saida else gerador.randint(10, 100),
+                'reason': 'Ajuste de inventário' if saida else 'Compra de fornecedor',
+                'product_id': gerador.choice(ids_produtos),
+            })
+        db.session.execute(insert(StockMovement), linhas)
+        db.session.commit()
+        avisar('movimentos', bloco.stop)
+    tempos['movimentos'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    proxima_venda = (db.session.scalar(select(func.max(Sale.id))) or 0) + 1
+    for bloco in _em_blocos(vendas if ids_produtos and ids_usuarios else 0, tamanho_bloco):
+        linhas_vendas, linhas_itens, linhas_movimentos = [], [], []
+        for _ in bloco:
+            data = agora - timedelta(seconds=gerador.randint(0, dias * 86400))
+            itens = {}
+            for _ in range(gerador.randint(1, 5)):
+                product_id = gerador.choice(ids_produtos)
+                itens[product_id] = itens.get(product_id, 0) + gerador.randint(1, 3)
+            total = Decimal('0.00')
+            for product_id, quantidade in itens.items():
+                subtotal = precos[product_id] * quantidade
+                total += subtotal
+                linhas_itens.append({'sale_id': proxima_venda, 'product_id': product_id, 'quantity': quantidade,
+                                     'price_per_item': precos[product_id], 'subtotal': subtotal})
+                linhas_movimentos.append({'date': data, 'movement_type': 'saida', 'quantity': quantidade,
+                                          'reason': f'Venda #{proxima_venda}', 'product_id': product_id})
+            linhas_vendas.append({'id': proxima_venda, 'date': data, 'total_amount': total, 'amount_paid': total,
+                                  'change': Decimal('0.00'), 'user_id': gerador.choice(ids_usuarios)})
+            proxima_venda += 1
+        db.session.execute(insert(Sale), linhas_vendas)
+        db.session.execute(insert(SaleItem), linhas_itens)
+        db.session.execute(insert(StockMovement), linhas_movimentos)
+        db.session.commit()
+        avisar('vendas', bloco.stop)
+    tempos['vendas'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    consolidados.reconstruir()
+    tempos['consolidados'] = time.perf_counter() - inicio
+
+    return {
+        'usuarios': usuarios, 'categorias': categorias, 'fornecedores': fornecedores, 'produtos': produtos,
+        'movimentos': movimentos, 'vendas': vendas, 'dias': dias, 'semente': semente,
+        'segundos': {etapa: round(segundos, 2) for etapa, segundos in tempos.items()},
+    }
+
+
+def adicionar_argumentos(parser):
+    """Opções de escala do gerador (compartilhadas com benchmarks.carga)."""
+    parser.add_argument('--categorias', type=int, default=50)
+    parser.add_argument('--fornecedores', type=int, default=100)
+    parser.add_argument('--produtos', type=int, default=10000)
+    parser.add_argument('--movimentos', type=int, default=100000)
+    parser.add_argument('--vendas', type=int, default=10000)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--dias', type=int, default=365, help='período coberto pelo histórico')
+    parser.add_argument('--semente', type=int, default=42)
+
+
+def semear_com_argumentos(args, progresso=None):
+    return semear(args.categorias, args.fornecedores, args.produtos, args.movimentos, args.vendas, args.usuarios,
+                  args.dias, args.semente, progresso=progresso)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='arquivo SQLite a criar/popular (padrão: temporário)')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(args.db)
+    with app.app_context():
+        resumo = semear_com_argumentos(args, lambda etapa, quantidade: print(f'{etapa}: {quantidade}', flush=True))
+    print(f'Banco: {caminho_db}')
+    print(', '.join(f'{etapa} {segundos:.1f}s' for etapa, segundos in resumo['segundos'].items()))
+
+
+if __name__ == '__main__':
+    main()
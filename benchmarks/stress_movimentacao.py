@@ -0,0 +1,145 @@
+"""
+Teste de estresse da movimentação de estoque concorrente.
+
+Várias threads registram entradas e saídas do MESMO produto ao mesmo tempo
+usando app.services.movimentacao.aplicar_movimentacao. Ao final o script prova que:
+  - o estoque nunca ficou negativo (replay do histórico na ordem de gravação);
+  - o saldo final do produto bate com o histórico de movimentações;
+  - nenhuma saída aceita foi perdida (soma das threads == soma no banco).
+E informa a vazão em movimentações por segundo.
+
+Com --fragmentos N o saldo do produto é dividido em N linhas (app.services.locais.fragmentar)
+antes do teste; as movimentações não tocam o Product, e o total (soma dos fragmentos) e o
+Product depois do consolidar() passam pelas mesmas verificações.
+
+Uso:
+    python -m benchmarks.stress_movimentacao --threads 16 --operacoes 300 --estoque 1000
+    python -m benchmarks.stress_movimentacao --threads 16 --operacoes 300 --estoque 1000 --fragmentos 8
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Product, LocationStock, StockMovement
+from app.services import locais
+from app.services.movimentacao import aplicar_movimentacao, EstoqueInsuficienteError
+from benchmarks.comum import criar_app_benchmark
+
+
+def trabalhador(app, product_id, operacoes, semente, resultados, barreira):
+    """Executa `operacoes` movimentações aleatórias (80% saídas) e acumula os totais aceitos."""
+    gerador = random.Random(semente)
+    totais = {'entrada': 0, 'saida': 0, 'recusadas': 0, 'movimentos': 0}
+    with app.app_context():
+        barreira.wait() # Todas as threads começam juntas para maximizar a disputa
+        for _ in range(operacoes):
+            if gerador.random() < 0.8:
+                tipo, quantidade = 'saida', gerador.randint(1, 3)
+            else:
+                tipo, quantidade = 'entrada', gerador.randint(1, 2)
+            try:
+                aplicar_movimentacao(product_id, tipo, quantidade, 'estresse')
+            except EstoqueInsuficienteError:
+                totais['recusadas'] += 1
+                continue
+            totais[tipo] += quantidade
+            totais['movimentos'] += 1
+        db.session.remove()
+    resultados.append(totais)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operacoes', type=int, default=300, help='movimentações por thread')
+    parser.add_argument('--estoque', type=int, default=1000, help='estoque inicial do produto')
+    parser.add_argument('--fragmentos', type=int, default=1, help='linhas de saldo do produto no local padrão')
+    parser.add_argument('--db', help='arquivo SQLite a usar (padrão: temporário)')
+    args = parser.parse_args()
+
+    app, caminho_db = criar_app_benchmark(args.db)
+    with app.app_context():
+        produto = Product(code='STRESS-1', name='Produto de estresse', price=1, quantity_in_stock=args.estoque)
+        db.session.add(produto)
+        db.session.commit()
+        product_id = produto.id
+        if args.fragmentos > 1:
+            locais.fragmentar(product_id, locais.padrao_id(), args.fragmentos)
+
+    resultados = []
+    barreira = threading.Barrier(args.threads)
+    threads = [
+        threading.Thread(target=trabalhador, args=(app, product_id, args.operacoes, semente, resultados, barreira))
+        for semente in range(args.threads)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    entradas = sum(r['entrada'] for r in resultados)
+    saidas = sum(r['saida'] for r in resultados)
+    movimentos = sum(r['movimentos'] for r in resultados)
+    recusadas = sum(r['recusadas'] for r in resultados)
+
+    falhas = []
+    with app.app_context():
+        saldo_final = locais.saldo_total(product_id) # Produto fragmentado: soma dos fragmentos
+        locais.consolidar()
+        saldo_consolidado = db.session.scalar(select(Product.quantity_in_stock).where(Product.id == product_id))
+        soma_locais = db.session.scalar(
+            select(func.sum(LocationStock.quantity)).where(LocationStock.product_id == product_id))
+        menor_fragmento = db.session.scalar(
+            select(func.min(LocationStock.quantity)).where(LocationStock.product_id == product_id))
+
+        # Replay do histórico na ordem de gravação: o saldo nunca pode ficar negativo
+        saldo = args.estoque
+        menor_saldo = saldo
+        quantidade_registros = 0
+        historico = db.session.execute(
+            select(StockMovement.movement_type, StockMovement.quantity)
+            .where(StockMovement.product_id == product_id).order_by(StockMovement.id)
+        )
+        for tipo, quantidade in historico:
+            saldo += quantidade if tipo == 'entrada' else -quantidade
+            menor_saldo = min(menor_saldo, saldo)
+            quantidade_registros += 1
+
+    if menor_saldo < 0:
+        falhas.append(f'estoque ficou negativo durante o replay (mínimo {menor_saldo})')
+    if saldo != saldo_final:
+        falhas.append(f'saldo do produto ({saldo_final}) difere do histórico ({saldo})')
+    if args.estoque + entradas - saidas != saldo_final:
+        falhas.append(f'movimentações perdidas: esperado {args.estoque + entradas - saidas}, banco {saldo_final}')
+    if soma_locais != saldo_final:
+        falhas.append(f'soma dos locais ({soma_locais}) difere do total do produto ({saldo_final})')
+    if saldo_consolidado != saldo_final:
+        falhas.append(f'total consolidado do produto ({saldo_consolidado}) difere da soma ({saldo_final})')
+    if menor_fragmento < 0:
+        falhas.append(f'fragmento com saldo negativo ({menor_fragmento})')
+    if quantidade_registros != movimentos:
+        falhas.append(f'{movimentos} movimentações aceitas, mas {quantidade_registros} registradas')
+
+    print(f'Banco: {caminho_db}')
+    print(f'Fragmentos: {args.fragmentos}')
+    print(f'Threads: {args.threads}  Operações: {args.threads * args.operacoes}  Duração: {duracao:.2f}s')
+    print(f'Aceitas: {movimentos}  Recusadas (sem saldo): {recusadas}')
+    print(f'Entradas: {entradas}  Saídas: {saidas}  Saldo final: {saldo_final}  Menor saldo: {menor_saldo}')
+    print(f'Vazão: {movimentos / duracao:.1f} movimentações/s')
+
+    if falhas:
+        for falha in falhas:
+            print(f'FALHA: {falha}')
+        sys.exit(1)
+    print('OK: o estoque nunca ficou negativo e nenhuma movimentação foi perdida.')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,3 +8,66 @@ class Config:
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'database', 'estoque.db')
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Perfil do engine do banco (ver app/perfis_banco.py): auto, basico, sqlite-wal ou servidor
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'auto'
+
+    # Perfil sqlite-wal: PRAGMAs aplicados em cada conexão
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'          # NORMAL é seguro em WAL (só a última transação pode se perder numa queda de energia)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)  # Quanto um escritor espera pelo lock antes de "database is locked"
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 20000)     # Cache de páginas por conexão
+    SQLITE_MMAP_SIZE_MB = int(os.environ.get('SQLITE_MMAP_SIZE_MB') or 256)         # Leitura do arquivo via memória mapeada
+
+    # Perfil servidor (PostgreSQL/MySQL): pool de conexões por processo
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)      # Segundos esperando uma conexão livre
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)    # Renova conexões antes do timeout do servidor/proxy
+    DB_POOL_PRE_PING = (os.environ.get('DB_POOL_PRE_PING') or '1') == '1'
+
+    # Cache de categorias/fornecedores por worker (ver app/services/referencia.py)
+    CACHE_REFERENCIA_MAXIMO = int(os.environ.get('CACHE_REFERENCIA_MAXIMO') or 32)  # Entradas (LRU)
+    CACHE_REFERENCIA_TTL = int(os.environ.get('CACHE_REFERENCIA_TTL') or 300)       # Segundos; a versão no banco invalida antes disso
+
+    # Usuários logados em cache por worker e verificação de senha no login (ver app/services/usuarios.py)
+    USUARIO_CACHE_MAXIMO = int(os.environ.get('USUARIO_CACHE_MAXIMO') or 1024)
+    USUARIO_CACHE_TTL = int(os.environ.get('USUARIO_CACHE_TTL') or 30)                     # Segundos; a versão no banco invalida antes disso
+    LOGIN_VERIFICACOES_SIMULTANEAS = int(os.environ.get('LOGIN_VERIFICACOES_SIMULTANEAS') or 2)
+    LOGIN_FILA_MAXIMA = int(os.environ.get('LOGIN_FILA_MAXIMA') or 8)                       # Além disso o login responde 429
+    LOGIN_ESPERA_MAXIMA = float(os.environ.get('LOGIN_ESPERA_MAXIMA') or 5)                 # Segundos
+
+    # Instrumentação de SQL por requisição (ver app/instrumentacao.py); desligada por padrão
+    SQL_INSTRUMENTACAO = (os.environ.get('SQL_INSTRUMENTACAO') or '0') == '1'
+    SQL_INSTRUMENTACAO_PAINEL = (os.environ.get('SQL_INSTRUMENTACAO_PAINEL') or '0') == '1'  # Painel no rodapé das páginas HTML
+    SQL_LIMITE_REPETICOES = int(os.environ.get('SQL_LIMITE_REPETICOES') or 5)   # Repetições do mesmo comando que indicam N+1
+    SQL_CONSULTAS_LENTAS = int(os.environ.get('SQL_CONSULTAS_LENTAS') or 5)     # Consultas mais lentas guardadas por endpoint
+    METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')                           # Acesso a /metrics sem login (Bearer)
+
+    # Parâmetros das sugestões de compra (app.services.previsao)
+    PREVISAO_PRAZO_ENTREGA_DIAS = int(os.environ.get('PREVISAO_PRAZO_ENTREGA_DIAS') or 7)   # Prazo de entrega dos fornecedores
+    PREVISAO_COBERTURA_DIAS = int(os.environ.get('PREVISAO_COBERTURA_DIAS') or 30)          # Dias de venda que cada compra deve cobrir
+    PREVISAO_NIVEL_SERVICO_Z = float(os.environ.get('PREVISAO_NIVEL_SERVICO_Z') or 1.65)    # 1.65 ~ 95% de nível de serviço
+
+    # Tarefas em segundo plano (ver app/tarefas.py): importação, exportação, reconciliação...
+    TAREFAS_TRABALHADORES = int(os.environ.get('TAREFAS_TRABALHADORES') or 2)             # Tarefas rodando ao mesmo tempo por worker
+    TAREFAS_FILA_MAXIMA = int(os.environ.get('TAREFAS_FILA_MAXIMA') or 16)                # Além disso a submissão responde 503
+    TAREFAS_INTERVALO_PROGRESSO = float(os.environ.get('TAREFAS_INTERVALO_PROGRESSO') or 1) # Segundos entre registros de andamento
+    TAREFAS_DIRETORIO = os.environ.get('TAREFAS_DIRETORIO') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'database', 'tarefas')   # Uploads e arquivos gerados pelas tarefas
+
+    # Saldos ao vivo na listagem de produtos (Server-Sent Events, ver app/services/eventos_estoque.py)
+    ESTOQUE_EVENTOS_MODO = os.environ.get('ESTOQUE_EVENTOS_MODO') or 'local'             # 'banco' quando houver mais de um worker
+    ESTOQUE_EVENTOS_MAXIMO_CLIENTES = int(os.environ.get('ESTOQUE_EVENTOS_MAXIMO_CLIENTES') or 500)  # Conexões por worker; além disso 503
+    ESTOQUE_EVENTOS_FILA = int(os.environ.get('ESTOQUE_EVENTOS_FILA') or 32)             # Lotes pendentes por cliente antes do 'resync'
+    ESTOQUE_EVENTOS_BATIMENTO = float(os.environ.get('ESTOQUE_EVENTOS_BATIMENTO') or 15) # Segundos entre batimentos numa conexão parada
+    ESTOQUE_EVENTOS_INTERVALO = float(os.environ.get('ESTOQUE_EVENTOS_INTERVALO') or 1)  # Modo 'banco': segundos entre consultas
+    ESTOQUE_EVENTOS_FOLGA = float(os.environ.get('ESTOQUE_EVENTOS_FOLGA') or 5)          # Modo 'banco': segundos relidos a cada consulta
+
+    # GET condicional (ETag/Last-Modified) da listagem de produtos (ver app/condicional.py)
+    VALIDADORES_FOLGA = float(os.environ.get('VALIDADORES_FOLGA') or 5)  # Segundos após uma alteração sem ETag (commits fora de ordem)
+
+    # Estoque por local (ver app/services/locais.py)
+    ESTOQUE_LOCAL_PADRAO = os.environ.get('ESTOQUE_LOCAL_PADRAO') or 'principal'  # Código do local usado quando nenhum é informado
+
+    # Arquivamento das movimentações antigas (ver app/services/arquivo.py)
+    ARQUIVO_RETENCAO_DIAS = int(os.environ.get('ARQUIVO_RETENCAO_DIAS') or 400)  # Dias que ficam na tabela (a previsão lê 365)